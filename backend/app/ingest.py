@@ -0,0 +1,350 @@
+"""
+INGEST - Nạp hàng loạt một thư mục tài liệu vào vector store
+    python -m app.ingest <thư mục> [--workers 4] [--batch-size 64] [--max-tokens 200] [--overlap 30]
+- Định dạng: .txt/.md, .html/.htm, .jsonl (mỗi dòng {"text": ..., "id": ... (tùy chọn), metadata khác})
+- Pipeline: đọc + chunk (1 thread) -> hàng đợi giới hạn -> embedding (--workers threads)
+  -> hàng đợi giới hạn -> ghi store (thread chính); bộ nhớ không phụ thuộc kích thước thư mục
+- Dedup trước khi embed: chunk đã có trong store (cùng nội dung) hoặc đã gặp trong lần chạy bị bỏ qua;
+  chunk gần trùng (NEAR_DUP_DEDUP) được so với store và với các chunk đã đưa đi embed nhưng chưa ghi
+- Checkpoint (ingest_checkpoint.json trong storage): file đã nạp xong được bỏ qua khi chạy lại,
+  file đang nạp dở được nạp lại (các chunk đã ghi được dedup nên không embed lại)
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from .services.near_duplicate import NearDuplicateIndex, prefer_new, source_key
+from .services.text_chunker import chunk_text
+from .services.vector_store import SimpleVectorStore, atomic_write
+
+FILE_TYPES = {".txt": "text", ".md": "text", ".html": "html", ".htm": "html", ".jsonl": "jsonl"}
+CHECKPOINT_FILE = "ingest_checkpoint.json"
+_DONE = object()
+
+_BLOCK_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "blockquote", "pre"]
+
+
+def html_to_text(html: str) -> Tuple[str, str]:
+    """(title, text) - mỗi khối (p, h*, li...) thành một đoạn văn để chunker giữ ranh giới"""
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    for element in soup(["script", "style", "nav", "footer", "aside", "header"]):
+        element.decompose()
+    main = soup.find("main") or soup.find("article") or soup.body or soup
+    blocks = [block.get_text(" ", strip=True) for block in main.find_all(_BLOCK_TAGS)]
+    text = "\n\n".join(block for block in blocks if block) or main.get_text("\n", strip=True)
+    return title, text
+
+
+def iter_files(root: str) -> List[str]:
+    """Các file hỗ trợ trong thư mục (đệ quy, thứ tự ổn định)"""
+    if os.path.isfile(root):
+        return [root]
+    paths = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in FILE_TYPES:
+                paths.append(os.path.join(directory, name))
+    return paths
+
+
+class Checkpoint:
+    """Các file đã nạp xong (theo đường dẫn + kích thước + mtime), ghi atomic sau mỗi file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f).get("files", {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Checkpoint hỏng, nạp lại từ đầu: {e}")
+
+    @staticmethod
+    def _signature(path: str) -> Dict:
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    def is_done(self, key: str, path: str) -> bool:
+        entry = self.files.get(key)
+        return entry is not None and {k: entry.get(k) for k in ("size", "mtime")} == self._signature(path)
+
+    def mark_done(self, key: str, path: str, chunks: int) -> None:
+        self.files[key] = {**self._signature(path), "chunks": chunks}
+        data = {"files": self.files}
+        atomic_write(self.path, lambda f: json.dump(data, f, ensure_ascii=False, indent=1), mode="w")
+
+
+class IngestPipeline:
+    """Đọc/chunk -> embedding song song -> ghi store, nối bằng các hàng đợi có giới hạn"""
+
+    def __init__(self, store: SimpleVectorStore, workers: int = 4, batch_size: int = 64,
+                 max_tokens: int = 200, overlap_tokens: int = 30, credibility_score: int = 80,
+                 checkpoint_path: str = None, progress_interval: float = 2.0):
+        self.store = store
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.credibility_score = credibility_score
+        self.checkpoint = Checkpoint(checkpoint_path or os.path.join(store.storage_path, CHECKPOINT_FILE))
+        self.progress_interval = progress_interval
+
+        self._embed_queue = queue.Queue(maxsize=self.workers * 2)
+        self._write_queue = queue.Queue(maxsize=self.workers * 2)
+        self._stop = threading.Event()
+        self._seen = set()
+        # Chunk đã đưa đi embed nhưng chưa ghi vào store: vị trí -> (text, metadata), xoá khi đã ghi
+        self._pending_index = NearDuplicateIndex(threshold=store.near_dup_threshold) \
+            if store.near_duplicates is not None else None
+        self._pending: Dict[int, Tuple[str, Dict]] = {}
+        self._pending_positions: Dict[str, int] = {}
+        self._pending_count = 0
+        self.stats = {"files": 0, "files_skipped": 0, "chunks": 0, "duplicates": 0, "written": 0}
+
+    # ===== ĐỌC + CHUNK =====
+
+    def _base_metadata(self, root: str, path: str) -> Dict:
+        return {
+            "source": os.path.relpath(path, root) if os.path.isdir(root) else os.path.basename(path),
+            "document": os.path.splitext(os.path.basename(path))[0],
+            "source_type": "document",
+            "credibility_score": self.credibility_score
+        }
+
+    def _chunks(self, source, metadata: Dict, doc_id: str = None) -> Iterator[Tuple[Optional[str], str, Dict]]:
+        for chunk in chunk_text(source, max_tokens=self.max_tokens, overlap_tokens=self.overlap_tokens):
+            chunk_id = f"{doc_id}#{chunk.index}" if doc_id else None
+            yield chunk_id, chunk.text, {**metadata, **chunk.metadata()}
+
+    def iter_records(self, root: str, path: str) -> Iterator[Tuple[Optional[str], str, Dict]]:
+        """(id hoặc None, text, metadata) cho từng chunk của một file"""
+        kind = FILE_TYPES[os.path.splitext(path)[1].lower()]
+        metadata = self._base_metadata(root, path)
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            if kind == "text":
+                yield from self._chunks(f, metadata)
+            elif kind == "html":
+                title, text = html_to_text(f.read())
+                yield from self._chunks(text, {**metadata, "document": title or metadata["document"]})
+            else:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError as e:
+                        print(f"⚠️ {path}:{line_number}: JSON lỗi, bỏ qua ({e})")
+                        continue
+                    text = record.pop("text", None) or record.pop("content", None)
+                    if not text:
+                        continue
+                    doc_id = record.pop("id", None)
+                    extra = record.pop("metadata", None) or {}
+                    yield from self._chunks(text, {**metadata, **record, **extra, "line": line_number},
+                                            doc_id=str(doc_id) if doc_id is not None else None)
+
+    def _is_duplicate(self, doc_id: str, text: str, metadata: Dict, content_addressed: bool) -> bool:
+        """
+        ID theo nội dung: đã có là trùng; ID tường minh (jsonl): trùng khi không đổi gì
+        Gần trùng (với store hoặc chunk đang chờ ghi) mà bản kia đáng giữ hơn: bỏ trước khi tốn embedding
+        Chạy trên thread đọc trong khi thread chính đang ghi: giữ lock của store cho cả chuỗi kiểm tra
+        """
+        with self.store.lock:
+            if self.store.contains(doc_id):
+                return content_addressed or self.store.is_unchanged(doc_id, text, metadata)
+            if self.store.is_near_duplicate(text, metadata):
+                return True
+            if self._pending_index is None:
+                return False
+            key = source_key(metadata)
+            found = self._pending_index.find(
+                text, lambda position: self._pending.get(position, ("", None))[0],
+                skip=(lambda position: source_key(self._pending.get(position, ("", None))[1]) == key)
+                if key is not None else None
+            )
+            if found and not prefer_new(text, metadata, *self._pending[found[0]]):
+                return True
+            position = self._pending_count
+            self._pending_count += 1
+            self._pending[position] = (text, metadata)
+            self._pending_positions[doc_id] = position
+            self._pending_index.add(position, text)
+            return False
+
+    def _written(self, ids: List[str]) -> None:
+        """Chunk đã nằm trong store: store tự phát hiện gần trùng, bỏ khỏi danh sách chờ"""
+        with self.store.lock:
+            for doc_id in ids:
+                self._pending.pop(self._pending_positions.pop(doc_id, None), None)
+
+    def _read(self, root: str, files: List[str]) -> None:
+        """Thread đọc: dedup rồi đẩy batch vào hàng đợi embedding; báo file xong cho thread ghi"""
+        try:
+            for path in files:
+                if self._stop.is_set():
+                    break
+                key = os.path.abspath(path)
+                if self.checkpoint.is_done(key, path):
+                    self.stats["files_skipped"] += 1
+                    continue
+
+                batches = chunks = 0
+                batch = []
+                for doc_id, text, metadata in self.iter_records(root, path):
+                    if self._stop.is_set():
+                        return
+                    chunks += 1
+                    content_addressed = doc_id is None
+                    if content_addressed:
+                        doc_id = self.store.content_id(text)
+                    if doc_id in self._seen or self._is_duplicate(doc_id, text, metadata, content_addressed):
+                        self.stats["duplicates"] += 1
+                        continue
+                    self._seen.add(doc_id)
+                    batch.append((doc_id, text, metadata))
+                    if len(batch) >= self.batch_size:
+                        self._embed_queue.put((key, batch))
+                        batches += 1
+                        batch = []
+                if batch:
+                    self._embed_queue.put((key, batch))
+                    batches += 1
+                self.stats["chunks"] += chunks
+                self._write_queue.put(("file_done", key, path, batches, chunks))
+        except Exception as e:
+            self._write_queue.put(("error", e))
+        finally:
+            for _ in range(self.workers):
+                self._embed_queue.put(_DONE)
+
+    # ===== EMBEDDING =====
+
+    def _embed(self) -> None:
+        while True:
+            item = self._embed_queue.get()
+            if item is _DONE:
+                self._write_queue.put(_DONE)
+                return
+            if self._stop.is_set():
+                continue  # vẫn rút hàng đợi để thread đọc không bị chặn
+            key, batch = item
+            try:
+                vectors = self.store.get_embeddings([text for _, text, _ in batch])
+                self._write_queue.put(("batch", key, batch, vectors))
+            except Exception as e:
+                self._write_queue.put(("error", e))
+
+    # ===== GHI STORE =====
+
+    def run(self, root: str) -> Dict:
+        files = iter_files(root)
+        print(f"📂 {len(files)} file trong {root}, {self.workers} worker embedding")
+        started = last_report = time.time()
+
+        reader = threading.Thread(target=self._read, args=(root, files), name="ingest-read", daemon=True)
+        embedders = [threading.Thread(target=self._embed, name=f"ingest-embed-{i}", daemon=True)
+                     for i in range(self.workers)]
+        reader.start()
+        for thread in embedders:
+            thread.start()
+
+        written_batches: Dict[str, int] = {}
+        finished_files: Dict[str, Tuple[str, int, int]] = {}  # key -> (path, số batch, số chunk)
+        error = None
+        active = self.workers
+        try:
+            while active:
+                item = self._write_queue.get()
+                if item is _DONE:
+                    active -= 1
+                    continue
+                if self._stop.is_set():
+                    continue
+                kind = item[0]
+                if kind == "error":
+                    error = item[1]
+                    self._stop.set()
+                    continue
+                if kind == "batch":
+                    _, key, batch, vectors = item
+                    ids, texts, metadatas = (list(column) for column in zip(*batch))
+                    self.store.add_documents(texts, metadatas, ids=ids, embeddings=vectors)
+                    self._written(ids)
+                    self.stats["written"] += len(batch)
+                    written_batches[key] = written_batches.get(key, 0) + 1
+                else:
+                    _, key, path, batches, chunks = item
+                    finished_files[key] = (path, batches, chunks)
+
+                # File xong khi thread đọc đã đọc hết và mọi batch của nó đã ghi
+                if key in finished_files and written_batches.get(key, 0) == finished_files[key][1]:
+                    path, _, chunks = finished_files.pop(key)
+                    self.checkpoint.mark_done(key, path, chunks)
+                    self.stats["files"] += 1
+
+                if time.time() - last_report >= self.progress_interval:
+                    last_report = time.time()
+                    self._report(len(files), started)
+        except KeyboardInterrupt:
+            self._stop.set()
+            print("\n⚠️ Đã dừng - chạy lại cùng lệnh để tiếp tục từ checkpoint")
+            raise
+
+        self._report(len(files), started)
+        if error is not None:
+            print(f"❌ Ingest dừng vì lỗi: {error} - chạy lại để tiếp tục từ checkpoint")
+            raise error
+        return self.stats
+
+    def _report(self, total_files: int, started: float) -> None:
+        elapsed = max(time.time() - started, 1e-9)
+        done = self.stats["files"] + self.stats["files_skipped"]
+        print(f"[{done}/{total_files} file] {self.stats['written']} chunks đã ghi, "
+              f"{self.stats['duplicates']} trùng bỏ qua, {self.stats['written'] / elapsed:.1f} chunks/s")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Nạp thư mục tài liệu (txt/html/jsonl) vào vector store")
+    parser.add_argument("path", help="thư mục hoặc file cần nạp")
+    parser.add_argument("--storage", default="./simple_vector_storage", help="thư mục vector store")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "4")),
+                        help="số thread embedding song song")
+    parser.add_argument("--batch-size", type=int, default=64, help="số chunk mỗi lời gọi embedding")
+    parser.add_argument("--max-tokens", type=int, default=200, help="token budget mỗi chunk")
+    parser.add_argument("--overlap", type=int, default=30, help="số token lặp lại giữa các chunk")
+    parser.add_argument("--credibility", type=int, default=80, help="credibility_score mặc định")
+    parser.add_argument("--restart", action="store_true", help="bỏ checkpoint, duyệt lại mọi file")
+    args = parser.parse_args(argv)
+
+    store = SimpleVectorStore(storage_path=args.storage)
+    checkpoint_path = os.path.join(store.storage_path, CHECKPOINT_FILE)
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    pipeline = IngestPipeline(store, workers=args.workers, batch_size=args.batch_size,
+                              max_tokens=args.max_tokens, overlap_tokens=args.overlap,
+                              credibility_score=args.credibility, checkpoint_path=checkpoint_path)
+    try:
+        stats = pipeline.run(args.path)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        store.maybe_compact()
+    print(f"✅ Xong: {stats['files']} file mới, {stats['files_skipped']} file đã nạp trước đó, "
+          f"{store.get_collection_count()} documents trong store")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,14 +5,47 @@ Tích hợp RAG (Retrieval-Augmented Generation) với Gemini AI
 """
 
 # Import các thư viện cần thiết
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from .services.enhanced_rag_service import EnhancedRAGService
 from .services.image_search_service import ImageSearchService
+from .services import http_client
+
+# ===== KHỞI TẠO AI SERVICE =====
+# Enhanced RAG service - kết hợp tìm kiếm tri thức và tạo văn bản
+rag_service = EnhancedRAGService()
+# Image search service - tìm kiếm ảnh trên Google
+image_search_service = ImageSearchService()
+
+# ===== LIFESPAN =====
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup: mở HTTP client dùng chung (connection pool) và khởi tạo knowledge base
+    (corpus không đổi thì bỏ qua ingestion: không gọi embedding, không ghi disk)
+    Shutdown: dừng thread pool của RAG service, đóng cache tìm ảnh và các HTTP client
+    """
+    print("🚀 Starting Enhanced HCM Chatbot API...")
+    http_client.open_async_client()
+    await rag_service.run_blocking(rag_service.update_knowledge_base)
+    print("✅ Enhanced Server ready!")
+    try:
+        yield
+    finally:
+        rag_service.shutdown()
+        image_search_service.close()
+        await http_client.aclose()
 
 # ===== KHỞI TẠO FASTAPI APPLICATION =====
-app = FastAPI(title="Enhanced HCM Thought Chatbot API", version="2.0.0")
+app = FastAPI(title="Enhanced HCM Thought Chatbot API", version="2.0.0", lifespan=lifespan)
 
 # ===== CẤU HÌNH CORS =====
 # Cho phép .NET API (localhost:9000) gọi Python API này
@@ -24,12 +57,6 @@ app.add_middleware(
     allow_headers=["*"],  # Cho phép tất cả headers
 )
 
-# ===== KHỞI TẠO AI SERVICE =====
-# Enhanced RAG service - kết hợp tìm kiếm tri thức và tạo văn bản
-rag_service = EnhancedRAGService()
-# Image search service - tìm kiếm ảnh trên Google
-image_search_service = ImageSearchService()
-
 # ===== DATA MODELS CHO API =====
 
 class QuestionRequest(BaseModel):
@@ -54,18 +81,6 @@ class ImageSearchResponse(BaseModel):
     query: str  # Từ khóa đã tìm
     total: int = 0  # Tổng số ảnh tìm được
 
-# ===== LIFECYCLE EVENTS =====
-
-@app.on_event("startup")
-async def startup_event():
-    """
-    Khởi tạo knowledge base khi server start
-    Tải và xử lý tất cả tài liệu về tư tưởng Hồ Chí Minh
-    """
-    print("🚀 Starting Enhanced HCM Chatbot API...")
-    rag_service.update_knowledge_base(force_update=True)
-    print("✅ Enhanced Server ready!")
-
 # ===== API ENDPOINTS =====
 
 @app.get("/")
@@ -77,6 +92,8 @@ async def root():
 async def health_check():
     """Health check endpoint - kiểm tra tình trạng AI service"""
     stats = rag_service.get_stats()
+    stats["image_search"] = image_search_service.get_stats()
+    stats["http"] = http_client.get_stats()
     return {"status": "healthy", "stats": stats}
 
 @app.post("/chat", response_model=EnhancedChatResponse)
@@ -87,6 +104,7 @@ async def enhanced_chat(request: QuestionRequest):
     Quy trình:
     1. Validate input
     2. Sử dụng RAG service để tìm kiếm tri thức và tạo câu trả lời
+       (chạy trên thread pool riêng, không chặn event loop và các request khác)
     3. Nếu RAG thất bại, fallback về Gemini trực tiếp
     4. Trả về response với sources và confidence score
     """
@@ -98,7 +116,7 @@ async def enhanced_chat(request: QuestionRequest):
         # ===== XỬ LÝ VỚI RAG SERVICE =====
         try:
             # Sử dụng Enhanced RAG để tạo response với nguồn tham khảo
-            result = rag_service.generate_response_with_sources(request.question)
+            result = await rag_service.agenerate_response_with_sources(request.question)
 
             return EnhancedChatResponse(
                 answer=result["answer"],  # Câu trả lời chi tiết
@@ -130,7 +148,7 @@ async def enhanced_chat(request: QuestionRequest):
             - Đoàn kết dân tộc
             """
 
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
 
             return EnhancedChatResponse(
                 answer=response.text,
@@ -143,6 +161,37 @@ async def enhanced_chat(request: QuestionRequest):
         print(f"Error in enhanced chat endpoint: {e}")
         raise HTTPException(status_code=500, detail="Lỗi server, vui lòng thử lại")
 
+@app.post("/chat/stream")
+async def enhanced_chat_stream(request: QuestionRequest):
+    """
+    STREAMING CHAT ENDPOINT - Server-Sent Events
+
+    Thứ tự sự kiện:
+    1. event: sources - nguồn tham khảo + confidence (ngay sau bước retrieval)
+    2. event: token - từng đoạn câu trả lời khi Gemini sinh ra
+    3. event: done - EnhancedChatResponse đầy đủ (giống /chat)
+    (event: error nếu có lỗi giữa chừng, vẫn kết thúc bằng done)
+    """
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Câu hỏi không được để trống")
+
+    async def event_stream():
+        async for event, data in rag_service.astream_response_with_sources(request.question):
+            if event == "done":
+                data = jsonable_encoder(EnhancedChatResponse(
+                    answer=data["answer"],
+                    sources=data["sources"],
+                    confidence=data["confidence"],
+                    last_updated=data.get("last_updated", "2024-01-01")
+                ))
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/search-image", response_model=ImageSearchResponse)
 async def search_image(request: ImageSearchRequest):
     """
@@ -150,8 +199,10 @@ async def search_image(request: ImageSearchRequest):
 
     Quy trình:
     1. Validate input (từ khóa tìm kiếm)
-    2. Gọi Google Custom Search API
+    2. Tra cache (query đã tối ưu + num_results); miss thì gọi async song song Google / Pexels
+       (hedging, circuit breaker; request trùng đang chạy được gộp làm một)
     3. Trả về danh sách ảnh với URL, title, thumbnail
+       (bật THUMBNAIL_CACHE_DIR: thumbnail được tải về và trỏ tới /thumbnails/{key}, link chết bị bỏ)
 
     Args:
         request: ImageSearchRequest với query và num_results
@@ -168,7 +219,7 @@ async def search_image(request: ImageSearchRequest):
         num_results = min(request.num_results, 10)
 
         # ===== TÌM KIẾM ẢNH =====
-        images = image_search_service.search_images(request.query, num_results)
+        images = await image_search_service.asearch_images(request.query, num_results)
 
         return ImageSearchResponse(
             images=images,
@@ -180,6 +231,24 @@ async def search_image(request: ImageSearchRequest):
         print(f"Error in image search endpoint: {e}")
         raise HTTPException(status_code=500, detail="Lỗi khi tìm kiếm ảnh, vui lòng thử lại")
 
+@app.get("/thumbnails/{key}")
+async def get_thumbnail(key: str, if_none_match: Optional[str] = Header(None)):
+    """
+    THUMBNAIL ENDPOINT - Thumbnail đã cache trên disk (bật bằng THUMBNAIL_CACHE_DIR)
+    key = sha256 nội dung ảnh nên nội dung không bao giờ đổi: cache vĩnh viễn ở trình duyệt, ETag = key
+    """
+    thumbnails = image_search_service.thumbnails
+    # Tra SQLite trong thread, không chặn event loop
+    found = await asyncio.to_thread(thumbnails.lookup, key) if thumbnails is not None else None
+    if found is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy thumbnail")
+
+    path, content_type = found
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{key}"'}
+    if if_none_match and f'"{key}"' in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=content_type, headers=headers)
+
 # ===== SERVER ENTRY POINT =====
 if __name__ == "__main__":
     """
@@ -0,0 +1,306 @@
+"""
+ANN INDEX - Index tìm kiếm vector cắm được vào SimpleVectorStore
+- ExactIndex: brute force (một phép nhân ma trận-vector), recall 100%
+- IVFIndex: inverted file - k-means chia không gian thành nlist cụm,
+  mỗi query chỉ chấm điểm các documents trong nprobe cụm gần nhất
+  (nprobe lớn hơn = recall cao hơn, chậm hơn)
+- recall_at_k(): so sánh với exact search để tune nlist/nprobe
+"""
+
+import os
+import threading
+from typing import BinaryIO, Dict, Optional, Tuple
+
+import numpy as np
+
+from .matrix import EmbeddingMatrix, normalize_rows, top_k
+
+
+class VectorIndex:
+    """Interface chung: store gọi add/update khi dữ liệu đổi, search khi tìm kiếm"""
+
+    name = "base"
+
+    def search(self, matrix: EmbeddingMatrix, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Trả về (chỉ số documents, cosine score) giảm dần theo score"""
+        raise NotImplementedError
+
+    def add(self, matrix: EmbeddingMatrix, start: int) -> None:
+        """Các dòng [start, len(matrix)) vừa được append"""
+
+    def update(self, matrix: EmbeddingMatrix, row: int) -> None:
+        """Dòng row vừa bị ghi đè"""
+
+    def remove(self, rows: np.ndarray) -> None:
+        """Các dòng rows vừa bị xóa (các dòng phía sau dồn lên)"""
+
+    def save(self, f: BinaryIO) -> bool:
+        """Lưu index vào file nhị phân đã mở (False nếu không có gì để lưu)"""
+        return False
+
+    def load(self, path: Optional[str], matrix: EmbeddingMatrix) -> None:
+        """Load index đã lưu (path có thể None), bổ sung các dòng mới hơn snapshot"""
+
+    def get_stats(self) -> Dict:
+        return {"type": self.name}
+
+
+def exact_search(matrix: EmbeddingMatrix, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    scores = matrix.scores(query)
+    indices = top_k(scores, k)
+    return indices, scores[indices]
+
+
+class ExactIndex(VectorIndex):
+    """Brute force trên toàn bộ ma trận"""
+
+    name = "exact"
+
+    def search(self, matrix, query, k):
+        return exact_search(matrix, query, k)
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted file index với spherical k-means
+    - Chưa đủ min_train_size documents: dùng exact search
+    - Insert tăng dần: document mới được gán vào cụm gần nhất, không cần train lại
+    - Train lại khi corpus lớn gấp retrain_factor lần so với lúc train
+    """
+
+    name = "ivf"
+
+    def __init__(self, nlist: int = None, nprobe: int = 8, min_train_size: int = 10000,
+                 kmeans_iters: int = 10, sample_per_list: int = 256, retrain_factor: float = 4.0,
+                 seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iters = kmeans_iters
+        self.sample_per_list = sample_per_list
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+
+        self.centroids = None
+        self.trained_size = 0
+        self._assign = np.zeros(0, dtype=np.int32)  # cụm của từng document
+        # CSR cho search, thay bằng một tuple mới (không sửa tại chỗ) để thread search luôn thấy bản nhất quán:
+        # (centroids, order, offsets, indexed) - cụm c = order[offsets[c]:offsets[c + 1]],
+        # indexed = số documents đã nằm trong CSR
+        self._lists = None
+        self._dirty = False   # có document bị gán lại cụm (upsert) -> build lại CSR
+        # Ghi (add/update/remove/load) và build lại CSR trong search dùng chung lock này
+        self._lock = threading.RLock()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # ===== TRAIN =====
+
+    def train(self, matrix: EmbeddingMatrix) -> None:
+        n = len(matrix)
+        nlist = min(self.nlist or max(1, int(4 * np.sqrt(n))), n)
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(n, nlist * self.sample_per_list)
+        sample_ids = np.sort(rng.choice(n, sample_size, replace=False)) if sample_size < n else np.arange(n)
+        data = matrix.take(sample_ids)
+
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            assign = self._nearest(data, centroids)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            non_empty = counts > 0
+            sums = np.add.reduceat(data[order], starts[non_empty], axis=0)
+            centroids[non_empty] = sums
+            # Cụm rỗng: khởi tạo lại bằng một điểm ngẫu nhiên
+            empty = np.flatnonzero(~non_empty)
+            if len(empty):
+                centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+            centroids = normalize_rows(centroids)
+
+        assign = self._nearest_rows(matrix, 0, n, centroids=centroids)
+        with self._lock:
+            self.centroids = centroids
+            self.trained_size = n
+            self._assign = assign
+            self._rebuild_lists()
+        print(f"IVF index: đã train {nlist} cụm trên {n} documents")
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        assign = np.empty(len(data), dtype=np.int32)
+        for i in range(0, len(data), chunk):
+            assign[i:i + chunk] = np.argmax(data[i:i + chunk] @ centroids.T, axis=1)
+        return assign
+
+    def _nearest_rows(self, matrix: EmbeddingMatrix, start: int, end: int, chunk: int = 65536,
+                      centroids: np.ndarray = None) -> np.ndarray:
+        centroids = self.centroids if centroids is None else centroids
+        assign = np.empty(end - start, dtype=np.int32)
+        for i in range(start, end, chunk):
+            rows = matrix.take(np.arange(i, min(end, i + chunk)))
+            assign[i - start:i - start + len(rows)] = np.argmax(rows @ centroids.T, axis=1)
+        return assign
+
+    def _rebuild_lists(self) -> None:
+        """Build CSR từ _assign rồi thay cả tuple một lần (gọi khi đang giữ _lock)"""
+        assign = self._assign
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        counts = np.bincount(assign, minlength=len(self.centroids))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._lists = (self.centroids, order, offsets, len(assign))
+        self._dirty = False
+
+    # ===== CẬP NHẬT TĂNG DẦN =====
+
+    def add(self, matrix, start):
+        n = len(matrix)
+        if not self.trained:
+            if n >= self.min_train_size:
+                self.train(matrix)
+            return
+        if n > self.trained_size * self.retrain_factor:
+            self.train(matrix)
+            return
+        assign = np.concatenate([self._assign[:start], self._nearest_rows(matrix, start, n)])
+        with self._lock:
+            self._assign = assign
+
+    def update(self, matrix, row):
+        if self.trained and row < len(self._assign):
+            cluster = self._nearest_rows(matrix, row, row + 1)[0]
+            with self._lock:
+                self._assign[row] = cluster
+                self._dirty = True
+
+    def remove(self, rows):
+        if self.trained:
+            with self._lock:
+                self._assign = np.delete(self._assign, rows[rows < len(self._assign)])
+                self._rebuild_lists()
+
+    def _snapshot(self):
+        """(centroids, order, offsets, indexed, assign) nhất quán cho một lần search"""
+        with self._lock:
+            # Documents mới chưa vào CSR được quét riêng; build lại khi phần này đủ lớn
+            indexed = self._lists[3]
+            pending = len(self._assign) - indexed
+            if self._dirty or pending > max(1000, 0.1 * indexed):
+                self._rebuild_lists()
+            return self._lists + (self._assign,)
+
+    # ===== SEARCH =====
+
+    def search(self, matrix, query, k):
+        if not self.trained:
+            return exact_search(matrix, query, k)
+
+        centroids, order, offsets, indexed, assign = self._snapshot()
+        query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        probes = top_k(centroids @ query, self.nprobe)
+
+        candidates = [order[offsets[c]:offsets[c + 1]] for c in probes]
+        if len(assign) > indexed:
+            recent = np.arange(indexed, len(assign))
+            candidates.append(recent[np.isin(assign[indexed:], probes)])
+        candidates = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int64)
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+
+        scores = matrix.take(candidates) @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    # ===== PERSISTENCE =====
+
+    def save(self, f):
+        if not self.trained:
+            return False
+        with self._lock:
+            centroids, assign, trained_size = self.centroids, self._assign.copy(), self.trained_size
+        np.savez(f, centroids=centroids, assign=assign, trained_size=np.array([trained_size]))
+        return True
+
+    def load(self, path, matrix):
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                centroids = data["centroids"]
+                trained_size = int(data["trained_size"][0])
+                assign = data["assign"][:len(matrix)]
+            # Documents từ WAL (sau snapshot) được gán cụm ngay khi load
+            assign = np.concatenate([assign, self._nearest_rows(matrix, len(assign), len(matrix),
+                                                                centroids=centroids)])
+            with self._lock:
+                self.centroids = centroids
+                self.trained_size = trained_size
+                self._assign = assign
+                self._rebuild_lists()
+        elif len(matrix) >= self.min_train_size:
+            self.train(matrix)
+
+    def get_stats(self):
+        return {
+            "type": self.name,
+            "trained": self.trained,
+            "nlist": len(self.centroids) if self.trained else self.nlist,
+            "nprobe": self.nprobe
+        }
+
+
+def create_index(kind: str = None) -> VectorIndex:
+    """Index theo cấu hình .env: VECTOR_INDEX=exact|ivf, IVF_NLIST, IVF_NPROBE, IVF_MIN_TRAIN_SIZE"""
+    kind = (kind or os.getenv("VECTOR_INDEX", "exact")).lower()
+    if kind == "exact":
+        return ExactIndex()
+    if kind == "ivf":
+        nlist = os.getenv("IVF_NLIST")
+        return IVFIndex(
+            nlist=int(nlist) if nlist else None,
+            nprobe=int(os.getenv("IVF_NPROBE", "8")),
+            min_train_size=int(os.getenv("IVF_MIN_TRAIN_SIZE", "10000"))
+        )
+    raise ValueError(f"VECTOR_INDEX không hợp lệ: {kind}")
+
+
+def recall_at_k(index: VectorIndex, matrix: EmbeddingMatrix, queries: np.ndarray, k: int = 10) -> float:
+    """Tỉ lệ top-k của exact search mà index tìm được (trung bình trên các queries)"""
+    hits = 0
+    for query in np.atleast_2d(queries):
+        expected, _ = exact_search(matrix, query, k)
+        found, _ = index.search(matrix, query, k)
+        hits += len(np.intersect1d(expected, found))
+    return hits / (k * len(np.atleast_2d(queries)))
+
+
+if __name__ == "__main__":
+    # Đo recall@k trên dữ liệu đã lưu: python -m app.services.ann_index [k] [số query]
+    import sys
+    import time
+    from .vector_store import SimpleVectorStore
+
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    store = SimpleVectorStore(index=ExactIndex())
+    matrix = store.embeddings
+    if len(matrix) == 0:
+        print("Store rỗng, không có gì để đo")
+        sys.exit(0)
+
+    # Query = documents có sẵn + nhiễu nhỏ
+    rng = np.random.default_rng(0)
+    sample = matrix.take(rng.choice(len(matrix), min(num_queries, len(matrix)), replace=False))
+    queries = sample + rng.normal(scale=0.05, size=sample.shape).astype(np.float32)
+
+    ivf = create_index("ivf")
+    ivf.train(matrix)
+    for nprobe in (1, 2, 4, 8, 16, 32):
+        ivf.nprobe = nprobe
+        start = time.time()
+        recall = recall_at_k(ivf, matrix, queries, k)
+        elapsed = (time.time() - start) / len(queries) * 1000
+        print(f"nprobe={nprobe:3d}  recall@{k}={recall:.3f}  ({elapsed:.2f} ms/query gồm cả exact)")
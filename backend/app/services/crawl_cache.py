@@ -0,0 +1,95 @@
+"""
+CRAWL CACHE - Cache kết quả crawl theo URL (SQLite)
+- Lưu validator của response (ETag, Last-Modified) + content_hash + nội dung đã extract
+- Lần crawl sau gửi If-None-Match / If-Modified-Since; 304 = dùng lại kết quả cũ, không parse
+- content_hash không đổi = không cần embed lại
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class CrawlCache:
+    """url -> (etag, last_modified, content_hash, kết quả extract), thread-safe"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, "
+            "result TEXT NOT NULL, fetched_at REAL NOT NULL, checked_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.unchanged = 0
+        self.changed = 0
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, content_hash, result, fetched_at, checked_at FROM pages WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, content_hash, result, fetched_at, checked_at = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": content_hash,
+            "result": json.loads(result),
+            "fetched_at": fetched_at,
+            "checked_at": checked_at
+        }
+
+    def conditional_headers(self, entry: Optional[Dict]) -> Dict[str, str]:
+        """Header cho conditional GET từ entry đã cache"""
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, result: Dict, etag: str = None, last_modified: str = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, result.get("content_hash"),
+                 json.dumps(result, ensure_ascii=False), now, now)
+            )
+            self._db.commit()
+
+    def touch(self, url: str, etag: str = None, last_modified: str = None) -> None:
+        """304: chỉ cập nhật thời điểm kiểm tra (và validator mới nếu server gửi)"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE pages SET checked_at = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (time.time(), etag, last_modified, url)
+            )
+            self._db.commit()
+
+    def record(self, outcome: str) -> None:
+        """Đếm kết quả crawl lại: not_modified (304), unchanged (hash giống), changed"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            pages = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return {"pages": pages, "not_modified": self.not_modified,
+                "unchanged": self.unchanged, "changed": self.changed}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
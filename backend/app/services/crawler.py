@@ -0,0 +1,180 @@
+"""
+CRAWLER - Fetch song song nhiều domain, lịch sự với từng domain
+- Mỗi domain một "làn" tuần tự, có token bucket riêng (mặc định 1 request / 2 giây)
+- Các domain chạy song song trên thread pool (max_workers = giới hạn concurrency toàn cục)
+  -> tổng thời gian ~ domain chậm nhất thay vì tổng mọi request
+- robots.txt được tải một lần mỗi domain và cache (TTL), tôn trọng Disallow và Crawl-delay
+- Connection pooling: mặc định dùng httpx.Client chung của app (http_client.py: keep-alive, HTTP/2)
+  requests.Session vẫn dùng được, được mount HTTPAdapter đủ lớn cho thread pool
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import http_client
+
+
+class TokenBucket:
+    """rate token mỗi giây, tối đa capacity token; acquire() chờ đến khi có token"""
+
+    def __init__(self, rate: float, capacity: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Lấy một token (có thể âm), trả về số giây cần chờ"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class RobotsCache:
+    """robots.txt theo domain; lỗi mạng / 404 = cho phép, 401/403 = chặn cả domain"""
+
+    def __init__(self, session, user_agent: str, ttl: float = 3600, timeout: float = 10):
+        self.session = session
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.timeout = timeout
+        self._parsers: Dict[str, tuple] = {}  # origin -> (hết hạn, parser)
+        self._lock = threading.Lock()
+
+    def _fetch(self, origin: str) -> RobotFileParser:
+        parser = RobotFileParser(origin + "/robots.txt")
+        try:
+            response = self.session.get(origin + "/robots.txt", timeout=self.timeout)
+        except (requests.RequestException, httpx.HTTPError) as e:
+            print(f"⚠️ Không tải được robots.txt của {origin}: {e}")
+            parser.allow_all = True
+            return parser
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+        return parser
+
+    def get(self, url: str) -> RobotFileParser:
+        parts = urlparse(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            cached = self._parsers.get(origin)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+        # Mỗi domain chỉ có một làn nên không tải trùng robots.txt cùng lúc
+        parser = self._fetch(origin)
+        with self._lock:
+            self._parsers[origin] = (time.monotonic() + self.ttl, parser)
+        return parser
+
+    def allowed(self, url: str) -> bool:
+        return self.get(url).can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, url: str) -> Optional[float]:
+        delay = self.get(url).crawl_delay(self.user_agent)
+        return float(delay) if delay is not None else None
+
+
+def configure_session(session: requests.Session, pool_size: int) -> requests.Session:
+    """HTTPAdapter với pool đủ cho số thread (mặc định của requests chỉ 10 connection mỗi host)"""
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class Crawler:
+    """
+    crawler.map(fetch, urls): gọi fetch(url) cho mọi url, trả về kết quả theo đúng thứ tự urls
+    (None nếu robots.txt chặn hoặc fetch raise)
+    """
+
+    def __init__(self, session=None, user_agent: str = None, max_workers: int = 8,
+                 domain_rate: float = 0.5, burst: float = 1.0, respect_robots: bool = True):
+        """session: httpx.Client (mặc định client chung của app) hoặc requests.Session"""
+        session = session or http_client.get_client()
+        if isinstance(session, requests.Session):
+            configure_session(session, max_workers)
+        self.session = session
+        self.user_agent = user_agent or self.session.headers.get("User-Agent", "*")
+        self.max_workers = max_workers
+        self.domain_rate = domain_rate
+        self.burst = burst
+        self.robots = RobotsCache(self.session, self.user_agent) if respect_robots else None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.stats = {"fetched": 0, "blocked_by_robots": 0, "errors": 0}
+
+    def _bucket(self, url: str) -> TokenBucket:
+        domain = urlparse(url).netloc.lower()
+        with self._lock:
+            bucket = self._buckets.get(domain)
+        if bucket is None:
+            rate = self.domain_rate
+            delay = self.robots.crawl_delay(url) if self.robots else None
+            if delay:
+                rate = min(rate, 1.0 / delay)
+            with self._lock:
+                bucket = self._buckets.setdefault(domain, TokenBucket(rate, self.burst))
+        return bucket
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _fetch_one(self, fetch: Callable[[str], Any], url: str) -> Any:
+        if self.robots is not None and not self.robots.allowed(url):
+            print(f"robots.txt không cho phép: {url}")
+            self._count("blocked_by_robots")
+            return None
+        self._bucket(url).acquire()
+        try:
+            result = fetch(url)
+            self._count("fetched")
+            return result
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+            self._count("errors")
+            return None
+
+    def _crawl_domain(self, fetch: Callable[[str], Any], items: List[tuple], results: List) -> None:
+        for position, url in items:
+            results[position] = self._fetch_one(fetch, url)
+
+    def map(self, fetch: Callable[[str], Any], urls: List[str]) -> List[Any]:
+        lanes: Dict[str, List[tuple]] = OrderedDict()
+        for position, url in enumerate(urls):
+            lanes.setdefault(urlparse(url).netloc.lower(), []).append((position, url))
+
+        results: List[Any] = [None] * len(urls)
+        workers = max(1, min(self.max_workers, len(lanes)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crawl") as executor:
+            futures = [executor.submit(self._crawl_domain, fetch, items, results) for items in lanes.values()]
+            for future in futures:
+                future.result()
+        return results
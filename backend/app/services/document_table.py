@@ -0,0 +1,172 @@
+"""
+DOCUMENT TABLE - Lưu documents + metadata dạng cột, gọn bộ nhớ
+- Mỗi text chỉ giữ một bản (không copy vào metadata)
+- Metadata theo cột: mỗi key (intern) là một array int32 mã giá trị, -1 = không có
+- Giá trị được intern qua một pool chung: 10k documents cùng "source_type": "official" chỉ giữ một chuỗi
+- MetadataView (__slots__) đọc thẳng từ cột, search không phải tạo dict cho từng kết quả
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterable, Iterator, List
+
+_MISSING = -1
+
+
+class MetadataView(Mapping):
+    """Metadata của một document, chỉ đọc, không copy (dict(view) nếu cần dict thật)"""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "DocumentTable", row: int):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key):
+        column = self._table._columns.get(key)
+        code = column[self._row] if column is not None else _MISSING
+        if code == _MISSING:
+            raise KeyError(key)
+        return self._table._values[code]
+
+    def __iter__(self) -> Iterator[str]:
+        row = self._row
+        return (key for key, column in self._table._columns.items() if column[row] != _MISSING)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _MetadataSequence(Sequence):
+    __slots__ = ("_table",)
+
+    def __init__(self, table: "DocumentTable"):
+        self._table = table
+
+    def __len__(self):
+        return len(self._table)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [MetadataView(self._table, i) for i in range(len(self._table))[row]]
+        if row < 0:
+            row += len(self._table)
+        if not 0 <= row < len(self._table):
+            raise IndexError(row)
+        return MetadataView(self._table, row)
+
+
+class DocumentTable:
+    """ids + texts + metadata theo cột; document được tham chiếu bằng số dòng (int)"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self._columns: Dict[str, array] = {}
+        self._values: List = []   # pool giá trị, mã = chỉ số
+        self._codes: Dict = {}    # (kiểu, giá trị) -> mã
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def metadatas(self) -> Sequence:
+        return _MetadataSequence(self)
+
+    def metadata(self, row: int) -> MetadataView:
+        return MetadataView(self, row)
+
+    # ===== GHI =====
+
+    def _encode(self, value) -> int:
+        if isinstance(value, str):
+            value = sys.intern(value)
+        try:
+            # Phân biệt 1 / 1.0 / True (bằng nhau khi làm key dict)
+            key = (type(value), value)
+            code = self._codes.get(key)
+        except TypeError:  # giá trị không hash được (list, dict): không intern
+            key = code = None
+        if code is None:
+            code = len(self._values)
+            self._values.append(value)
+            if key is not None:
+                self._codes[key] = code
+        return code
+
+    def _column(self, key: str) -> array:
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[sys.intern(key)] = array("i", [_MISSING]) * len(self.texts)
+        return column
+
+    def append(self, doc_id: str, text: str, metadata: Dict) -> int:
+        row = len(self.texts)
+        self.ids.append(doc_id)
+        self.texts.append(text)
+        for column in self._columns.values():
+            column.append(_MISSING)
+        for key, value in metadata.items():
+            self._column(key)[row] = self._encode(value)
+        return row
+
+    def set(self, row: int, doc_id: str, text: str, metadata: Dict) -> None:
+        self.ids[row] = doc_id
+        self.texts[row] = text
+        for key, column in self._columns.items():
+            if key not in metadata:
+                column[row] = _MISSING
+        for key, value in metadata.items():
+            self._column(key)[row] = self._encode(value)
+
+    def delete(self, rows: Iterable[int]) -> None:
+        """Xóa các dòng; các dòng phía sau dồn lên (số dòng thay đổi)"""
+        drop = set(rows)
+        keep = [row for row in range(len(self.texts)) if row not in drop]
+        self.ids = [self.ids[row] for row in keep]
+        self.texts = [self.texts[row] for row in keep]
+        self._columns = {key: array("i", (column[row] for row in keep)) for key, column in self._columns.items()}
+
+    # ===== SERIALIZE =====
+
+    def to_records(self) -> Dict:
+        """Dạng lưu disk: ids, documents, cột mã giá trị + pool giá trị (bỏ giá trị không còn dùng)"""
+        used = sorted({code for column in self._columns.values() for code in column if code != _MISSING})
+        remap = {code: i for i, code in enumerate(used)}
+        remap[_MISSING] = _MISSING
+        return {
+            "ids": self.ids,
+            "documents": self.texts,
+            "columns": {key: [remap[code] for code in column] for key, column in self._columns.items()},
+            "values": [self._values[code] for code in used]
+        }
+
+    @classmethod
+    def from_records(cls, records: Dict) -> "DocumentTable":
+        table = cls()
+        texts = records.get("documents", [])
+        ids = records.get("ids") or [f"doc_{i}" for i in range(len(texts))]
+
+        if "columns" not in records:
+            # Định dạng cũ: list dict metadata, mỗi dict có thể chứa bản sao "text"
+            metadatas = records.get("metadatas") or [{} for _ in texts]
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                table.append(doc_id, text, {k: v for k, v in metadata.items() if k != "text"})
+            return table
+
+        table.ids = ids
+        table.texts = texts
+        table._values = records["values"]
+        for code, value in enumerate(table._values):
+            if isinstance(value, str):
+                value = table._values[code] = sys.intern(value)
+            try:
+                table._codes.setdefault((type(value), value), code)
+            except TypeError:
+                pass
+        table._columns = {sys.intern(key): array("i", codes) for key, codes in records["columns"].items()}
+        return table
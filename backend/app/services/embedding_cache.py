@@ -0,0 +1,114 @@
+"""
+EMBEDDING CACHE - Cache embedding theo nội dung (content-addressed)
+- Key = sha256(model name, task_type, text đã chuẩn hóa)
+- Tầng 1: LRU trong RAM (OrderedDict)
+- Tầng 2: SQLite trên disk, sống qua các lần restart
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa Unicode (NFC) và khoảng trắng để text giống nhau cho cùng key"""
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+
+def cache_key(model_name: str, task_type: str, text: str) -> str:
+    payload = "\x1f".join((model_name, task_type, normalize_text(text)))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Cache embedding hai tầng: LRU trong RAM + SQLite trên disk (tùy chọn)"""
+
+    def __init__(self, path: Optional[str] = None, max_memory_items: int = 10000):
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Tra cứu nhiều key: RAM trước, phần còn thiếu tra SQLite trong một query"""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                else:
+                    missing.append(key)
+
+            if missing and self._db is not None:
+                # SQLite giới hạn số tham số mỗi câu lệnh
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+
+            self.hits += len(found)
+            self.misses += len(set(missing) - found.keys())
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """Lưu embedding vào cả RAM và disk"""
+        if not items:
+            return
+        with self._lock:
+            rows = []
+            for key, vector in items.items():
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes()))
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self._db.commit()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "memory_items": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
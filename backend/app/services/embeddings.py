@@ -0,0 +1,184 @@
+"""
+EMBEDDING SERVICE - Tạo embedding theo batch
+- GeminiEmbedder: một request embed_content cho cả batch texts
+- BatchEmbedder: chia batch, chạy song song với pool giới hạn, retry exponential backoff khi hết quota
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence
+
+import numpy as np
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from .embedding_cache import EmbeddingCache, cache_key
+
+# Lỗi tạm thời (quota, quá tải) - nên retry thay vì bỏ cuộc
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+
+
+class EmbeddingError(Exception):
+    """Không tạo được embedding sau khi đã retry"""
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Lỗi quota/quá tải: retry được"""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+
+class GeminiEmbedder:
+    """Gọi Gemini embedding model, nhận cả list texts trong một request"""
+
+    max_batch_size = 100  # Giới hạn của batch_embed_contents
+
+    def __init__(self, model_name: str = "models/embedding-001"):
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY không tìm thấy")
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        print("Gemini API đã sẵn sàng!")
+
+    def __call__(self, texts: Sequence[str], task_type: str) -> List[List[float]]:
+        result = genai.embed_content(
+            model=self.model_name,
+            content=list(texts),
+            task_type=task_type
+        )
+        return result['embedding']
+
+
+class BatchEmbedder:
+    """
+    Bọc một hàm embed(texts, task_type) -> vectors:
+    - Chia texts thành các batch <= batch_size
+    - Chạy các batch song song trên ThreadPoolExecutor giới hạn max_workers
+    - Retry exponential backoff (có jitter) khi gặp lỗi quota/quá tải
+    - Tra EmbeddingCache trước (nếu có), chỉ gọi API cho texts chưa từng embed
+    """
+
+    def __init__(self, embed_fn: Callable[[Sequence[str], str], List[List[float]]],
+                 batch_size: int = None, max_workers: int = 4, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 30.0,
+                 sleep: Callable[[float], None] = time.sleep, cache: EmbeddingCache = None):
+        self.embed_fn = embed_fn
+        self.cache = cache
+        self.model_name = getattr(embed_fn, "model_name", type(embed_fn).__name__)
+        self.batch_size = batch_size or 100
+        limit = getattr(embed_fn, "max_batch_size", None)
+        if limit:
+            self.batch_size = min(self.batch_size, limit)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def embed(self, texts: Sequence[str], task_type: str = "retrieval_document") -> np.ndarray:
+        """Embedding cho toàn bộ texts, giữ nguyên thứ tự, trả về ma trận float32 (n, dim)"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self.cache is None:
+            return self._embed_uncached(texts, task_type)
+
+        keys = [cache_key(self.model_name, task_type, text) for text in texts]
+        found = self.cache.get_many(dict.fromkeys(keys))
+
+        # Chỉ embed các key còn thiếu (text trùng nhau trong cùng lời gọi chỉ embed một lần)
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+        if pending:
+            vectors = self._embed_uncached(list(pending.values()), task_type)
+            computed = dict(zip(pending.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        return np.stack([found[key] for key in keys])
+
+    def _embed_uncached(self, texts: List[str], task_type: str) -> np.ndarray:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.max_workers <= 1:
+            results = [self._embed_with_retry(batch, task_type) for batch in batches]
+        else:
+            results = list(self._get_executor().map(lambda batch: self._embed_with_retry(batch, task_type), batches))
+
+        return np.concatenate(results)
+
+    def _embed_with_retry(self, batch: List[str], task_type: str) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = np.asarray(self.embed_fn(batch, task_type), dtype=np.float32)
+                if vectors.ndim != 2 or vectors.shape[0] != len(batch):
+                    raise EmbeddingError(f"Embedder trả về shape {vectors.shape} cho batch {len(batch)} texts")
+                return vectors
+            except EmbeddingError:
+                raise
+            except Exception as e:
+                if not is_retryable_error(e):
+                    raise EmbeddingError(f"Lỗi tạo embedding: {e}") from e
+                if attempt == self.max_retries:
+                    raise EmbeddingError(f"Hết quota sau {self.max_retries} lần retry: {e}") from e
+
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                delay *= random.uniform(0.5, 1.0)
+                print(f"⚠️ Embedding bị giới hạn ({e}), thử lại sau {delay:.1f}s")
+                self._sleep(delay)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed")
+            return self._executor
+
+    def close(self):
+        """Giải phóng thread pool và cache"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        if self.cache is not None:
+            self.cache.close()
+
+
+def create_default_embedder(cache_path: str = None) -> BatchEmbedder:
+    """
+    Gemini embedder với cấu hình từ .env
+    (EMBED_BATCH_SIZE, EMBED_MAX_WORKERS, EMBED_CACHE_SIZE; EMBED_CACHE=0 để tắt cache)
+    """
+    # Embedder trước: thiếu GEMINI_API_KEY thì lỗi ngay, chưa tạo file cache nào
+    embedder = GeminiEmbedder()
+
+    cache = None
+    if os.getenv("EMBED_CACHE", "1") != "0":
+        cache = EmbeddingCache(path=cache_path, max_memory_items=int(os.getenv("EMBED_CACHE_SIZE", "10000")))
+
+    try:
+        return BatchEmbedder(
+            embedder,
+            batch_size=int(os.getenv("EMBED_BATCH_SIZE", "100")),
+            max_workers=int(os.getenv("EMBED_MAX_WORKERS", "4")),
+            cache=cache
+        )
+    except Exception:
+        if cache is not None:
+            cache.close()
+        raise
@@ -1,27 +1,48 @@
+import asyncio
 import google.generativeai as genai
-from .vector_store import SimpleVectorStore
+from concurrent.futures import ThreadPoolExecutor
+from .vector_store import SimpleVectorStore, atomic_write
+from .response_cache import ResponseCache
 from .web_data_collector import WebDataCollector
+from .text_chunker import Chunk, chunk_text
 import os
 from dotenv import load_dotenv
 import json
+import hashlib
 from datetime import datetime
-from typing import List
+from typing import Dict, Iterable, List, Union
 
 load_dotenv()
 
 class EnhancedRAGService:
-    def __init__(self):
-        self.vector_store = SimpleVectorStore()
-        self.data_collector = WebDataCollector()
+    CORPUS_MANIFEST_FILE = "corpus_manifest.json"
+    CRAWL_CACHE_FILE = "crawl_cache.sqlite3"
+
+    def __init__(self, vector_store: SimpleVectorStore = None):
+        self.vector_store = vector_store or SimpleVectorStore()
+        self.data_collector = WebDataCollector(
+            cache_path=os.path.join(self.vector_store.storage_path, self.CRAWL_CACHE_FILE)
+        )
         
         genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
         self.model = genai.GenerativeModel('gemini-2.5-flash')
         
         self.last_update = None
+        
+        # Cache câu trả lời (exact + semantic), invalidate theo knowledge_version()
+        self.response_cache = ResponseCache(
+            max_size=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+            similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.97"))
+        )
+        
+        # Thread pool riêng cho các lời gọi Gemini blocking, giới hạn số request đồng thời
+        self.max_workers = int(os.getenv("RAG_MAX_WORKERS", "8"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rag")
         print("Enhanced RAG Service v2.1 với improved citations sẵn sàng!")
     
-    def add_comprehensive_hcm_corpus(self):
-        """Thêm corpus tư tưởng HCM toàn diện với citations chi tiết"""
+    def get_comprehensive_hcm_corpus(self):
+        """Corpus tư tưởng HCM toàn diện với citations chi tiết: (docs, metadatas, ids ổn định)"""
         comprehensive_docs = [
             "Tất cả mọi người đều sinh ra có quyền bình đẳng. Tạo hóa cho họ những quyền không ai có thể xâm phạm được, trong những quyền ấy có quyền được sống, quyền tự do và quyền mưu cầu hạnh phúc. Độc lập là quyền thiêng liêng bất khả xâm phạm của mọi dân tộc trên thế giới.",
             
@@ -51,73 +72,199 @@ class EnhancedRAGService:
             {"source": "Toàn tập Hồ Chí Minh, tập 15, tr.234-237", "document": "Về dân chủ tập trung (1965)", "topic": "dân chủ", "page": "tr.234-237", "credibility_score": 100, "source_type": "official"}
         ]
         
-        self.vector_store.add_documents(comprehensive_docs, comprehensive_metadata)
-        print(f"✅ Đã thêm {len(comprehensive_docs)} documents với citations chi tiết")
+        # ID theo nguồn trích dẫn: sửa nội dung một đoạn sẽ ghi đè đúng document đó thay vì thêm bản trùng
+        comprehensive_ids = [
+            "hcm_" + hashlib.sha1(f"{m['source']}|{m['document']}".encode("utf-8")).hexdigest()[:16]
+            for m in comprehensive_metadata
+        ]
+        
+        return comprehensive_docs, comprehensive_metadata, comprehensive_ids
+    
+    def add_comprehensive_hcm_corpus(self):
+        """
+        Upsert corpus vào vector store (documents không đổi sẽ được bỏ qua)
+        Corpus là bản chuẩn: không bị loại vì gần trùng, mà thay thế bản gần trùng đã có
+        (store migrate từ data.json cũ có sẵn cùng đoạn văn dưới ID doc_N)
+        """
+        docs, metadatas, ids = self.get_comprehensive_hcm_corpus()
+        self.vector_store.add_documents(docs, metadatas, ids=ids, canonical=True)
+        print(f"✅ Đã đồng bộ {len(docs)} documents với citations chi tiết")
+    
+    def corpus_version(self) -> str:
+        """Hash của toàn bộ corpus (nội dung + metadata + ids)"""
+        docs, metadatas, ids = self.get_comprehensive_hcm_corpus()
+        payload = json.dumps([docs, metadatas, ids], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _corpus_manifest_path(self) -> str:
+        return os.path.join(self.vector_store.storage_path, self.CORPUS_MANIFEST_FILE)
+    
+    def _read_corpus_manifest(self):
+        try:
+            with open(self._corpus_manifest_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
     
     def update_knowledge_base(self, force_update=False):
-        """Cập nhật knowledge base"""
+        """
+        Cập nhật knowledge base (idempotent)
+        - Corpus không đổi so với manifest và store đã có đủ documents: không embed, không ghi disk
+        - force_update: vẫn upsert, nhưng documents không đổi vẫn được bỏ qua
+        """
+        version = self.corpus_version()
+        manifest = self._read_corpus_manifest()
+        _, _, ids = self.get_comprehensive_hcm_corpus()
+        
+        up_to_date = manifest is not None and manifest.get("version") == version \
+            and all(self.vector_store.contains(doc_id) for doc_id in ids)
+        if up_to_date and not force_update:
+            self.last_update = datetime.fromisoformat(manifest["updated_at"])
+            print(f"✅ Knowledge base đã cập nhật (corpus {version[:12]}), bỏ qua ingestion")
+            return
+        
         self.add_comprehensive_hcm_corpus()
-        self.last_update = datetime.now()
+        
+        if up_to_date:
+            self.last_update = datetime.fromisoformat(manifest["updated_at"])
+        else:
+            self.last_update = datetime.now()
+            new_manifest = {
+                "version": version,
+                "documents": len(ids),
+                "updated_at": self.last_update.isoformat()
+            }
+            atomic_write(self._corpus_manifest_path(),
+                         lambda f: json.dump(new_manifest, f, ensure_ascii=False, indent=2), mode="w")
         print("✅ Knowledge base updated với improved citations")
     
     def split_text(self, text: str, max_length: int = 500) -> List[str]:
-        sentences = text.split('. ')
-        chunks = []
-        current_chunk = ""
+        """Chia text thành chunks <= max_length ký tự theo ranh giới đoạn/câu (xem text_chunker)"""
+        # Budget theo ký tự, +2 mỗi câu cho dấu cách / dòng trống khi nối
+        chunks = chunk_text(text, max_tokens=max_length + 2, overlap_tokens=0, count_tokens=lambda s: len(s) + 2)
+        return [chunk.text for chunk in chunks]
+    
+    def ingest_text(self, source: Union[str, Iterable[str]], metadata: Dict, max_tokens: int = 200,
+                    overlap_tokens: int = 30, batch_size: int = 100) -> int:
+        """
+        Chunk một văn bản dài (string hoặc file object đọc theo dòng) rồi upsert theo batch
+        - Metadata mỗi chunk = metadata nguồn + chunk_index, char_start, char_end
+        - ID theo nội dung chunk: ingest lại cùng văn bản không tạo bản trùng
+        """
+        total = 0
+        batch = []
+        for chunk in chunk_text(source, max_tokens=max_tokens, overlap_tokens=overlap_tokens):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                total += self._upsert_chunks(batch, metadata)
+                batch = []
+        if batch:
+            total += self._upsert_chunks(batch, metadata)
+        return total
+    
+    def _upsert_chunks(self, chunks: List[Chunk], metadata: Dict) -> int:
+        self.vector_store.add_documents(
+            [chunk.text for chunk in chunks],
+            [{**metadata, **chunk.metadata()} for chunk in chunks],
+            ids=[self.vector_store.content_id(chunk.text) for chunk in chunks]
+        )
+        return len(chunks)
+    
+    def sync_web_sources(self, urls: List[str] = None) -> Dict:
+        """
+        Đồng bộ tăng dần nội dung web vào knowledge base
+        - Trang trả 304 hoặc content_hash không đổi (và đã có trong store): bỏ qua, không chunk/embed
+        - Trang đổi: chunk lại và upsert với ID theo URL + vị trí chunk (ghi đè chunk cũ),
+          chunk cũ vượt quá số chunk mới bị xóa
+        """
+        stats = {"pages": 0, "unchanged": 0, "updated": 0, "chunks": 0, "deleted": 0}
+        for page in self.data_collector.collect_hcm_content([], urls):
+            stats["pages"] += 1
+            prefix = "web_" + hashlib.sha1(page["url"].encode("utf-8")).hexdigest()[:16]
+            if not page["changed"] and self.vector_store.contains(f"{prefix}#0"):
+                stats["unchanged"] += 1
+                continue
+            
+            metadata = {
+                "source": page["title"] or page["url"],
+                "document": page["title"],
+                "url": page["url"],
+                "source_type": page["source_type"],
+                "credibility_score": page["credibility_score"],
+                "content_hash": page["content_hash"]
+            }
+            chunks = list(chunk_text(page["content"]))
+            ids = [f"{prefix}#{chunk.index}" for chunk in chunks]
+            self.vector_store.add_documents(
+                [chunk.text for chunk in chunks],
+                [{**metadata, **chunk.metadata()} for chunk in chunks],
+                ids=ids
+            )
+            # Trang ngắn đi: xóa các chunk cũ ở vị trí không còn tồn tại
+            current = set(ids)
+            stale = [doc_id for doc_id in self.vector_store.ids
+                     if doc_id.startswith(prefix + "#") and doc_id not in current]
+            if stale:
+                self.vector_store.delete(stale)
+                stats["deleted"] += len(stale)
+            stats["updated"] += 1
+            stats["chunks"] += len(chunks)
+        
+        if stats["updated"]:
+            self.last_update = datetime.now()
+        print(f"✅ Đồng bộ web: {stats['updated']}/{stats['pages']} trang thay đổi, {stats['unchanged']} không đổi")
+        return stats
+    
+    NO_RESULT_ANSWER = "Xin lỗi, tôi không tìm thấy thông tin liên quan trong cơ sở tri thức về tư tưởng Hồ Chí Minh."
+    ERROR_ANSWER = "Xin lỗi, có lỗi xảy ra khi xử lý câu hỏi. Vui lòng thử lại sau."
+    
+    def knowledge_version(self) -> str:
+        """Đổi khi store hoặc corpus thay đổi - cache câu trả lời cũ sẽ bị bỏ"""
+        last_update = self.last_update.isoformat() if self.last_update else ""
+        return f"{self.vector_store.revision}:{last_update}"
+    
+    def _embed_query(self, question: str):
+        return self.vector_store.get_embedding(question, task_type="retrieval_query")
+    
+    def retrieve_context(self, question: str, query_embedding=None):
+        """Tìm tài liệu liên quan: (context cho prompt, sources, confidence), None nếu không có"""
+        search_results = self.vector_store.search(question, n_results=3, query_embedding=query_embedding)
+        
+        if not search_results['documents'][0]:
+            return None
         
-        for sentence in sentences:
-            if len(current_chunk + sentence) < max_length:
-                current_chunk += sentence + ". "
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + ". "
+        context_docs = search_results['documents'][0]
+        source_metadatas = search_results['metadatas'][0]
         
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        context = ""
+        sources_used = []
         
-        return chunks
+        for i, (doc, metadata) in enumerate(zip(context_docs[:3], source_metadatas[:3])):
+            source_detail = metadata.get('source', 'Unknown')
+            document_title = metadata.get('document', '')
+            page_info = metadata.get('page', '')
+            
+            full_citation = source_detail
+            if document_title and document_title not in source_detail:
+                full_citation += f" - {document_title}"
+            if page_info and page_info not in source_detail:
+                full_citation += f", {page_info}"
+            
+            context += f"[Nguồn {i+1} - {full_citation}]: {doc}\n"
+            
+            sources_used.append({
+                "source": full_citation,
+                "credibility": metadata.get('credibility_score', 100),
+                "type": metadata.get('source_type', 'official'),
+                "url": metadata.get('url', ''),
+                "document": document_title
+            })
+        
+        avg_credibility = sum(s['credibility'] for s in sources_used) / len(sources_used) if sources_used else 0
+        return context, sources_used, int(avg_credibility)
     
-    def generate_response_with_sources(self, question: str):
-        """Generate response với improved citations"""
-        try:
-            search_results = self.vector_store.search(question, n_results=3)
-            
-            if not search_results['documents'][0]:
-                return {
-                    "answer": "Xin lỗi, tôi không tìm thấy thông tin liên quan trong cơ sở tri thức về tư tưởng Hồ Chí Minh.",
-                    "sources": [],
-                    "confidence": 0
-                }
-            
-            context_docs = search_results['documents'][0]
-            source_metadatas = search_results['metadatas'][0]
-            
-            context = ""
-            sources_used = []
-            
-            for i, (doc, metadata) in enumerate(zip(context_docs[:3], source_metadatas[:3])):
-                source_detail = metadata.get('source', 'Unknown')
-                document_title = metadata.get('document', '')
-                page_info = metadata.get('page', '')
-                
-                full_citation = source_detail
-                if document_title and document_title not in source_detail:
-                    full_citation += f" - {document_title}"
-                if page_info and page_info not in source_detail:
-                    full_citation += f", {page_info}"
-                
-                context += f"[Nguồn {i+1} - {full_citation}]: {doc}\n"
-                
-                sources_used.append({
-                    "source": full_citation,
-                    "credibility": metadata.get('credibility_score', 100),
-                    "type": metadata.get('source_type', 'official'),
-                    "url": metadata.get('url', ''),
-                    "document": document_title
-                })
-            
-            prompt = f"""Bạn là chuyên gia về tư tưởng Hồ Chí Minh với kiến thức sâu về triết học. Hãy phân tích:
+    def build_prompt(self, question: str, context: str) -> str:
+        return f"""Bạn là chuyên gia về tư tưởng Hồ Chí Minh với kiến thức sâu về triết học. Hãy phân tích:
 
 TÀI LIỆU THAM KHẢO:
 {context}
@@ -133,30 +280,135 @@ YÊU CẦU:
 - Tối đa 4 đoạn văn
 
 TRẢ LỜI:"""
-
-            response = self.model.generate_content(prompt)
+    
+    def _last_updated(self) -> str:
+        return self.last_update.isoformat() if self.last_update else datetime.now().isoformat()
+    
+    def generate_response_with_sources(self, question: str):
+        """Generate response với improved citations (qua cache câu trả lời)"""
+        try:
+            version = self.knowledge_version()
+            cached, query_embedding = self.response_cache.get(question, version, embed_query=self._embed_query)
+            if cached is not None:
+                return cached
             
-            avg_credibility = sum(s['credibility'] for s in sources_used) / len(sources_used) if sources_used else 0
+            retrieved = self.retrieve_context(question, query_embedding=query_embedding)
+            if retrieved is None:
+                return {"answer": self.NO_RESULT_ANSWER, "sources": [], "confidence": 0}
             
-            return {
+            context, sources_used, confidence = retrieved
+            response = self.model.generate_content(self.build_prompt(question, context))
+            
+            result = {
                 "answer": response.text,
                 "sources": sources_used,
-                "confidence": int(avg_credibility),
-                "last_updated": self.last_update.isoformat() if self.last_update else datetime.now().isoformat()
+                "confidence": confidence,
+                "last_updated": self._last_updated()
             }
+            self.response_cache.set(question, version, result, query_embedding=query_embedding)
+            return result
             
         except Exception as e:
             print(f"Error: {e}")
-            return {
-                "answer": "Xin lỗi, có lỗi xảy ra khi xử lý câu hỏi. Vui lòng thử lại sau.",
-                "sources": [],
-                "confidence": 0
+            return {"answer": self.ERROR_ANSWER, "sources": [], "confidence": 0}
+    
+    def stream_response_with_sources(self, question: str):
+        """
+        Generator sự kiện cho streaming:
+        - ("sources", {sources, confidence, last_updated}) ngay sau bước retrieval
+        - ("token", {text}) cho mỗi đoạn Gemini sinh ra
+        - ("done", kết quả đầy đủ giống generate_response_with_sources)
+        """
+        answer_parts = []
+        sources_used, confidence = [], 0
+        try:
+            version = self.knowledge_version()
+            cached, query_embedding = self.response_cache.get(question, version, embed_query=self._embed_query)
+            if cached is not None:
+                yield "sources", {"sources": cached["sources"], "confidence": cached["confidence"],
+                                  "last_updated": cached.get("last_updated")}
+                yield "token", {"text": cached["answer"]}
+                yield "done", cached
+                return
+            
+            retrieved = self.retrieve_context(question, query_embedding=query_embedding)
+            if retrieved is None:
+                yield "sources", {"sources": [], "confidence": 0, "last_updated": self._last_updated()}
+                yield "token", {"text": self.NO_RESULT_ANSWER}
+                yield "done", {"answer": self.NO_RESULT_ANSWER, "sources": [], "confidence": 0}
+                return
+            
+            context, sources_used, confidence = retrieved
+            yield "sources", {"sources": sources_used, "confidence": confidence, "last_updated": self._last_updated()}
+            
+            for chunk in self.model.generate_content(self.build_prompt(question, context), stream=True):
+                text = chunk.text
+                if text:
+                    answer_parts.append(text)
+                    yield "token", {"text": text}
+            
+            result = {
+                "answer": "".join(answer_parts),
+                "sources": sources_used,
+                "confidence": confidence,
+                "last_updated": self._last_updated()
             }
+            self.response_cache.set(question, version, result, query_embedding=query_embedding)
+            yield "done", result
+        
+        except Exception as e:
+            print(f"Error: {e}")
+            yield "error", {"detail": self.ERROR_ANSWER}
+            yield "done", {"answer": "".join(answer_parts) or self.ERROR_ANSWER, "sources": sources_used, "confidence": 0}
+    
+    async def run_blocking(self, func, *args):
+        """Chạy hàm blocking trên thread pool của RAG, không chặn event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    async def agenerate_response_with_sources(self, question: str):
+        """Phiên bản async của generate_response_with_sources (cho FastAPI)"""
+        return await self.run_blocking(self.generate_response_with_sources, question)
+    
+    async def astream_response_with_sources(self, question: str):
+        """Phiên bản async của stream_response_with_sources: mỗi bước next() chạy trên thread pool"""
+        events = self.stream_response_with_sources(question)
+        finished = object()
+        step = None  # bước next() đang chạy trên thread pool
+        try:
+            while True:
+                step = self._executor.submit(next, events, finished)
+                event = await asyncio.wrap_future(step)
+                if event is finished:
+                    break
+                yield event
+        finally:
+            # Bị hủy khi thread vẫn đang trong next(events): hủy task không dừng được thread,
+            # close() lúc generator còn chạy sẽ raise "generator already executing" -> chờ bước đó xong
+            if step is not None and not step.done():
+                await asyncio.wait([asyncio.wrap_future(step)])
+            # Client ngắt kết nối giữa chừng: đóng generator để dừng stream Gemini
+            await self.run_blocking(events.close)
+    
+    def shutdown(self):
+        """Dừng thread pool, process pool parse (gọi khi app shutdown)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.data_collector.close()
     
     def get_stats(self):
+        embedding_cache = self.vector_store.embedder.cache
         return {
             "total_documents": self.vector_store.get_collection_count(),
+            "vector_index": self.vector_store.index.get_stats(),
+            "lexical_index": self.vector_store.lexical_index.get_stats() if self.vector_store.hybrid else None,
+            "near_duplicates": dict(self.vector_store.near_duplicates.get_stats(),
+                                    skipped=self.vector_store.near_duplicates_skipped)
+            if self.vector_store.near_duplicates else None,
             "last_update": self.last_update.isoformat() if self.last_update else None,
             "trusted_sources_count": len(self.data_collector.trusted_sources),
+            "embedding_cache": embedding_cache.get_stats() if embedding_cache else None,
+            "response_cache": self.response_cache.get_stats(),
+            "crawl_cache": self.data_collector.crawl_cache.get_stats() if self.data_collector.crawl_cache else None,
+            "max_concurrent_requests": self.max_workers,
             "status": "ready"
         }
@@ -0,0 +1,224 @@
+"""
+HTTP CLIENT - Connection pool dùng chung cho mọi lời gọi HTTP ra ngoài (Google, Pexels, crawler)
+- httpx: keep-alive, HTTP/2 khi đã cài h2 (httpx[http2]), không có thì tự dùng HTTP/1.1
+- Giới hạn tổng số connection (HTTP_MAX_CONNECTIONS) và số request đồng thời mỗi host (HTTP_MAX_PER_HOST)
+- Timeout mặc định: HTTP_TIMEOUT giây (connect: HTTP_CONNECT_TIMEOUT)
+- get_client(): Client đồng bộ cho thread (crawler), tạo lần đầu khi cần
+- open_async_client() / get_async_client(): AsyncClient gắn với event loop của app (mở trong lifespan)
+- aclose(): đóng cả hai khi app shutdown
+"""
+
+import asyncio
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx chỉ bật HTTP/2 khi có h2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+USER_AGENT = os.getenv("HTTP_USER_AGENT", "Mozilla/5.0 (Academic Research Bot)")
+
+
+def _http2_enabled() -> bool:
+    return HTTP2_AVAILABLE and os.getenv("HTTP2", "true").lower() not in ("0", "false", "no")
+
+
+def _settings() -> Dict:
+    return {
+        "timeout": httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "10")),
+                                 connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))),
+        "limits": httpx.Limits(max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+                               max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+                               keepalive_expiry=30.0),
+        "max_per_host": int(os.getenv("HTTP_MAX_PER_HOST", "10")),
+    }
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Body của response; trả slot của host khi response được đóng (đọc xong)"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+def _once(func):
+    done = []
+
+    def wrapper():
+        if not done:
+            done.append(True)
+            func()
+    return wrapper
+
+
+class HostLimitedTransport(httpx.BaseTransport):
+    """
+    Bọc transport của httpx: tối đa max_per_host request đồng thời mỗi host
+    (httpx.Limits chỉ giới hạn tổng cả pool); slot được giữ đến khi response đóng
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, max_per_host: int):
+        self._transport = transport
+        self.max_per_host = max_per_host
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            return self._slots.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        slot = self._slot(request.url.host)
+        slot.acquire()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            slot.release()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_ReleasingStream(response.stream, _once(slot.release)),
+                              extensions=response.extensions)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncHostLimitedTransport(httpx.AsyncBaseTransport):
+    """Bản async của HostLimitedTransport (asyncio.Semaphore, dùng trong một event loop)"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self._transport = transport
+        self.max_per_host = max_per_host
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        slot = self._slots.setdefault(request.url.host, asyncio.Semaphore(self.max_per_host))
+        await slot.acquire()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            slot.release()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_AsyncReleasingStream(response.stream, _once(slot.release)),
+                              extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def create_client(max_per_host: int = None, transport: httpx.BaseTransport = None) -> httpx.Client:
+    """Client đồng bộ mới với cấu hình chung (transport: thay transport mạng, vd httpx.MockTransport khi test)"""
+    settings = _settings()
+    transport = transport or httpx.HTTPTransport(http2=_http2_enabled(), limits=settings["limits"])
+    return httpx.Client(
+        transport=HostLimitedTransport(transport, max_per_host or settings["max_per_host"]),
+        timeout=settings["timeout"],
+        headers={"User-Agent": USER_AGENT},
+        follow_redirects=True
+    )
+
+
+def create_async_client(max_per_host: int = None,
+                        transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    """AsyncClient mới với cấu hình chung"""
+    settings = _settings()
+    transport = transport or httpx.AsyncHTTPTransport(http2=_http2_enabled(), limits=settings["limits"])
+    return httpx.AsyncClient(
+        transport=AsyncHostLimitedTransport(transport, max_per_host or settings["max_per_host"]),
+        timeout=settings["timeout"],
+        headers={"User-Agent": USER_AGENT},
+        follow_redirects=True
+    )
+
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    """Client đồng bộ dùng chung (thread-safe, nhiều thread dùng chung một pool)"""
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = create_client()
+        return _client
+
+
+def open_async_client() -> httpx.AsyncClient:
+    """Mở AsyncClient dùng chung cho event loop đang chạy (gọi khi app startup)"""
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if _async_client is None or _async_client.is_closed or _async_loop is not loop:
+            _async_client = create_async_client()
+            _async_loop = loop
+        return _async_client
+
+
+def get_async_client() -> Optional[httpx.AsyncClient]:
+    """
+    AsyncClient dùng chung nếu đã mở trong event loop hiện tại; None nếu chưa
+    (vd asyncio.run trong script / thread: người gọi tự tạo client tạm bằng create_async_client)
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    with _lock:
+        if _async_client is not None and not _async_client.is_closed and _async_loop is loop:
+            return _async_client
+    return None
+
+
+async def aclose() -> None:
+    """Đóng mọi client dùng chung (gọi khi app shutdown)"""
+    global _client, _async_client, _async_loop
+    with _lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = _async_loop = None
+    if async_client is not None:
+        await async_client.aclose()
+    if client is not None:
+        client.close()
+
+
+def get_stats() -> Dict:
+    return {
+        "http2": _http2_enabled(),
+        "sync_client_open": _client is not None and not _client.is_closed,
+        "async_client_open": _async_client is not None and not _async_client.is_closed
+    }
@@ -0,0 +1,272 @@
+"""
+IMAGE PROVIDERS - Gọi các API tìm ảnh song song (async), hedging + circuit breaker
+- Provider ưu tiên (Google) chạy trước; quá hedge_delay giây chưa xong thì chạy thêm provider kế tiếp
+  (hedge_delay = 0: gọi mọi provider cùng lúc)
+- Provider lỗi / không có ảnh: chạy ngay provider kế tiếp, không chờ
+- Kết quả tốt đầu tiên thắng, các request còn lại bị huỷ
+- Mỗi provider có thống kê latency / lỗi và circuit breaker: lỗi liên tiếp -> bỏ qua trong reset_timeout giây
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+
+class CircuitBreaker:
+    """
+    closed: cho qua; failure_threshold lỗi liên tiếp -> open: chặn trong reset_timeout giây
+    -> half_open: cho một request thử, thành công thì closed, lỗi thì open lại
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial = False
+
+    def release(self) -> None:
+        """Request thử bị huỷ giữa chừng: cho phép thử lại"""
+        with self._lock:
+            self._trial = False
+
+
+class ProviderStats:
+    """Số lần gọi, lỗi, huỷ, kết quả rỗng và latency (EWMA + p50/p95 trên window gần nhất)"""
+
+    def __init__(self, window: int = 200):
+        self.calls = 0
+        self.errors = 0
+        self.empty = 0
+        self.cancelled = 0
+        self.latency_ewma = None
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, error: bool = False, empty: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self.errors += error
+            self.empty += empty
+            self._latencies.append(latency)
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+
+    def record_cancel(self) -> None:
+        with self._lock:
+            self.cancelled += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            percentile = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3)
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "error_rate": round(self.errors / self.calls, 3) if self.calls else 0.0,
+                "empty": self.empty,
+                "cancelled": self.cancelled,
+                "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+                "latency_p50": percentile(0.5) if latencies else None,
+                "latency_p95": percentile(0.95) if latencies else None
+            }
+
+
+class ImageProvider:
+    """Một API tìm ảnh; lớp con cài đặt fetch()"""
+
+    name = "provider"
+
+    def __init__(self, breaker: CircuitBreaker = None):
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = ProviderStats()
+
+    async def fetch(self, client: httpx.AsyncClient, query: str, num_results: int) -> List[Dict]:
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict:
+        return {**self.stats.get_stats(), "circuit": self.breaker.state}
+
+
+class GoogleImageProvider(ImageProvider):
+    """Google Custom Search API (query được tối ưu trước khi gửi)"""
+
+    name = "google"
+    url = "https://www.googleapis.com/customsearch/v1"
+
+    def __init__(self, api_key: str, search_engine_id: str, optimize_query: Callable[[str], str] = None,
+                 breaker: CircuitBreaker = None):
+        super().__init__(breaker)
+        self.api_key = api_key
+        self.search_engine_id = search_engine_id
+        self.optimize_query = optimize_query or (lambda query: query)
+
+    async def fetch(self, client: httpx.AsyncClient, query: str, num_results: int) -> List[Dict]:
+        optimized_query = self.optimize_query(query)
+        print(f"🔍 Original query: {query}")
+        print(f"🔍 Optimized query: {optimized_query}")
+
+        params = {
+            "key": self.api_key,
+            "cx": self.search_engine_id,
+            "q": optimized_query,
+            "searchType": "image",
+            "num": min(num_results, 10),
+            "safe": "active",
+            "imgSize": "medium",
+            "fileType": "jpg,png",  # Chỉ lấy JPG và PNG
+        }
+        response = await client.get(self.url, params=params)
+        response.raise_for_status()
+        data = response.json()
+
+        return [{
+            "url": item.get("link"),
+            "title": item.get("title"),
+            "thumbnail": item.get("image", {}).get("thumbnailLink"),
+            "source": item.get("displayLink", "Google"),
+            "context": item.get("snippet", ""),
+        } for item in data.get("items", [])]
+
+
+class PexelsImageProvider(ImageProvider):
+    """Pexels API (miễn phí unlimited)"""
+
+    name = "pexels"
+    url = "https://api.pexels.com/v1/search"
+
+    def __init__(self, api_key: str, breaker: CircuitBreaker = None):
+        super().__init__(breaker)
+        self.api_key = api_key
+
+    async def fetch(self, client: httpx.AsyncClient, query: str, num_results: int) -> List[Dict]:
+        params = {
+            "query": query,
+            "per_page": min(num_results, 15),
+            "orientation": "landscape"
+        }
+        response = await client.get(self.url, headers={"Authorization": self.api_key}, params=params)
+        response.raise_for_status()
+        data = response.json()
+
+        return [{
+            "url": photo.get("src", {}).get("large"),
+            "title": photo.get("alt", "Photo from Pexels"),
+            "thumbnail": photo.get("src", {}).get("medium"),
+            "source": "Pexels.com",
+            "context": f"Photo by {photo.get('photographer', 'Unknown')}"
+        } for photo in data.get("photos", [])]
+
+
+class ProviderFanout:
+    """search(): kết quả tốt đầu tiên trong các provider (theo thứ tự ưu tiên), hedging sau hedge_delay giây"""
+
+    def __init__(self, providers: List[ImageProvider], hedge_delay: float = 1.5, timeout: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self._clock = clock
+
+    async def _call(self, provider: ImageProvider, client: httpx.AsyncClient, query: str,
+                    num_results: int) -> Optional[List[Dict]]:
+        """Không raise (trừ khi bị huỷ): lỗi / không có ảnh -> None"""
+        start = self._clock()
+        try:
+            images = await asyncio.wait_for(provider.fetch(client, query, num_results), self.timeout)
+        except asyncio.CancelledError:
+            provider.stats.record_cancel()
+            provider.breaker.release()
+            raise
+        except Exception as e:
+            provider.stats.record(self._clock() - start, error=True)
+            provider.breaker.record_failure()
+            print(f"❌ {provider.name} API error: {e!r}")
+            return None
+        provider.stats.record(self._clock() - start, empty=not images)
+        provider.breaker.record_success()
+        return images or None
+
+    async def search(self, client: httpx.AsyncClient, query: str,
+                     num_results: int) -> Optional[Tuple[str, List[Dict]]]:
+        """(tên provider, ảnh) hoặc None nếu mọi provider lỗi / rỗng / đang bị circuit breaker chặn"""
+        candidates = [provider for provider in self.providers if provider.breaker.allow()]
+        pending = {}
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            provider = candidates[launched]
+            launched += 1
+            pending[asyncio.ensure_future(self._call(provider, client, query, num_results))] = provider
+
+        try:
+            while launched < len(candidates) and (launched == 0 or self.hedge_delay <= 0):
+                launch()
+            while pending:
+                hedge = self.hedge_delay if launched < len(candidates) else None
+                done, _ = await asyncio.wait(pending, timeout=hedge, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Provider đang chạy chậm quá ngưỡng: hedge bằng provider kế tiếp
+                    launch()
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    images = task.result()
+                    if images:
+                        return provider.name, images
+                if launched < len(candidates):
+                    launch()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            # Provider được breaker cho qua nhưng chưa kịp gọi: trả lại lượt thử
+            for provider in candidates[launched:]:
+                provider.breaker.release()
+
+    def get_stats(self) -> Dict:
+        return {provider.name: provider.get_stats() for provider in self.providers}
@@ -0,0 +1,188 @@
+"""
+IMAGE SEARCH CACHE - Cache kết quả tìm ảnh theo (query đã tối ưu, num_results)
+- Tầng 1: TTLCache (LRU + TTL) trong RAM
+- Tầng 2 (tùy chọn): SQLite trên disk, sống qua các lần restart
+  (aget/aset: từ event loop thì SELECT/INSERT SQLite chạy qua asyncio.to_thread)
+- Request trùng key đang chạy được gộp (single-flight): chỉ một lời gọi API upstream mỗi key
+  (get_or_search cho thread, aget_or_search cho event loop)
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .cache import TTLCache
+
+
+class ImageSearchCache:
+    """key -> danh sách ảnh; get_or_search(key, search) gộp các lời gọi đồng thời cùng key"""
+
+    def __init__(self, path: Optional[str] = None, max_size: int = 1000, ttl: float = 86400,
+                 clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self._clock = clock
+        self._memory = TTLCache(max_size=max_size, ttl=ttl, clock=clock)
+        self._in_flight: Dict[str, Future] = {}
+        self._async_in_flight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS image_results (key TEXT PRIMARY KEY, images TEXT NOT NULL, "
+                "expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM image_results WHERE expires_at <= ?", (clock(),))
+            self._db.commit()
+
+    @staticmethod
+    def make_key(optimized_query: str, num_results: int) -> str:
+        return f"{num_results}:{optimized_query}"
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        images = self._memory.get(key)
+        if images is not None or self._db is None:
+            return images
+        return self._get_from_disk(key)
+
+    async def aget(self, key: str) -> Optional[List[Dict]]:
+        """Bản async của get: tầng RAM đọc trực tiếp, SELECT SQLite chạy ngoài event loop"""
+        images = self._memory.get(key)
+        if images is not None or self._db is None:
+            return images
+        return await asyncio.to_thread(self._get_from_disk, key)
+
+    def _get_from_disk(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT images, expires_at FROM image_results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= self._clock():
+            return None
+        images = json.loads(row[0])
+        self._memory.set(key, images, ttl=row[1] - self._clock())
+        with self._lock:
+            self.disk_hits += 1
+        return images
+
+    def set(self, key: str, images: List[Dict]) -> None:
+        self._memory.set(key, images)
+        if self._db is not None:
+            self._set_on_disk(key, images)
+
+    async def aset(self, key: str, images: List[Dict]) -> None:
+        """Bản async của set: ghi RAM ngay, INSERT + commit SQLite chạy ngoài event loop"""
+        self._memory.set(key, images)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_on_disk, key, images)
+
+    def _set_on_disk(self, key: str, images: List[Dict]) -> None:
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO image_results VALUES (?, ?, ?)",
+                (key, json.dumps(images, ensure_ascii=False), self._clock() + self.ttl)
+            )
+            self._db.commit()
+
+    def get_or_search(self, key: str, search: Callable[[], Optional[List[Dict]]]) -> Optional[List[Dict]]:
+        """
+        Cache hit: trả về ngay; miss: thread đầu tiên gọi search(), các thread cùng key chờ kết quả đó
+        search() trả về None = không cache (vd mọi API đều lỗi)
+        """
+        images = self.get(key)
+        if images is not None:
+            return images
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.result()
+
+        try:
+            # Thread dẫn trước có thể vừa ghi cache xong
+            images = self._memory.peek(key)
+            if images is None:
+                with self._lock:
+                    self.upstream_calls += 1
+                images = search()
+                if images is not None:
+                    self.set(key, images)
+            flight.set_result(images)
+            return images
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    async def aget_or_search(self, key: str,
+                             search: Callable[[], Awaitable[Optional[List[Dict]]]]) -> Optional[List[Dict]]:
+        """
+        Bản async của get_or_search: lời gọi upstream chạy trong một task riêng, mọi request cùng key await task đó
+        (request đầu bị huỷ, vd client ngắt kết nối, thì task vẫn chạy tiếp cho các request còn lại và ghi cache)
+        """
+        images = await self.aget(key)
+        if images is not None:
+            return images
+
+        task = self._async_in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._asearch(key, search))
+            self._async_in_flight[key] = task
+            task.add_done_callback(lambda _: self._async_in_flight.pop(key, None))
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _asearch(self, key: str, search: Callable[[], Awaitable[Optional[List[Dict]]]]):
+        # Trong lúc chờ đọc disk, task dẫn trước có thể vừa ghi cache xong
+        images = self._memory.peek(key)
+        if images is not None:
+            return images
+        with self._lock:
+            self.upstream_calls += 1
+        images = await search()
+        if images is not None:
+            await self.aset(key, images)
+        return images
+
+    def get_stats(self) -> Dict:
+        stats = self._memory.get_stats()
+        with self._lock:
+            stats.update({
+                "disk_hits": self.disk_hits,
+                "coalesced": self.coalesced,
+                "upstream_calls": self.upstream_calls,
+                "in_flight": len(self._in_flight) + len(self._async_in_flight)
+            })
+            if self._db is not None:
+                stats["disk_size"] = self._db.execute("SELECT COUNT(*) FROM image_results").fetchone()[0]
+        return stats
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
@@ -1,11 +1,19 @@
 """
 IMAGE SEARCH SERVICE - Multiple Image Search APIs
 Tìm kiếm ảnh thật trên Google Images, Pexels, hoặc Unsplash
+Kết quả được cache theo query đã tối ưu + num_results (tiết kiệm quota Google)
+Các API được gọi async song song (hedging), xem image_providers.py
+Dùng chung connection pool của app (http_client.py): keep-alive, HTTP/2, không bắt tay TLS lại mỗi lần tìm
 """
 
+import asyncio
 import os
-import requests
 from typing import List, Dict, Optional
+from . import http_client
+from .image_providers import GoogleImageProvider, ImageProvider, PexelsImageProvider, ProviderFanout
+from .image_search_cache import ImageSearchCache
+from .query_normalizer import normalize_query
+from .thumbnail_cache import ThumbnailCache
 
 class ImageSearchService:
     """
@@ -17,19 +25,46 @@ class ImageSearchService:
     Setup (tùy chọn):
     - Google: Thêm GOOGLE_CUSTOM_SEARCH_API_KEY và GOOGLE_SEARCH_ENGINE_ID vào .env
     - Pexels: Thêm PEXELS_API_KEY vào .env (free tại https://www.pexels.com/api/)
+    - Cache: IMAGE_CACHE_TTL (giây), IMAGE_CACHE_SIZE, IMAGE_CACHE_PATH (file SQLite, bật tầng disk)
+    - Hedging: IMAGE_HEDGE_DELAY (giây, 0 = gọi mọi API cùng lúc)
+    - Thumbnail proxy (tùy chọn): THUMBNAIL_CACHE_DIR (bật), THUMBNAIL_PUBLIC_URL, THUMBNAIL_CACHE_MAX_MB,
+      THUMBNAIL_WAIT (giây chờ tải thumbnail trước khi trả kết quả)
     """
 
-    def __init__(self):
+    def __init__(self, cache: ImageSearchCache = None, providers: List[ImageProvider] = None,
+                 thumbnails: ThumbnailCache = None):
         """Khởi tạo service với API credentials"""
         self.google_api_key = os.getenv("GOOGLE_CUSTOM_SEARCH_API_KEY")
         self.google_search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
         self.pexels_api_key = os.getenv("PEXELS_API_KEY")
-        self.google_url = "https://www.googleapis.com/customsearch/v1"
-        self.pexels_url = "https://api.pexels.com/v1/search"
 
-    def search_images(self, query: str, num_results: int = 5) -> List[Dict]:
+        # Thứ tự ưu tiên: Google (nếu có setup) rồi Pexels (nếu có setup)
+        if providers is None:
+            providers = []
+            if self.google_api_key and self.google_search_engine_id:
+                providers.append(GoogleImageProvider(self.google_api_key, self.google_search_engine_id,
+                                                     optimize_query=self._optimize_query))
+            if self.pexels_api_key:
+                providers.append(PexelsImageProvider(self.pexels_api_key))
+        self.fanout = ProviderFanout(providers, hedge_delay=float(os.getenv("IMAGE_HEDGE_DELAY", "1.5")))
+        self.cache = cache or ImageSearchCache(
+            path=os.getenv("IMAGE_CACHE_PATH") or None,
+            max_size=int(os.getenv("IMAGE_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("IMAGE_CACHE_TTL", "86400"))
+        )
+        # Thumbnail được tải về disk và phục vụ qua /thumbnails/{sha256} (chỉ khi có THUMBNAIL_CACHE_DIR)
+        if thumbnails is None and os.getenv("THUMBNAIL_CACHE_DIR"):
+            thumbnails = ThumbnailCache(
+                os.getenv("THUMBNAIL_CACHE_DIR"),
+                public_url=os.getenv("THUMBNAIL_PUBLIC_URL", "http://localhost:8000"),
+                max_bytes=int(float(os.getenv("THUMBNAIL_CACHE_MAX_MB", "200")) * 1024 * 1024)
+            )
+        self.thumbnails = thumbnails
+        self.thumbnail_wait = float(os.getenv("THUMBNAIL_WAIT", "1.0"))
+
+    async def asearch_images(self, query: str, num_results: int = 5) -> List[Dict]:
         """
-        Tìm kiếm ảnh - tự động chọn nguồn tốt nhất
+        Tìm kiếm ảnh - gọi song song các API đã cấu hình, lấy kết quả tốt đầu tiên
 
         Args:
             query: Từ khóa tìm kiếm (VD: "Hồ Chí Minh ở Pháp")
@@ -38,136 +73,61 @@ class ImageSearchService:
         Returns:
             List[Dict]: Danh sách ảnh với thông tin {url, title, thumbnail, source}
         """
-        # Thử Google Custom Search trước (nếu có setup)
-        if self.google_api_key and self.google_search_engine_id:
-            images = self._search_google(query, num_results)
-            if images:
-                return images
-
-        # Fallback: Pexels API (nếu có setup)
-        if self.pexels_api_key:
-            images = self._search_pexels(query, num_results)
-            if images:
-                return images
-
-        # Fallback cuối cùng: Wikipedia images
+        # Cache theo query đã tối ưu: các cách hỏi khác nhau cho cùng một ảnh dùng chung kết quả
+        key = self.cache.make_key(self._optimize_query(query), num_results)
+        images = await self.cache.aget_or_search(key, lambda: self._search_providers(query, num_results))
+        if images and self.thumbnails is not None:
+            # Cache kết quả giữ URL gốc; thumbnail local được gắn mỗi lần trả về (ảnh có thể đã bị xoá khỏi disk)
+            images = await self.thumbnails.rewrite(images, wait=self.thumbnail_wait)
+        return images or self._fallback(query)
+
+    def search_images(self, query: str, num_results: int = 5) -> List[Dict]:
+        """Bản đồng bộ của asearch_images (script, thread không có event loop)"""
+        key = self.cache.make_key(self._optimize_query(query), num_results)
+        images = self.cache.get_or_search(key, lambda: asyncio.run(self._search_providers(query, num_results)))
+        return images or self._fallback(query)
+
+    async def _search_providers(self, query: str, num_results: int) -> Optional[List[Dict]]:
+        """Kết quả tốt đầu tiên trong các API; None nếu không API nào trả về ảnh"""
+        if not self.fanout.providers:
+            return None
+        client = http_client.get_async_client()
+        if client is not None:
+            found = await self.fanout.search(client, query, num_results)
+        else:
+            # Ngoài event loop của app (search_images đồng bộ, script): client tạm cho lần gọi này
+            async with http_client.create_async_client() as client:
+                found = await self.fanout.search(client, query, num_results)
+        if found is None:
+            return None
+        provider, images = found
+        print(f"✅ {len(images)} ảnh từ {provider}")
+        return images
+
+    def _fallback(self, query: str) -> List[Dict]:
+        # Fallback cuối cùng: Wikipedia images (không cache, để lần sau thử lại API)
         print("⚠️ Không có API nào được cấu hình, sử dụng ảnh mặc định từ Wikipedia")
         return self._get_fallback_images(query)
 
+    def get_stats(self) -> Dict:
+        stats = {"cache": self.cache.get_stats(), "providers": self.fanout.get_stats()}
+        if self.thumbnails is not None:
+            stats["thumbnails"] = self.thumbnails.get_stats()
+        return stats
+
+    def close(self):
+        """Đóng cache trên disk (gọi khi app shutdown)"""
+        self.cache.close()
+        if self.thumbnails is not None:
+            self.thumbnails.close()
+
     def _optimize_query(self, query: str) -> str:
         """
-        Tối ưu query để tìm kiếm chính xác hơn
+        Tối ưu query để tìm kiếm chính xác hơn (xem query_normalizer.py)
         - Loại bỏ từ "cho tôi", "tìm", "xem"
         - Thêm từ khóa chính xác
         """
-        query_lower = query.lower()
-
-        # Chuẩn hóa tên TRƯỚC (để tránh bị replace sai)
-        query_lower = query_lower.replace("chủ tịch hồ chí minh", "Ho Chi Minh")
-        query_lower = query_lower.replace("hồ chí minh", "Ho Chi Minh")
-        query_lower = query_lower.replace("bác hồ", "Ho Chi Minh")
-        query_lower = query_lower.replace("chủ tịch", "president")
-
-        # Địa điểm & thời gian
-        query_lower = query_lower.replace("ở pháp", "in France")
-        query_lower = query_lower.replace("tại pháp", "in France")
-        query_lower = query_lower.replace("pháp", "France")
-        query_lower = query_lower.replace("hồi còn", "")
-        query_lower = query_lower.replace("hồi", "")
-        query_lower = query_lower.replace("ngài", "")
-        query_lower = query_lower.replace("còn", "")
-        query_lower = query_lower.replace("thời", "period")
-
-        # Loại bỏ các từ thừa
-        remove_words = ["cho tôi", "tìm", "xem", "ảnh", "hình", "hình ảnh", "của", "về", "đi", "nào", "giúp", "với"]
-        for word in remove_words:
-            query_lower = query_lower.replace(word, " ")
-
-        # Làm sạch và thêm từ khóa tăng độ chính xác
-        query_optimized = " ".join(query_lower.split())
-
-        # Thêm từ khóa để filter tốt hơn
-        if "Ho Chi Minh" in query_optimized:
-            query_optimized += " president Vietnam historical photo"
-
-        return query_optimized
-
-    def _search_google(self, query: str, num_results: int) -> List[Dict]:
-        """Tìm kiếm ảnh qua Google Custom Search API"""
-        try:
-            # Tối ưu query
-            optimized_query = self._optimize_query(query)
-            print(f"🔍 Original query: {query}")
-            print(f"🔍 Optimized query: {optimized_query}")
-
-            num_results = min(num_results, 10)
-
-            params = {
-                "key": self.google_api_key,
-                "cx": self.google_search_engine_id,
-                "q": optimized_query,
-                "searchType": "image",
-                "num": num_results,
-                "safe": "active",
-                "imgSize": "medium",
-                "fileType": "jpg,png",  # Chỉ lấy JPG và PNG
-            }
-
-            response = requests.get(self.google_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            images = []
-            if "items" in data:
-                for item in data["items"]:
-                    # Lấy tất cả ảnh (đã filter qua query optimization rồi)
-                    images.append({
-                        "url": item.get("link"),
-                        "title": item.get("title"),
-                        "thumbnail": item.get("image", {}).get("thumbnailLink"),
-                        "source": item.get("displayLink", "Google"),
-                        "context": item.get("snippet", ""),
-                    })
-
-            return images
-
-        except Exception as e:
-            print(f"❌ Google API error: {e}")
-            return []
-
-    def _search_pexels(self, query: str, num_results: int) -> List[Dict]:
-        """Tìm kiếm ảnh qua Pexels API (miễn phí unlimited)"""
-        try:
-            headers = {
-                "Authorization": self.pexels_api_key
-            }
-
-            params = {
-                "query": query,
-                "per_page": min(num_results, 15),
-                "orientation": "landscape"
-            }
-
-            response = requests.get(self.pexels_url, headers=headers, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            images = []
-            if "photos" in data:
-                for photo in data["photos"]:
-                    images.append({
-                        "url": photo.get("src", {}).get("large"),
-                        "title": photo.get("alt", "Photo from Pexels"),
-                        "thumbnail": photo.get("src", {}).get("medium"),
-                        "source": "Pexels.com",
-                        "context": f"Photo by {photo.get('photographer', 'Unknown')}"
-                    })
-
-            return images
-
-        except Exception as e:
-            print(f"❌ Pexels API error: {e}")
-            return []
+        return normalize_query(query)
 
     def _get_fallback_images(self, query: str) -> List[Dict]:
         """
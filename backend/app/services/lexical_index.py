@@ -0,0 +1,195 @@
+"""
+LEXICAL INDEX - Inverted index BM25 cho tiếng Việt
+- Token = âm tiết (chữ thường, NFC) + cặp âm tiết liền kề ("tư_tưởng", "độc_lập")
+  để bắt được từ ghép nhiều âm tiết
+- Query gõ không dấu ("doc lap") được mở rộng sang các term có dấu cùng dạng bỏ dấu
+- Chỉ đọc posting list của các term trong query, không quét toàn bộ corpus
+- reciprocal_rank_fusion(): trộn thứ hạng lexical với vector search
+"""
+
+import math
+import re
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from typing import BinaryIO, Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from .matrix import top_k
+
+_WORD = re.compile(r"\w+")
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'độc lập' -> 'doc lap'"""
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return stripped.replace("đ", "d").replace("Đ", "D")
+
+
+def tokenize(text: str) -> List[str]:
+    """Âm tiết + bigram âm tiết"""
+    syllables = _WORD.findall(unicodedata.normalize("NFC", text).lower())
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+class BM25Index:
+    """Inverted index: term -> (row ids, term frequencies), cập nhật tăng dần"""
+
+    name = "bm25"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._folded: Dict[str, Set[str]] = defaultdict(set)  # dạng bỏ dấu -> các term có dấu
+        self._doc_len = array("i")
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    # ===== CẬP NHẬT =====
+
+    def add(self, row: int, text: str) -> None:
+        if row != len(self._doc_len):
+            raise ValueError(f"BM25Index.add: row {row} không liên tục (đang có {len(self._doc_len)})")
+        terms = tokenize(text)
+        self._doc_len.append(len(terms))
+        self._total_len += len(terms)
+        for term, tf in Counter(terms).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("i"), array("i"))
+                folded = fold_diacritics(term)
+                if folded != term:
+                    self._folded[folded].add(term)
+            postings[0].append(row)
+            postings[1].append(tf)
+
+    def update(self, row: int, old_text: str, new_text: str) -> None:
+        """Ghi đè document (hiếm: upsert) - xóa posting cũ rồi thêm posting mới"""
+        for term in set(tokenize(old_text)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            rows, tfs = postings
+            for i in range(len(rows) - 1, -1, -1):
+                if rows[i] == row:
+                    del rows[i]
+                    del tfs[i]
+            if not rows:
+                # Term biến mất hẳn: bỏ cả khỏi bảng bỏ dấu, query không dấu không được trỏ tới nó nữa
+                del self._postings[term]
+                folded = fold_diacritics(term)
+                variants = self._folded.get(folded)
+                if variants is not None:
+                    variants.discard(term)
+                    if not variants:
+                        del self._folded[folded]
+
+        terms = tokenize(new_text)
+        self._total_len += len(terms) - self._doc_len[row]
+        self._doc_len[row] = len(terms)
+        for term, tf in Counter(terms).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("i"), array("i"))
+                folded = fold_diacritics(term)
+                if folded != term:
+                    self._folded[folded].add(term)
+            postings[0].append(row)
+            postings[1].append(tf)
+
+    def rebuild(self, texts: Iterable[str]) -> None:
+        self.__init__(self.k1, self.b)
+        for row, text in enumerate(texts):
+            self.add(row, text)
+
+    # ===== SEARCH =====
+
+    def _expand(self, term: str) -> Iterable[str]:
+        if term in self._postings:
+            yield term
+        if fold_diacritics(term) == term:
+            # Query không dấu: khớp mọi term có dấu cùng dạng bỏ dấu (còn posting)
+            yield from (variant for variant in self._folded.get(term, ()) if variant in self._postings)
+
+    def search(self, query: str, k: int, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (row ids, BM25 score) chỉ từ posting lists của các term trong query (mask: lọc theo metadata)"""
+        n = len(self._doc_len)
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        doc_len = np.frombuffer(self._doc_len, dtype=np.int32)
+        avg_len = self._total_len / n or 1.0
+        all_rows, all_scores = [], []
+        for term in set(tokenize(query)):
+            for matched in set(self._expand(term)):
+                rows_buf, tfs_buf = self._postings[matched]
+                rows = np.frombuffer(rows_buf, dtype=np.int32)
+                tfs = np.frombuffer(tfs_buf, dtype=np.int32).astype(np.float32)
+                idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * doc_len[rows] / avg_len)
+                all_rows.append(rows)
+                all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        if not all_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores)).astype(np.float32)
+        if mask is not None:
+            keep = mask[rows]
+            rows, scores = rows[keep], scores[keep]
+        best = top_k(scores, k)
+        return rows[best].astype(np.int64), scores[best]
+
+    # ===== PERSISTENCE =====
+
+    def save(self, f: BinaryIO) -> bool:
+        """Lưu dạng CSR: terms + offsets + rows + tfs vào file nhị phân đã mở"""
+        terms = list(self._postings)
+        lengths = np.array([len(self._postings[t][0]) for t in terms], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        rows = np.frombuffer(b"".join(self._postings[t][0].tobytes() for t in terms), dtype=np.int32)
+        tfs = np.frombuffer(b"".join(self._postings[t][1].tobytes() for t in terms), dtype=np.int32)
+        np.savez(f, terms=np.array(terms, dtype=object).astype(str), offsets=offsets, rows=rows, tfs=tfs,
+                 doc_len=np.frombuffer(self._doc_len, dtype=np.int32),
+                 params=np.array([self.k1, self.b]))
+        return True
+
+    def load(self, path: str) -> None:
+        with np.load(path) as data:
+            terms = data["terms"].tolist()
+            offsets = data["offsets"]
+            rows = data["rows"].astype(np.int32)
+            tfs = data["tfs"].astype(np.int32)
+            doc_len = data["doc_len"].astype(np.int32)
+            self.k1, self.b = (float(x) for x in data["params"])
+
+        self.__init__(self.k1, self.b)
+        for i, term in enumerate(terms):
+            start, end = offsets[i], offsets[i + 1]
+            row_buf, tf_buf = array("i"), array("i")
+            row_buf.frombytes(rows[start:end].tobytes())
+            tf_buf.frombytes(tfs[start:end].tobytes())
+            self._postings[term] = (row_buf, tf_buf)
+            folded = fold_diacritics(term)
+            if folded != term:
+                self._folded[folded].add(term)
+        self._doc_len.frombytes(doc_len.tobytes())
+        self._total_len = int(doc_len.sum())
+
+    def get_stats(self) -> Dict:
+        return {"type": self.name, "documents": len(self._doc_len), "terms": len(self._postings)}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """RRF: score(d) = Σ 1 / (k + rank) qua các danh sách xếp hạng"""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[int(row)] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
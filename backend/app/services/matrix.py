@@ -0,0 +1,136 @@
+"""
+EMBEDDING MATRIX - Ma trận embedding float32 đã chuẩn hóa và các hàm top-k dùng chung
+"""
+
+import numpy as np
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Chuẩn hóa L2 từng dòng (vector 0 giữ nguyên) để dot product = cosine"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingMatrix:
+    """
+    Ma trận embedding float32 liền mạch, đã chuẩn hóa sẵn
+    - Phần "base" có thể là np.memmap copy-on-write (chia sẻ page cache giữa các worker,
+      chỉ trang nào bị ghi đè mới được copy riêng)
+    - Phần "tail" nhận các dòng mới, append kiểu amortized (tăng gấp đôi capacity)
+    - scores() = phép nhân ma trận-vector (BLAS) trên base và tail
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim
+        self._base = None
+        self._buffer = None
+        self._size = 0
+
+    @classmethod
+    def from_file(cls, path: str, count: int = None) -> "EmbeddingMatrix":
+        """Mở file .npy dưới dạng memmap, không đọc toàn bộ vào RAM"""
+        base = np.load(path, mmap_mode="c")
+        if count is not None:
+            base = base[:count]
+        matrix = cls(dim=base.shape[1] if base.ndim == 2 else None)
+        matrix._base = base
+        return matrix
+
+    def __len__(self):
+        return (len(self._base) if self._base is not None else 0) + self._size
+
+    @property
+    def tail(self) -> np.ndarray:
+        """View (không copy) của các dòng mới chưa nằm trong base"""
+        if self._buffer is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._buffer[:self._size]
+
+    @property
+    def array(self) -> np.ndarray:
+        """Toàn bộ ma trận (chỉ copy khi có cả base lẫn tail)"""
+        if self._base is None:
+            return self.tail
+        if self._size == 0:
+            return self._base
+        return np.concatenate([self._base, self.tail])
+
+    def append(self, rows) -> None:
+        rows = normalize_rows(np.atleast_2d(np.asarray(rows, dtype=np.float32)))
+        if rows.shape[0] == 0:
+            return
+        if self.dim is None:
+            self.dim = rows.shape[1]
+        elif rows.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {rows.shape[1]} khác với store ({self.dim})")
+
+        needed = self._size + rows.shape[0]
+        if self._buffer is None or needed > self._buffer.shape[0]:
+            capacity = max(needed, 2 * (self._buffer.shape[0] if self._buffer is not None else 0), 64)
+            buffer = np.empty((capacity, self.dim), dtype=np.float32)
+            if self._size:
+                buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = buffer
+
+        self._buffer[self._size:needed] = rows
+        self._size = needed
+
+    def row(self, index: int) -> np.ndarray:
+        base_size = len(self._base) if self._base is not None else 0
+        if index < base_size:
+            return self._base[index]
+        return self._buffer[index - base_size]
+
+    def take(self, indices) -> np.ndarray:
+        """Gom các dòng theo chỉ số (cho tập ứng viên của index/filter)"""
+        indices = np.asarray(indices, dtype=np.int64)
+        base_size = len(self._base) if self._base is not None else 0
+        if base_size == 0:
+            return self.tail[indices]
+        if self._size == 0:
+            return np.asarray(self._base[indices])
+        rows = np.empty((len(indices), self.dim), dtype=np.float32)
+        in_base = indices < base_size
+        rows[in_base] = self._base[indices[in_base]]
+        rows[~in_base] = self._buffer[indices[~in_base] - base_size]
+        return rows
+
+    def set_row(self, index: int, vector) -> None:
+        """Ghi đè một dòng (upsert document đã có)"""
+        vector = normalize_rows(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        base_size = len(self._base) if self._base is not None else 0
+        if index < base_size:
+            self._base[index] = vector
+        else:
+            self._buffer[index - base_size] = vector
+
+    def delete(self, rows) -> None:
+        """Xóa các dòng; phần còn lại được copy vào buffer (memmap mở lại ở lần compaction sau)"""
+        keep = np.setdiff1d(np.arange(len(self)), np.asarray(list(rows), dtype=np.int64))
+        remaining = np.ascontiguousarray(self.take(keep), dtype=np.float32)
+        self._base = None
+        self._buffer = remaining if len(remaining) else None
+        self._size = len(remaining)
+
+    def scores(self, query_vector) -> np.ndarray:
+        """Cosine similarity giữa query và toàn bộ documents"""
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        if self._base is None:
+            return self.tail @ query
+        if self._size == 0:
+            return self._base @ query
+        return np.concatenate([self._base @ query, self.tail @ query])
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Chỉ số của k điểm cao nhất (giảm dần) bằng argpartition, không sort toàn bộ"""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -0,0 +1,194 @@
+"""
+METADATA INDEX - Posting index theo trường metadata cho search có điều kiện
+- where = {"source_type": "primary_source", "credibility_score": {"$gte": 90}, "topic": {"$in": [...]}}
+  (nhiều trường = AND; giá trị trần = $eq)
+- Toán tử: $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin
+- Trường được index (topic, source_type, credibility_score, document): value -> posting list,
+  so sánh khoảng chỉ duyệt các giá trị phân biệt đã sắp xếp, không duyệt documents
+- Trường khác: kiểm tra trực tiếp trên tập ứng viên đã thu hẹp
+"""
+
+import bisect
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+INDEXED_FIELDS = ("topic", "source_type", "credibility_score", "document")
+OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+
+
+def _kind(value) -> Optional[str]:
+    """Nhóm giá trị so sánh được với nhau (bool không tính là số)"""
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "str"
+    return None
+
+
+def _key(value) -> Tuple[Optional[str], object]:
+    """Key của posting: True và 1 bằng nhau trong Python nhưng là hai giá trị khác nhau ở đây"""
+    return _kind(value), value
+
+
+def _conditions(spec) -> Dict:
+    conditions = spec if isinstance(spec, dict) else {"$eq": spec}
+    for op, operand in conditions.items():
+        if op not in OPERATORS:
+            raise ValueError(f"Toán tử where không hỗ trợ: {op}")
+        # Chuỗi cũng iterate được: {"$in": "web"} sẽ thành từng ký tự
+        if op in ("$in", "$nin") and not isinstance(operand, (list, tuple, set, frozenset)):
+            raise ValueError(f"{op} cần list/tuple/set, nhận {type(operand).__name__}")
+    return conditions
+
+
+def _equal(value, operand) -> bool:
+    return value == operand and isinstance(value, bool) == isinstance(operand, bool)
+
+
+def _check(value, op: str, operand) -> bool:
+    if op == "$eq":
+        return _equal(value, operand)
+    if op == "$ne":
+        return not _equal(value, operand)
+    if op == "$in":
+        return any(_equal(value, item) for item in operand)
+    if op == "$nin":
+        return not any(_equal(value, item) for item in operand)
+    if value is None or _kind(value) != _kind(operand):
+        return False
+    if op == "$gt":
+        return value > operand
+    if op == "$gte":
+        return value >= operand
+    if op == "$lt":
+        return value < operand
+    return value <= operand
+
+
+def matches(metadata: Dict, where: Dict) -> bool:
+    """Kiểm tra một document (dùng cho trường không được index)"""
+    return all(
+        _check(metadata.get(field), op, operand)
+        for field, spec in where.items()
+        for op, operand in _conditions(spec).items()
+    )
+
+
+class MetadataIndex:
+    """field -> (kind, value) -> posting list (row ids); cập nhật tăng dần cùng store"""
+
+    def __init__(self, fields: Iterable[str] = INDEXED_FIELDS):
+        self.fields = tuple(fields)
+        self._postings: Dict[str, Dict[Tuple, array]] = {field: {} for field in self.fields}
+        self._sorted_keys: Dict[str, Dict[str, List]] = {}  # field -> kind -> giá trị phân biệt đã sắp xếp
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    # ===== CẬP NHẬT =====
+
+    def _insert(self, row: int, metadata: Dict) -> None:
+        for field in self.fields:
+            value = metadata.get(field)
+            if _kind(value) is None:
+                continue
+            postings = self._postings[field]
+            key = _key(value)
+            if key not in postings:
+                postings[key] = array("i")
+                self._sorted_keys.pop(field, None)
+            postings[key].append(row)
+
+    def add(self, row: int, metadata: Dict) -> None:
+        if row != self._size:
+            raise ValueError(f"MetadataIndex.add: row {row} không liên tục (đang có {self._size})")
+        self._insert(row, metadata)
+        self._size += 1
+
+    def update(self, row: int, old_metadata: Dict, new_metadata: Dict) -> None:
+        for field in self.fields:
+            key = _key(old_metadata.get(field))
+            rows = self._postings[field].get(key) if key[0] is not None else None
+            if rows is None:
+                continue
+            for i in range(len(rows) - 1, -1, -1):
+                if rows[i] == row:
+                    del rows[i]
+            if not rows:
+                del self._postings[field][key]
+                self._sorted_keys.pop(field, None)
+        self._insert(row, new_metadata)
+
+    def rebuild(self, metadatas: Iterable[Dict]) -> None:
+        self.__init__(self.fields)
+        for row, metadata in enumerate(metadatas):
+            self.add(row, metadata)
+
+    # ===== TRUY VẤN =====
+
+    def _keys(self, field: str, kind: str) -> List:
+        by_kind = self._sorted_keys.get(field)
+        if by_kind is None:
+            by_kind = {}
+            for kind, value in self._postings[field]:
+                by_kind.setdefault(kind, []).append(value)
+            for values in by_kind.values():
+                values.sort()
+            self._sorted_keys[field] = by_kind
+        return by_kind.get(kind, [])
+
+    def _mask(self, field: str, values: Iterable) -> np.ndarray:
+        mask = np.zeros(self._size, dtype=bool)
+        postings = self._postings[field]
+        for value in values:
+            key = _key(value)
+            rows = postings.get(key) if key[0] is not None else None
+            if rows:
+                mask[np.frombuffer(rows, dtype=np.int32)] = True
+        return mask
+
+    def _condition_mask(self, field: str, op: str, operand) -> np.ndarray:
+        if op == "$eq":
+            return self._mask(field, [operand])
+        if op == "$ne":
+            return ~self._mask(field, [operand])
+        if op == "$in":
+            return self._mask(field, operand)
+        if op == "$nin":
+            return ~self._mask(field, operand)
+
+        keys = self._keys(field, _kind(operand))
+        if op == "$gt":
+            selected = keys[bisect.bisect_right(keys, operand):]
+        elif op == "$gte":
+            selected = keys[bisect.bisect_left(keys, operand):]
+        elif op == "$lt":
+            selected = keys[:bisect.bisect_left(keys, operand)]
+        else:
+            selected = keys[:bisect.bisect_right(keys, operand)]
+        return self._mask(field, selected)
+
+    def filter(self, where: Dict, metadatas: List[Dict]) -> np.ndarray:
+        """Chỉ số (tăng dần) các documents thỏa where"""
+        mask = np.ones(self._size, dtype=bool)
+        unindexed = {}
+        for field, spec in where.items():
+            conditions = _conditions(spec)
+            if field not in self._postings:
+                unindexed[field] = conditions
+                continue
+            for op, operand in conditions.items():
+                mask &= self._condition_mask(field, op, operand)
+
+        rows = np.flatnonzero(mask)
+        if unindexed:
+            rows = np.array([i for i in rows if matches(metadatas[i], unindexed)], dtype=np.int64)
+        return rows
+
+    def get_stats(self) -> Dict:
+        return {field: len(values) for field, values in self._postings.items()}
@@ -0,0 +1,186 @@
+"""
+NEAR DUPLICATE - Phát hiện document gần trùng lúc ingest (MinHash + LSH)
+- Shingle = cụm 2 âm tiết liên tiếp (chữ thường, giữ dấu), hash crc32
+- MinHash signature num_perm giá trị, chia thành bands; hai document chung ít nhất một band -> ứng viên
+  -> mỗi lần tra chỉ tốn bands lần tìm kiếm nhị phân, không so với toàn bộ corpus
+- Ứng viên được kiểm tra chính xác bằng Jaccard: |A ∩ B| / |A ∪ B| (đúng đại lượng mà LSH ước lượng)
+  -> chỉ bắt bản sao gần như nguyên văn (sửa vài chữ, dấu câu); đoạn ngắn nằm trong đoạn dài không tính là trùng,
+  vì chunk cuối của một văn bản chủ yếu là phần overlap với chunk trước và không được phép bị loại
+- Các chunk của cùng một văn bản (cùng source_key) không bao giờ là bản trùng của nhau
+- Band key lưu trong mảng numpy đã sort + dict "đuôi" cho dòng mới, merge định kỳ như IVF
+"""
+
+import re
+import zlib
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+_PRIME = np.uint64((1 << 32) + 15)
+_MIX = np.uint64(0x100000001B3)
+
+
+def shingles(text: str, size: int = 2) -> np.ndarray:
+    """Tập shingle (uint32 đã unique + sort) của text"""
+    tokens = _WORD.findall(text.lower())
+    if len(tokens) > size:
+        grams = [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+    else:
+        grams = [" ".join(tokens)] if tokens else []
+    hashes = np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint32, count=len(grams))
+    return np.unique(hashes)
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """|A ∩ B| / |A ∪ B| của hai tập shingle"""
+    if a.size == 0 or b.size == 0:
+        return 0.0
+    common = np.intersect1d(a, b, assume_unique=True).size
+    return common / (a.size + b.size - common)
+
+
+def source_key(metadata) -> Optional[Tuple]:
+    """
+    Văn bản gốc của một chunk (None nếu document không phải chunk)
+    Các chunk liền kề chồng nhau theo thiết kế (overlap_tokens) nên không so trùng với nhau
+    """
+    if not metadata or "chunk_index" not in metadata:
+        return None
+    return tuple(metadata.get(key) for key in ("source", "url", "document", "line"))
+
+
+def credibility(metadata) -> float:
+    try:
+        return float(metadata.get("credibility_score", 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def prefer_new(new_text: str, new_metadata, old_text: str, old_metadata) -> bool:
+    """Giữ bản credibility_score cao hơn; bằng nhau thì giữ bản dài hơn (nhiều thông tin hơn)"""
+    new_score, old_score = credibility(new_metadata), credibility(old_metadata)
+    if new_score != old_score:
+        return new_score > old_score
+    return len(new_text) > len(old_text)
+
+
+class NearDuplicateIndex:
+    """
+    LSH trên MinHash signature, key = số dòng
+    - Không xoá entry khi dòng bị ghi đè: entry cũ chỉ sinh ứng viên thừa, bị loại ở bước kiểm tra chính xác
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 32, shingle_size: int = 2,
+                 threshold: float = 0.8, min_shingles: int = 4, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm phải chia hết cho bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.min_shingles = min_shingles
+        rng = np.random.default_rng(seed)
+        # a < 2^31, x < 2^32 -> a * x + b không tràn uint64
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)[:, None]
+        self._band_ids = np.arange(1, bands + 1, dtype=np.uint64)
+        self._keys = np.empty(0, dtype=np.uint64)  # band key đã sort
+        self._rows = np.empty(0, dtype=np.int64)
+        self._tail: Dict[int, List[int]] = {}
+        self._tail_entries = 0
+        self._size = 0
+
+    def shingles(self, text: str) -> np.ndarray:
+        return shingles(text, self.shingle_size)
+
+    def band_keys(self, text_shingles: np.ndarray) -> np.ndarray:
+        """MinHash signature -> một key uint64 cho mỗi band"""
+        hashed = (self._a * text_shingles.astype(np.uint64)[None, :] + self._b) % _PRIME
+        signature = hashed.min(axis=1).reshape(self.bands, -1)
+        keys = self._band_ids.copy()
+        with np.errstate(over="ignore"):
+            for column in signature.T:
+                keys = (keys * _MIX) ^ column
+        return keys
+
+    def add(self, row: int, text: str) -> None:
+        text_shingles = self.shingles(text)
+        if text_shingles.size == 0:
+            return
+        for key in self.band_keys(text_shingles).tolist():
+            self._tail.setdefault(key, []).append(row)
+        self._tail_entries += self.bands
+        self._size += 1
+        if self._tail_entries >= max(1024 * self.bands, len(self._keys) // 4):
+            self._merge()
+
+    def rebuild(self, texts: List[str]) -> None:
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._tail = {}
+        self._tail_entries = 0
+        self._size = 0
+        for row, text in enumerate(texts):
+            self.add(row, text)
+        self._merge()
+
+    def _merge(self) -> None:
+        """Đưa phần đuôi vào mảng đã sort"""
+        if not self._tail:
+            return
+        tail_keys = np.fromiter((key for key, rows in self._tail.items() for _ in rows),
+                                dtype=np.uint64, count=self._tail_entries)
+        tail_rows = np.fromiter((row for rows in self._tail.values() for row in rows),
+                                dtype=np.int64, count=self._tail_entries)
+        keys = np.concatenate([self._keys, tail_keys])
+        rows = np.concatenate([self._rows, tail_rows])
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._rows = keys[order], rows[order]
+        self._tail = {}
+        self._tail_entries = 0
+
+    def candidates(self, text_shingles: np.ndarray) -> Set[int]:
+        """Các dòng chung ít nhất một band với text"""
+        if text_shingles.size == 0:
+            return set()
+        keys = self.band_keys(text_shingles)
+        found = set()
+        for key in keys.tolist():
+            found.update(self._tail.get(key, ()))
+        starts = np.searchsorted(self._keys, keys, side="left")
+        ends = np.searchsorted(self._keys, keys, side="right")
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if end > start:
+                found.update(self._rows[start:end].tolist())
+        return found
+
+    def find(self, text: str, get_text: Callable[[int], str], exclude: Optional[int] = None,
+             skip: Callable[[int], bool] = None) -> Optional[Tuple[int, float]]:
+        """Dòng gần trùng nhất với text (Jaccard >= threshold), hoặc None; skip(row) True: bỏ qua dòng đó"""
+        text_shingles = self.shingles(text)
+        best = None
+        for row in self.candidates(text_shingles):
+            if row == exclude or (skip is not None and skip(row)):
+                continue
+            other = self.shingles(get_text(row))
+            if min(text_shingles.size, other.size) < self.min_shingles:
+                # Text quá ngắn: Jaccard không đáng tin, chỉ coi là trùng khi giống hệt
+                score = 1.0 if np.array_equal(text_shingles, other) else 0.0
+            else:
+                score = jaccard(text_shingles, other)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (row, score)
+        return best
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get_stats(self) -> Dict:
+        return {
+            "documents": self._size,
+            "bands": self.bands,
+            "rows_per_band": self.num_perm // self.bands,
+            "threshold": self.threshold,
+            "band_entries": int(len(self._keys) + self._tail_entries)
+        }
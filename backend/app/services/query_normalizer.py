@@ -0,0 +1,113 @@
+"""
+QUERY NORMALIZER - Chuẩn hoá câu hỏi tìm ảnh thành query tiếng Anh cho Google Images
+- Bảng thay thế (QUERY_REWRITES) được biên dịch một lần thành một regex duy nhất dạng trie
+  (các cụm chung tiền tố dùng chung nhánh, regex không phải thử lại từng cụm tại mỗi vị trí)
+- Quét một lượt, chỉ khớp nguyên từ (không thay "pháp" trong "phương pháp", "đi" trong "điện")
+- Cụm dài hơn được ưu tiên ("chủ tịch hồ chí minh" trước "chủ tịch"), không phụ thuộc thứ tự bảng
+- Kết quả được memoize (lru_cache) cho các query lặp lại
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, Tuple
+
+HCM = "Ho Chi Minh"
+
+# cụm từ (chữ thường) -> thay bằng; "" = bỏ đi
+QUERY_REWRITES: Tuple[Tuple[str, str], ...] = (
+    # Chuẩn hóa tên
+    ("chủ tịch hồ chí minh", HCM),
+    ("hồ chí minh", HCM),
+    ("bác hồ", HCM),
+    ("chủ tịch", "president"),
+    # Địa điểm & thời gian
+    ("ở pháp", "in France"),
+    ("tại pháp", "in France"),
+    ("pháp", "France"),
+    ("hồi còn", ""),
+    ("hồi", ""),
+    ("ngài", ""),
+    ("còn", ""),
+    ("thời", "period"),
+    # Từ thừa
+    ("cho tôi", ""),
+    ("tìm", ""),
+    ("xem", ""),
+    ("ảnh", ""),
+    ("hình", ""),
+    ("hình ảnh", ""),
+    ("của", ""),
+    ("về", ""),
+    ("đi", ""),
+    ("nào", ""),
+    ("giúp", ""),
+    ("với", ""),
+    # Từ ghép chứa "pháp" nhưng không nói về nước Pháp: giữ nguyên
+    ("phương pháp", "phương pháp"),
+    ("biện pháp", "biện pháp"),
+    ("hiến pháp", "hiến pháp"),
+    ("pháp luật", "pháp luật"),
+    ("pháp lý", "pháp lý"),
+)
+
+# Có tên Bác trong query: thêm từ khóa để filter tốt hơn
+HCM_BOOST = " president Vietnam historical photo"
+
+
+def trie_pattern(phrases: Iterable[str]) -> str:
+    """
+    Regex khớp một trong các cụm, dựng theo trie: ["hồi", "hồi còn"] -> "hồi(?:\\ còn)?"
+    Nhánh dài được thử trước (greedy) nên cụm dài nhất thắng
+    """
+    trie: Dict = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            pattern = (pattern if len(branches) > 1 else "(?:" + pattern + ")") + "?"
+        return pattern
+
+    return build(trie)
+
+
+class QueryNormalizer:
+    """normalize(query): query đã tối ưu; bảng được biên dịch một lần khi khởi tạo"""
+
+    def __init__(self, rewrites: Iterable[Tuple[str, str]] = QUERY_REWRITES, cache_size: int = 4096):
+        self.rewrites: Dict[str, str] = {unicodedata.normalize("NFC", phrase.lower()): replacement
+                                         for phrase, replacement in rewrites}
+        # \b hai đầu: chỉ khớp nguyên từ (mọi cụm đều bắt đầu và kết thúc bằng chữ)
+        self.pattern = re.compile(rf"\b{trie_pattern(self.rewrites)}\b")
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _replace(self, match: "re.Match") -> str:
+        # Cụm khớp luôn nằm giữa ký tự không phải chữ (khoảng trắng, dấu câu) nên không dính vào từ bên cạnh
+        return self.rewrites[match.group(0)]
+
+    def _normalize(self, query: str) -> str:
+        # Gom khoảng trắng trước để cụm nhiều từ ("bác  hồ") vẫn khớp
+        text = " ".join(unicodedata.normalize("NFC", query).lower().split())
+        optimized = " ".join(self.pattern.sub(self._replace, text).split())
+        if HCM in optimized:
+            optimized += HCM_BOOST
+        return optimized
+
+    def cache_info(self):
+        return self.normalize.cache_info()
+
+
+# Dùng chung trong process: biên dịch một lần khi import
+DEFAULT_NORMALIZER = QueryNormalizer()
+
+
+def normalize_query(query: str) -> str:
+    return DEFAULT_NORMALIZER.normalize(query)
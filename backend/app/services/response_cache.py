@@ -0,0 +1,123 @@
+"""
+RESPONSE CACHE - Cache câu trả lời /chat
+- Tầng exact: câu hỏi đã chuẩn hóa (NFC, chữ thường, bỏ dấu câu, gộp khoảng trắng)
+- Tầng semantic (tùy chọn): embedding câu hỏi có cosine >= threshold với câu hỏi đã cache
+- LRU giới hạn kích thước + TTL; tự invalidate khi phiên bản knowledge base thay đổi
+"""
+
+import re
+import threading
+import unicodedata
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .cache import TTLCache
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def normalize_question(question: str) -> str:
+    """'Đạo đức cách mạng là gì?' và 'đạo đức  cách mạng là gì' cho cùng key"""
+    text = unicodedata.normalize("NFC", question).lower()
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+class ResponseCache:
+    """Cache kết quả generate_response_with_sources theo câu hỏi"""
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600, similarity_threshold: float = 0.0):
+        self.similarity_threshold = similarity_threshold
+        self._entries = TTLCache(max_size=max_size, ttl=ttl, on_evict=self._forget_vector)
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._matrix = None  # (keys, ma trận) build lại khi tầng semantic thay đổi
+        self._version = None
+        self._lock = threading.RLock()
+        self.semantic_hits = 0
+        self.invalidations = 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.similarity_threshold > 0
+
+    def _check_version(self, version: str) -> None:
+        if version != self._version:
+            if self._version is not None and len(self._entries):
+                self.invalidations += 1
+            self._entries.clear()
+            self._vectors.clear()
+            self._matrix = None
+            self._version = version
+
+    def get(self, question: str, version: str,
+            embed_query: Callable[[str], np.ndarray] = None) -> Tuple[Optional[Dict], Optional[np.ndarray]]:
+        """
+        Tra exact trước; chỉ khi miss mới gọi embed_query (nếu bật semantic) để tra tầng semantic
+        Trả về (kết quả hoặc None, embedding câu hỏi nếu đã tính - để tái sử dụng cho search)
+        """
+        key = normalize_question(question)
+        with self._lock:
+            self._check_version(version)
+            result = self._entries.get(key)
+            if result is not None:
+                return dict(result), None
+            if embed_query is None or not self.semantic_enabled:
+                return None, None
+
+        # Tính embedding ngoài lock (có thể gọi API)
+        query_embedding = embed_query(question)
+        with self._lock:
+            if version != self._version or not self._vectors:
+                return None, query_embedding
+            similar_key = self._most_similar(query_embedding)
+            result = self._entries.peek(similar_key) if similar_key is not None else None
+            if result is None:
+                return None, query_embedding
+            self.semantic_hits += 1
+            return dict(result), query_embedding
+
+    def set(self, question: str, version: str, result: Dict, query_embedding: np.ndarray = None) -> None:
+        """
+        Lưu kết quả đã tính với phiên bản knowledge base lúc get
+        Phiên bản khác phiên bản hiện tại (kết quả cũ về muộn, hoặc chưa get lần nào): bỏ qua -
+        chỉ get mới được đổi phiên bản, set muộn không được xóa cache của phiên bản mới
+        """
+        key = normalize_question(question)
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries.set(key, dict(result))
+            if query_embedding is not None and self.semantic_enabled:
+                vector = np.asarray(query_embedding, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                self._vectors[key] = vector / norm if norm else vector
+                self._matrix = None
+
+    def _most_similar(self, query_embedding: np.ndarray) -> Optional[str]:
+        if self._matrix is None:
+            keys = list(self._vectors)
+            self._matrix = (keys, np.stack([self._vectors[k] for k in keys]))
+        keys, matrix = self._matrix
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        scores = matrix @ (query / norm)
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    def _forget_vector(self, key: str) -> None:
+        if self._vectors.pop(key, None) is not None:
+            self._matrix = None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = self._entries.get_stats()
+            # misses của tầng exact có thể được tầng semantic cứu lại
+            stats["exact_hits"] = stats.pop("hits")
+            stats["semantic_hits"] = self.semantic_hits
+            stats["misses"] = stats["misses"] - self.semantic_hits
+            total = stats["exact_hits"] + self.semantic_hits + stats["misses"]
+            stats["hit_rate"] = round((stats["exact_hits"] + self.semantic_hits) / total, 3) if total else 0.0
+            stats["invalidations"] = self.invalidations
+            return stats
@@ -0,0 +1,171 @@
+"""
+TEXT CHUNKER - Chia văn bản dài thành chunks để embedding, dạng generator
+- Đọc theo dòng (file object, list dòng hoặc một string), không giữ cả văn bản trong bộ nhớ
+- Ranh giới: đoạn văn (dòng trống) > câu (. ! ? …) > từ; không tách sau chữ viết tắt
+  tiếng Việt ("TP.", "Tp.", "tr.", "GS.", "v.v.", "H. C. Minh"...)
+- Kích thước theo token budget, chunk sau lặp lại overlap_tokens cuối của chunk trước
+- Mỗi chunk ghi lại offset ký tự [start, end) trong văn bản gốc
+- Thời gian tuyến tính: mỗi câu được xử lý một lần, chunk được join một lần khi xuất
+"""
+
+import re
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, Tuple, Union
+
+# Chữ viết tắt hay gặp (so khớp phần trước dấu chấm, phân biệt hoa thường)
+ABBREVIATIONS = frozenset({
+    "TP", "Tp", "tp", "Q", "P", "TT", "tr", "Tr", "tt", "St", "Nxb", "NXB", "Sđd", "sđd", "Tlđd",
+    "GS", "PGS", "TS", "ThS", "CN", "KS", "BS", "Th.S", "TSKH", "Ths", "Ng",
+    "v.v", "vv", "v", "ctv", "Cty", "cty", "Ô", "B", "Mr", "Mrs", "Dr", "St", "No", "Vol", "vol", "tập", "số",
+})
+
+# Kết thúc câu: dấu câu + (ngoặc/nháy đóng) + khoảng trắng, câu sau bắt đầu bằng chữ hoa/số/ngoặc mở
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*\s+(?=[\"'“‘(\[\d\w])")
+_LAST_WORD = re.compile(r"(\S+?)\.*[\"'”’)\]]*$")
+_WORD = re.compile(r"\S+")
+
+
+def approx_tokens(text: str) -> int:
+    """Ước lượng số token: số âm tiết/từ cách nhau bởi khoảng trắng"""
+    return len(text.split())
+
+
+def _is_boundary(text: str, end: int) -> bool:
+    """Dấu chấm tại text[:end] có phải hết câu không (loại chữ viết tắt, chữ cái đầu tên)"""
+    match = _LAST_WORD.search(text, max(0, end - 20), end)
+    if match is None:
+        return True
+    word = match.group(1)
+    if word in ABBREVIATIONS or word.rstrip(".") in ABBREVIATIONS:
+        return False
+    # "H. C. Minh", "A. Tiếp theo" - một chữ cái in hoa
+    return not (len(word) == 1 and word.isupper())
+
+
+def iter_paragraphs(source: Union[str, Iterable[str]], max_paragraph_chars: int = 65536) -> Iterator[Tuple[int, str]]:
+    """(offset, đoạn văn); đoạn quá dài (không có dòng trống) được cắt ở ranh giới dòng"""
+    lines = source.splitlines(keepends=True) if isinstance(source, str) else source
+    offset = 0
+    start = None
+    parts = []
+    size = 0
+    for line in lines:
+        if line.strip():
+            if start is None:
+                start = offset
+            parts.append(line)
+            size += len(line)
+            if size >= max_paragraph_chars:
+                yield start, "".join(parts)
+                start, parts, size = None, [], 0
+        elif parts:
+            yield start, "".join(parts)
+            start, parts, size = None, [], 0
+        offset += len(line)
+    if parts:
+        yield start, "".join(parts)
+
+
+def iter_sentences(paragraph: str, offset: int = 0) -> Iterator[Tuple[int, int, str]]:
+    """(start, end, câu) với offset tuyệt đối; khoảng trắng thừa trong câu được gộp"""
+    start = 0
+    for match in _SENTENCE_END.finditer(paragraph):
+        punctuation_end = match.start() + len(match.group().rstrip())
+        if not _is_boundary(paragraph, match.start() + 1):
+            continue
+        sentence = paragraph[start:punctuation_end]
+        if sentence.strip():
+            lead = len(sentence) - len(sentence.lstrip())
+            yield offset + start + lead, offset + punctuation_end, " ".join(sentence.split())
+        start = match.end()
+    sentence = paragraph[start:]
+    if sentence.strip():
+        lead = len(sentence) - len(sentence.lstrip())
+        end = start + len(sentence.rstrip())
+        yield offset + start + lead, offset + end, " ".join(sentence.split())
+
+
+class Chunk:
+    """Một chunk: text + vị trí [start, end) trong văn bản gốc"""
+
+    __slots__ = ("index", "text", "start", "end", "tokens")
+
+    def __init__(self, index: int, text: str, start: int, end: int, tokens: int):
+        self.index = index
+        self.text = text
+        self.start = start
+        self.end = end
+        self.tokens = tokens
+
+    def metadata(self) -> Dict:
+        return {"chunk_index": self.index, "char_start": self.start, "char_end": self.end}
+
+    def __repr__(self):
+        return f"Chunk({self.index}, [{self.start}:{self.end}], {self.tokens} tokens)"
+
+
+def _split_long_sentence(start: int, end: int, sentence: str, max_tokens: int,
+                         count_tokens: Callable[[str], int]) -> Iterator[Tuple[int, int, str]]:
+    """Câu dài hơn budget: cắt theo từ (offset xấp xỉ theo vị trí trong câu đã gộp khoảng trắng)"""
+    scale = (end - start) / max(1, len(sentence))
+    piece_start = 0
+    words = []
+    tokens = 0
+    for match in _WORD.finditer(sentence):
+        word_tokens = count_tokens(match.group())
+        if words and tokens + word_tokens > max_tokens:
+            yield start + int(piece_start * scale), start + int(match.start() * scale), " ".join(words)
+            piece_start, words, tokens = match.start(), [], 0
+        words.append(match.group())
+        tokens += word_tokens
+    if words:
+        yield start + int(piece_start * scale), end, " ".join(words)
+
+
+def chunk_text(source: Union[str, Iterable[str]], max_tokens: int = 200, overlap_tokens: int = 30,
+               count_tokens: Callable[[str], int] = approx_tokens) -> Iterator[Chunk]:
+    """
+    Generator chunks từ văn bản hoặc luồng dòng
+    - Gom câu đến khi vượt max_tokens; câu quá dài được cắt theo từ
+    - Chunk mới bắt đầu bằng các câu cuối của chunk trước (tổng <= overlap_tokens)
+    - Đoạn văn được nối bằng dòng trống để giữ cấu trúc
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens phải nhỏ hơn max_tokens")
+
+    window = deque()  # (start, end, text, tokens, paragraph_id) của chunk đang gom
+    window_tokens = 0
+    new_tokens = 0    # số token chưa từng được xuất (không tính phần overlap)
+    index = 0
+
+    def emit():
+        parts = []
+        previous_paragraph = None
+        for _, _, text, _, paragraph_id in window:
+            if previous_paragraph is not None:
+                parts.append("\n\n" if paragraph_id != previous_paragraph else " ")
+            parts.append(text)
+            previous_paragraph = paragraph_id
+        return Chunk(index, "".join(parts), window[0][0], window[-1][1], window_tokens)
+
+    for paragraph_id, (offset, paragraph) in enumerate(iter_paragraphs(source)):
+        for start, end, sentence in iter_sentences(paragraph, offset):
+            tokens = count_tokens(sentence)
+            pieces = [(start, end, sentence, tokens)] if tokens <= max_tokens else [
+                (s, e, text, count_tokens(text))
+                for s, e, text in _split_long_sentence(start, end, sentence, max_tokens, count_tokens)
+            ]
+            for piece in pieces:
+                if new_tokens and window_tokens + piece[3] > max_tokens:
+                    yield emit()
+                    index += 1
+                    # Giữ lại đuôi làm overlap
+                    while window and (window_tokens > overlap_tokens or window_tokens + piece[3] > max_tokens):
+                        window_tokens -= window.popleft()[3]
+                    new_tokens = 0
+                window.append((*piece, paragraph_id))
+                window_tokens += piece[3]
+                new_tokens += piece[3]
+
+    if new_tokens:
+        yield emit()
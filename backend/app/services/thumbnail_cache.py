@@ -0,0 +1,281 @@
+"""
+THUMBNAIL CACHE - Proxy + cache thumbnail của kết quả tìm ảnh trên disk
+- Ngay khi có kết quả tìm ảnh: tải thumbnail song song ở nền (connection pool chung, http_client.py)
+- Lưu theo nội dung (content-addressed): file tên = sha256 của ảnh, ảnh trùng chỉ lưu một lần
+- Giới hạn tổng dung lượng (max_bytes), vượt thì xoá ảnh lâu không dùng nhất (LRU)
+- rewrite(): chờ tối đa wait giây; thumbnail tải xong -> /thumbnails/{sha256}, link chết -> bỏ kết quả đó,
+  chưa kịp tải -> giữ URL gốc (việc tải vẫn tiếp tục, lần sau có trong cache)
+- URL lỗi được nhớ để không tải lại link chết liên tục: failure_ttl giây với lỗi 4xx / không phải ảnh,
+  error_ttl giây (ngắn) với lỗi mạng, timeout, 5xx, 408, 429
+- Mọi truy cập SQLite chạy ngoài event loop (asyncio.to_thread); thời điểm truy cập của lookup()
+  được gom lại và ghi theo batch thay vì commit mỗi GET
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from . import http_client
+from .cache import TTLCache
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ThumbnailFetchError(Exception):
+    """Thumbnail không dùng được: lỗi HTTP, không phải ảnh, hoặc quá lớn"""
+
+
+# Lỗi HTTP tạm thời: nhớ ngắn như lỗi mạng
+TRANSIENT_STATUS = (408, 429)
+
+
+class ThumbnailCache:
+    """url thumbnail -> sha256 nội dung; ảnh nằm ở root/ab/abcdef..."""
+
+    ACCESS_FLUSH_SIZE = 100  # số lần truy cập gom lại trước khi ghi accessed xuống SQLite
+
+    def __init__(self, root: str, public_url: str = "", max_bytes: int = 200 * 1024 * 1024,
+                 max_image_bytes: int = 2 * 1024 * 1024, failure_ttl: float = 3600, error_ttl: float = 60,
+                 client: httpx.AsyncClient = None, clock: Callable[[], float] = time.time):
+        self.root = root
+        self.public_url = public_url.rstrip("/")
+        self.max_bytes = max_bytes
+        self.max_image_bytes = max_image_bytes
+        self.error_ttl = error_ttl
+        self.client = client
+        self._clock = clock
+        self._failures = TTLCache(max_size=10000, ttl=failure_ttl, clock=clock)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()  # SQLite + total_bytes + _accessed
+        self._accessed: Dict[str, float] = {}  # digest -> thời điểm truy cập chưa ghi xuống SQLite
+        # stats được cộng từ event loop lẫn thread ghi (store/_evict): lock riêng, không chờ SQLite
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "fetched": 0, "failed": 0, "evicted": 0}
+
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, content_type TEXT NOT NULL, "
+                         "size INTEGER NOT NULL, accessed REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+        self._db.commit()
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    # ===== DISK =====
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def thumbnail_url(self, digest: str) -> str:
+        return f"{self.public_url}/thumbnails/{digest}"
+
+    def digest_for(self, url: str) -> Optional[str]:
+        return self.digests_for([url]).get(url)
+
+    def digests_for(self, urls: List[str]) -> Dict[str, str]:
+        """url -> digest của các URL đã cache (một truy vấn cho cả danh sách)"""
+        urls = list(urls)
+        found = {}
+        with self._lock:
+            for i in range(0, len(urls), 500):  # giới hạn số tham số của SQLite
+                batch = urls[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._db.execute(f"SELECT url, digest FROM urls WHERE url IN ({placeholders})", batch))
+        return found
+
+    def lookup(self, digest: str) -> Optional[Tuple[str, str]]:
+        """
+        (đường dẫn file, content-type) của ảnh đã cache; None nếu không có / key sai định dạng
+        Đọc SQLite (chặn) - từ event loop thì gọi qua asyncio.to_thread
+        """
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT content_type FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            self._accessed[digest] = self._clock()
+            if len(self._accessed) >= self.ACCESS_FLUSH_SIZE:
+                self._flush_accessed()
+                self._db.commit()
+        path = self.blob_path(digest)
+        return (path, row[0]) if os.path.exists(path) else None
+
+    def _flush_accessed(self) -> None:
+        """Ghi các thời điểm truy cập đã gom (gọi khi đang giữ _lock, người gọi tự commit)"""
+        if self._accessed:
+            self._db.executemany("UPDATE blobs SET accessed = ? WHERE digest = ?",
+                                 [(accessed, digest) for digest, accessed in self._accessed.items()])
+            self._accessed = {}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[name] += n
+
+    def store(self, url: str, data: bytes, content_type: str) -> str:
+        """Ghi ảnh (nếu chưa có), gắn url -> digest, xoá bớt ảnh cũ nếu vượt max_bytes"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        with self._lock:
+            exists = self._db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if not exists:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._db.execute("INSERT INTO blobs VALUES (?, ?, ?, ?)", (digest, content_type, len(data), self._clock()))
+                self.total_bytes += len(data)
+            else:
+                self._db.execute("UPDATE blobs SET accessed = ? WHERE digest = ?", (self._clock(), digest))
+            self._db.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url, digest))
+            # LRU cần thời điểm truy cập mới nhất của lookup()
+            self._flush_accessed()
+            self._evict(keep=digest)
+            self._db.commit()
+        return digest
+
+    def _evict(self, keep: str) -> None:
+        """Xoá ảnh lâu không dùng nhất đến khi dưới max_bytes (không xoá ảnh vừa ghi)"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT digest, size FROM blobs WHERE digest != ? ORDER BY accessed", (keep,))
+        for digest, size in rows.fetchall():
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self._db.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+            self._count("evicted")
+
+    # ===== FETCH =====
+
+    async def _download(self, client: httpx.AsyncClient, url: str) -> Tuple[bytes, str]:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if not content_type.startswith("image/"):
+                raise ThumbnailFetchError(f"không phải ảnh ({content_type or 'không có Content-Type'})")
+            if int(response.headers.get("Content-Length") or 0) > self.max_image_bytes:
+                raise ThumbnailFetchError("ảnh quá lớn")
+            chunks, size = [], 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > self.max_image_bytes:
+                    raise ThumbnailFetchError("ảnh quá lớn")
+                chunks.append(chunk)
+        if not size:
+            raise ThumbnailFetchError("ảnh rỗng")
+        return b"".join(chunks), content_type
+
+    def _failure_ttl(self, error: Exception) -> Optional[float]:
+        """TTL ghi nhớ lỗi: None = failure_ttl (link chết / không phải ảnh), error_ttl với lỗi tạm thời"""
+        if isinstance(error, ThumbnailFetchError):
+            return None
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            if 400 <= status < 500 and status not in TRANSIENT_STATUS:
+                return None
+        return self.error_ttl
+
+    async def _fetch(self, url: str, lookup: bool = True) -> Optional[str]:
+        """digest của thumbnail (đã cache hoặc vừa tải); None nếu không tải được (được ghi nhớ)"""
+        if lookup:
+            digest = await asyncio.to_thread(self.digest_for, url)
+            if digest is not None:
+                self._count("hits")
+                return digest
+        try:
+            client = self.client or http_client.get_async_client()
+            if client is not None:
+                data, content_type = await self._download(client, url)
+            else:
+                async with http_client.create_async_client() as client:
+                    data, content_type = await self._download(client, url)
+            digest = await asyncio.to_thread(self.store, url, data, content_type)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Thumbnail lỗi, bỏ kết quả: {url} ({e!r})")
+            self._failures.set(url, True, ttl=self._failure_ttl(e))
+            self._count("failed")
+            return None
+        self._count("fetched")
+        return digest
+
+    def prefetch(self, url: str, lookup: bool = True) -> "asyncio.Future":
+        """
+        Future -> digest / None; URL đang xử lý thì dùng chung task (không tải trùng)
+        Không chạm SQLite trên event loop: tra cache và tải đều nằm trong task
+        lookup=False: người gọi đã tra cache (rewrite tra cả danh sách một lần)
+        """
+        if self._failures.get(url) is not None:
+            return self._resolved(None)
+        task = self._tasks.get(url)
+        if task is None:
+            task = self._tasks[url] = asyncio.ensure_future(self._fetch(url, lookup))
+            task.add_done_callback(lambda _: self._tasks.pop(url, None))
+        return task
+
+    @staticmethod
+    def _resolved(digest: Optional[str]) -> "asyncio.Future":
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(digest)
+        return future
+
+    async def rewrite(self, images: List[Dict], wait: float = 1.0) -> List[Dict]:
+        """
+        Tải thumbnail của mọi kết quả (song song), chờ tối đa wait giây
+        Trả về danh sách ảnh đã thay thumbnail bằng URL local, bỏ các kết quả có thumbnail hỏng
+        """
+        sources = [image.get("thumbnail") or image.get("url") for image in images]
+        urls = {url for url in sources if url}
+        known = await asyncio.to_thread(self.digests_for, urls) if urls else {}
+        if known:
+            self._count("hits", len(known))
+        futures = {url: self._resolved(known[url]) if url in known else self.prefetch(url, lookup=False)
+                   for url in urls}
+        pending = [future for future in futures.values() if not future.done()]
+        if pending and wait > 0:
+            # Không huỷ task khi hết giờ: ảnh tải xong sau đó vẫn vào cache cho lần sau
+            await asyncio.wait(pending, timeout=wait)
+
+        rewritten = []
+        for image, url in zip(images, sources):
+            future = futures.get(url)
+            if future is None or not future.done():
+                rewritten.append(image)
+                continue
+            digest = future.result()
+            if digest is not None:
+                rewritten.append({**image, "thumbnail": self.thumbnail_url(digest)})
+        return rewritten
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] if self._db else 0
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {**stats, "images": count, "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                "in_flight": len(self._tasks)}
+
+    def close(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
+        with self._lock:
+            if self._db is not None:
+                self._flush_accessed()
+                self._db.commit()
+                self._db.close()
+                self._db = None
@@ -1,133 +1,699 @@
 import os
 import json
+import base64
+import hashlib
+import threading
 import numpy as np
-import google.generativeai as genai
 from dotenv import load_dotenv
 from typing import List, Dict
+from .embeddings import BatchEmbedder, create_default_embedder
+from .matrix import EmbeddingMatrix, normalize_rows, top_k
+from .ann_index import VectorIndex, create_index
+from .lexical_index import BM25Index, reciprocal_rank_fusion
+from .metadata_index import MetadataIndex
+from .document_table import DocumentTable
+from .near_duplicate import NearDuplicateIndex, prefer_new, source_key
 
 load_dotenv()
 
+
+def _fsync_dir(path: str) -> None:
+    """fsync thư mục để os.replace bền vững sau khi crash (bỏ qua trên Windows)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, write_fn, mode: str = "wb") -> bool:
+    """
+    Ghi file tạm, fsync rồi os.replace: file đích luôn là bản cũ hoặc bản mới hoàn chỉnh
+    write_fn trả về False: không có gì để ghi - bỏ file tạm, không tạo file đích (trả về False)
+    """
+    tmp_path = path + ".tmp"
+    encoding = None if "b" in mode else "utf-8"
+    with open(tmp_path, mode, encoding=encoding) as f:
+        written = write_fn(f) is not False
+        if written:
+            f.flush()
+            os.fsync(f.fileno())
+    if not written:
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+    return True
+
+
 class SimpleVectorStore:
-    def __init__(self):
-        # Khởi tạo Gemini
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY không tìm thấy")
-        
-        genai.configure(api_key=api_key)
-        print("Gemini API đã sẵn sàng!")
-        
+    """
+    Vector store đơn giản lưu trên disk
+    - Snapshot: embeddings-<gen>.npy (float32 đã chuẩn hóa, load bằng memmap)
+      + records-<gen>.json (ids, documents, metadata dạng cột), manifest.json trỏ tới generation hiện tại
+    - <index>-<gen>.npz: index ANN (nếu dùng IVF), documents trong WAL được gán cụm khi load
+    - bm25-<gen>.npz: inverted index BM25 cho hybrid search (lexical + vector, trộn bằng RRF)
+    - Metadata index (topic, source_type, credibility_score, document) cho search(where=...), build khi load
+    - wal.jsonl: log append-only các documents thêm/xóa sau snapshot, replay khi load
+      (dòng đầu ghi generation của snapshot; WAL của generation khác bị bỏ qua)
+    - Compaction định kỳ gộp WAL vào snapshot mới (ghi atomic, rồi mới xóa WAL)
+    - embedding_cache.sqlite3: cache embedding theo nội dung, dùng chung cho documents và query
+    - records.json / data.json (định dạng cũ) được migrate tự động khi load
+    """
+
+    MANIFEST_FILE = "manifest.json"
+    WAL_FILE = "wal.jsonl"
+    EMBEDDING_CACHE_FILE = "embedding_cache.sqlite3"
+    LEGACY_EMBEDDINGS_FILE = "embeddings.npy"
+    LEGACY_RECORDS_FILE = "records.json"
+    LEGACY_FILE = "data.json"
+    FORMAT_VERSION = 5  # 5: WAL có dòng header generation (bản cũ sẽ coi header là dòng hỏng và cắt mất WAL)
+    MIN_FORMAT_VERSION = 3  # manifest đầu tiên (records dạng list dict, vẫn đọc được)
+
+    def __init__(self, storage_path: str = "./simple_vector_storage", embedder: BatchEmbedder = None,
+                 index: VectorIndex = None, compact_min_records: int = 1000, compact_ratio: float = 0.25,
+                 hybrid: bool = None, dedup: bool = None):
         # Storage
-        self.storage_path = "./simple_vector_storage"
+        self.storage_path = storage_path
         os.makedirs(self.storage_path, exist_ok=True)
         
-        self.documents = []
-        self.metadatas = []
-        self.embeddings = []
+        # Khởi tạo embedder (mặc định: Gemini, batch + song song, cache trên disk cạnh store)
+        self.embedder = embedder or create_default_embedder(
+            cache_path=os.path.join(self.storage_path, self.EMBEDDING_CACHE_FILE)
+        )
+        
+        # Compaction khi WAL >= max(compact_min_records, compact_ratio * snapshot)
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+        self.generation = 0
+        self.snapshot_count = 0
+        self.wal_records = 0
+        self.wal_deletes = False  # WAL có record xóa (số dòng đã khác snapshot)
+        # Tăng mỗi khi nội dung store thay đổi (dùng để invalidate cache câu trả lời)
+        self.revision = 0
+        
+        # Documents + metadata dạng cột (text chỉ lưu một bản, giá trị metadata được intern)
+        self.records = DocumentTable()
+        self.embeddings = EmbeddingMatrix()
+        self._id_index = {}
+        
+        # Index tìm kiếm: exact (mặc định) hoặc ANN (VECTOR_INDEX=ivf)
+        self.index = index or create_index()
+        
+        # Hybrid search: BM25 bắt đúng tên riêng, năm, cụm từ mà embedding dễ bỏ sót (HYBRID_SEARCH=false để tắt)
+        self.lexical_index = BM25Index()
+        if hybrid is None:
+            hybrid = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+        self.hybrid = hybrid
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "50"))
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+        
+        # Posting index theo metadata cho search(where=...), build lại từ metadatas khi load
+        self.metadata_index = MetadataIndex()
+        
+        # Loại document gần trùng lúc ingest, giữ bản credibility_score cao nhất (NEAR_DUP_DEDUP=false để tắt)
+        if dedup is None:
+            dedup = os.getenv("NEAR_DUP_DEDUP", "true").lower() in ("1", "true", "yes")
+        self.near_dup_threshold = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+        self.near_duplicates = NearDuplicateIndex(threshold=self.near_dup_threshold) if dedup else None
+        self.near_duplicates_skipped = 0
+        
+        # Thread ghi (add_documents) và các thread kiểm tra trùng (vd thread đọc của ingest) dùng chung lock này
+        self.lock = threading.RLock()
         
         # Load existing data
         self.load_data()
     
-    def get_embedding(self, text: str):
-        """Tạo embedding bằng Gemini"""
-        try:
-            # Sử dụng Gemini embedding model
-            result = genai.embed_content(
-                model="models/embedding-001",
-                content=text,
-                task_type="retrieval_document"
+    @property
+    def ids(self) -> List[str]:
+        return self.records.ids
+    
+    @property
+    def documents(self) -> List[str]:
+        return self.records.texts
+    
+    @property
+    def metadatas(self):
+        """Sequence các MetadataView (chỉ đọc)"""
+        return self.records.metadatas
+    
+    def get_embeddings(self, texts: List[str], task_type: str = "retrieval_document") -> np.ndarray:
+        """Tạo embedding cho nhiều texts (batch, song song, retry khi hết quota)"""
+        return self.embedder.embed(texts, task_type=task_type)
+    
+    def get_embedding(self, text: str, task_type: str = "retrieval_document") -> np.ndarray:
+        """Tạo embedding cho một text"""
+        return self.get_embeddings([text], task_type=task_type)[0]
+    
+    @staticmethod
+    def content_id(text: str) -> str:
+        """ID ổn định theo nội dung (dùng khi không truyền ids)"""
+        return "doc_" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    
+    def contains(self, doc_id: str) -> bool:
+        with self.lock:
+            return doc_id in self._id_index
+    
+    def is_unchanged(self, doc_id: str, text: str, metadata: Dict) -> bool:
+        """Store đã có document này với đúng nội dung + metadata (upsert sẽ bỏ qua)"""
+        with self.lock:
+            row = self._id_index.get(doc_id)
+            return row is not None and self.documents[row] == text and self.records.metadata(row) == metadata
+    
+    def find_near_duplicate(self, text: str, metadata: Dict = None):
+        """Dòng gần trùng với text (None nếu không có hoặc tắt dedup); bỏ qua chunk khác của cùng văn bản"""
+        if self.near_duplicates is None:
+            return None
+        with self.lock:
+            documents = self.documents
+            key = source_key(metadata)
+            skip = (lambda row: row < len(documents) and source_key(self.records.metadata(row)) == key) \
+                if key is not None else None
+            found = self.near_duplicates.find(text, lambda row: documents[row] if row < len(documents) else "",
+                                              skip=skip)
+            return found[0] if found else None
+    
+    def is_near_duplicate(self, text: str, metadata: Dict) -> bool:
+        """Store đã có bản gần trùng đáng giữ hơn (add_documents sẽ bỏ qua document này)"""
+        with self.lock:
+            row = self.find_near_duplicate(text, metadata)
+            return row is not None and not prefer_new(text, metadata, self.documents[row],
+                                                      self.records.metadata(row))
+    
+    def _drop_near_duplicates(self, changes: Dict, canonical: bool = False, batch_ids=()) -> tuple:
+        """
+        Lọc document mới gần trùng (với store và với nhau trong batch), giữ bản credibility_score cao nhất
+        canonical: batch là bản chuẩn (vd corpus có ID cố định) - không bỏ document nào của batch,
+        dòng gần trùng đã có (ID khác, không thuộc batch) bị thay thế bằng document của batch
+        Trả về (changes còn lại, {doc_id: dòng sẽ bị thay thế}, số document bỏ qua)
+        """
+        batch = NearDuplicateIndex(threshold=self.near_dup_threshold)
+        keys = list(changes)
+        kept = {}
+        targets = {}
+        claimed = set()
+        skipped = 0
+        for position, doc_id in enumerate(keys):
+            text, metadata, _ = changes[doc_id]
+            if doc_id in self._id_index:
+                kept[doc_id] = changes[doc_id]
+                continue
+            
+            # Gần trùng với document mới khác trong batch: chỉ giữ một bản
+            key = source_key(metadata)
+            found = None if canonical else batch.find(
+                text, lambda j: kept[keys[j]][0] if keys[j] in kept else "",
+                skip=(lambda j: source_key(changes[keys[j]][1]) == key) if key is not None else None
             )
-            return result['embedding']
-        except Exception as e:
-            print(f"Lỗi tạo embedding: {e}")
-            # Fallback: tạo embedding đơn giản từ text
-            return [hash(text) % 1000 / 1000.0] * 768
+            if found:
+                other = keys[found[0]]
+                if not prefer_new(text, metadata, kept[other][0], kept[other][1]):
+                    skipped += 1
+                    continue
+                del kept[other]
+                if other in targets:
+                    targets[doc_id] = targets.pop(other)
+                skipped += 1
+            else:
+                # Gần trùng với document đã có: bỏ bản mới, hoặc thay thế dòng cũ nếu bản mới đáng tin hơn
+                row = self.find_near_duplicate(text, metadata)
+                if row is not None and row not in claimed and not (canonical and self.ids[row] in batch_ids):
+                    if not canonical and not prefer_new(text, metadata, self.documents[row],
+                                                        self.records.metadata(row)):
+                        skipped += 1
+                        continue
+                    print(f"Thay thế document gần trùng {self.ids[row]} bằng {doc_id}")
+                    targets[doc_id] = row
+                    claimed.add(row)
+            kept[doc_id] = changes[doc_id]
+            batch.add(position, text)
+        return kept, targets, skipped
     
-    def add_documents(self, texts: List[str], metadatas: List[Dict], ids: List[str] = None):
-        """Thêm documents"""
+    def add_documents(self, texts: List[str], metadatas: List[Dict], ids: List[str] = None,
+                      embeddings: np.ndarray = None, canonical: bool = False):
+        """
+        Upsert documents theo ID (mặc định: hash nội dung)
+        - ID đã có, nội dung + metadata giống hệt: bỏ qua (không embed, không ghi disk)
+        - ID đã có nhưng nội dung khác: ghi đè đúng dòng đó
+        - ID mới: append; gần trùng document khác (NEAR_DUP_DEDUP): chỉ giữ bản credibility_score cao hơn
+        - embeddings: embedding đã tính sẵn (cùng thứ tự với texts), vd từ pipeline ingest
+        - canonical: batch là bản chuẩn với ID cố định (corpus) - luôn được ghi, thay thế bản gần trùng đã có
+          (vd cùng đoạn văn dưới ID doc_N sau khi migrate data.json cũ)
+        Chỉ ghi các dòng thay đổi vào WAL, không ghi lại toàn bộ store
+        """
+        with self.lock:
+            self._add_documents(texts, metadatas, ids, embeddings, canonical)
+    
+    def _add_documents(self, texts: List[str], metadatas: List[Dict], ids: List[str] = None,
+                       embeddings: np.ndarray = None, canonical: bool = False):
         if ids is None:
-            ids = [f"doc_{len(self.documents) + i}" for i in range(len(texts))]
+            ids = [self.content_id(text) for text in texts]
         
-        print(f"Đang thêm {len(texts)} documents...")
+        # Lọc những gì thật sự thay đổi (ID trùng trong cùng batch: bản sau thắng)
+        changes = {}
+        for position, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+            if self.is_unchanged(doc_id, text, metadata):
+                changes.pop(doc_id, None)
+                continue
+            changes[doc_id] = (text, metadata, position)
         
-        for text, metadata in zip(texts, metadatas):
-            # Tạo embedding
-            embedding = self.get_embedding(text)
-            
-            # Lưu data
-            self.documents.append(text)
-            self.metadatas.append({**metadata, "text": text})
-            self.embeddings.append(embedding)
+        targets = {}
+        if self.near_duplicates is not None and changes:
+            changes, targets, skipped = self._drop_near_duplicates(changes, canonical, set(ids))
+            if skipped:
+                self.near_duplicates_skipped += skipped
+                print(f"Bỏ qua {skipped} documents gần trùng")
         
-        # Save to file
-        self.save_data()
+        if not changes:
+            print(f"Bỏ qua {len(texts)} documents (đã có, không thay đổi)")
+            return
+        
+        print(f"Đang thêm/cập nhật {len(changes)}/{len(texts)} documents...")
+        
+        # Tạo embedding cho cả batch (lỗi sẽ raise, không ghi gì vào store)
+        if embeddings is not None:
+            new_embeddings = np.asarray(embeddings, dtype=np.float32)[[position for _, _, position in changes.values()]]
+        else:
+            new_embeddings = self.get_embeddings([text for text, _, _ in changes.values()])
+        
+        changed_rows = []
+        appended = []
+        for (doc_id, (text, metadata, _)), embedding in zip(changes.items(), new_embeddings):
+            row = self._id_index.get(doc_id)
+            if row is None and doc_id in targets:
+                # Bản gần trùng đáng tin hơn chiếm dòng của bản cũ
+                row = targets[doc_id]
+                self._id_index.pop(self.ids[row], None)
+                self._id_index[doc_id] = row
+            if row is None:
+                row = self.records.append(doc_id, text, metadata)
+                self._id_index[doc_id] = row
+                self.lexical_index.add(row, text)
+                self.metadata_index.add(row, metadata)
+                appended.append(embedding)
+            else:
+                self.lexical_index.update(row, self.documents[row], text)
+                self.metadata_index.update(row, self.records.metadata(row), metadata)
+                self.records.set(row, doc_id, text, metadata)
+                self.embeddings.set_row(row, embedding)
+                self.index.update(self.embeddings, row)
+            if self.near_duplicates is not None:
+                self.near_duplicates.add(row, text)
+            changed_rows.append(row)
+        
+        # Append một lần vào ma trận embedding
+        if appended:
+            start = len(self.embeddings)
+            self.embeddings.append(appended)
+            self.index.add(self.embeddings, start)
+        
+        self.revision += 1
+        
+        # Ghi WAL (chỉ các dòng thay đổi), compact khi WAL đủ lớn
+        self._append_wal(changed_rows)
+        self.maybe_compact()
         print("Documents đã được thêm!")
     
-    def search(self, query: str, n_results: int = 5):
-        """Tìm kiếm documents"""
+    def delete(self, ids: List[str]) -> int:
+        """
+        Xóa documents theo ID (ID không có: bỏ qua), trả về số documents đã xóa
+        - Các dòng phía sau dồn lên: id map, BM25, metadata, near-duplicate và IVF được cập nhật theo
+        - Ghi một record xóa vào WAL, replay đúng thứ tự với các upsert
+        """
+        with self.lock:
+            deleted = [doc_id for doc_id in dict.fromkeys(ids) if doc_id in self._id_index]
+            if not deleted:
+                return 0
+            self._delete_rows(deleted)
+            self.metadata_index.rebuild(self.metadatas)
+            if self.near_duplicates is not None:
+                self.near_duplicates.rebuild(self.documents)
+            self.revision += 1
+            self._append_wal_delete(deleted)
+            self.maybe_compact()
+            print(f"Đã xóa {len(deleted)} documents")
+            return len(deleted)
+    
+    def _delete_rows(self, ids: List[str]) -> np.ndarray:
+        """Xóa dòng của các ID khỏi records, embeddings, BM25 và index vector (dùng chung với replay WAL)"""
+        rows = np.array(sorted(self._id_index[doc_id] for doc_id in ids), dtype=np.int64)
+        self.records.delete(rows.tolist())
+        self.embeddings.delete(rows)
+        self.index.remove(rows)
+        self._id_index = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.lexical_index.rebuild(self.documents)
+        return rows
+    
+    def search(self, query: str, n_results: int = 5, query_embedding: np.ndarray = None, where: Dict = None):
+        """
+        Tìm kiếm documents: vector (cosine) + BM25 (nếu bật hybrid), trộn bằng reciprocal rank fusion
+        - where: điều kiện metadata, vd {"source_type": "primary_source", "credibility_score": {"$gte": 90}}
+          thu hẹp tập ứng viên qua metadata index trước, rồi mới chấm điểm trên tập đó
+        - distances luôn là cosine distance của documents trả về
+        """
         if not self.documents:
-            return {"documents": [[]], "metadatas": [[]]}
+            return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
         
         print(f"Đang tìm kiếm: {query}")
         
-        # Tạo embedding cho query
-        query_embedding = self.get_embedding(query)
+        # Lọc metadata trước (không tốn API call nếu không có document nào thỏa)
+        candidates = mask = None
+        if where:
+            candidates = self.metadata_index.filter(where, self.metadatas)
+            if len(candidates) == 0:
+                return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+            mask = np.zeros(len(self.documents), dtype=bool)
+            mask[candidates] = True
         
-        # Tính similarity đơn giản (cosine similarity)
-        similarities = []
-        for i, doc_embedding in enumerate(self.embeddings):
-            # Đơn giản hóa: chỉ so sánh text
-            similarity = self.simple_similarity(query.lower(), self.documents[i].lower())
-            similarities.append((similarity, i))
+        # Tạo embedding cho query (nếu caller chưa tính sẵn)
+        if query_embedding is None:
+            query_embedding = self.get_embedding(query, task_type="retrieval_query")
+        query_vector = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
         
-        # Sort theo similarity
-        similarities.sort(reverse=True)
+        depth = max(n_results, self.hybrid_candidates) if self.hybrid else n_results
+        if candidates is None:
+            # Exact: một phép nhân ma trận-vector; IVF: chỉ các cụm gần nhất (argpartition top-k)
+            vector_rows, vector_scores = self.index.search(self.embeddings, query_vector, depth)
+        else:
+            # Chỉ chấm điểm tập ứng viên đã thu hẹp
+            candidate_scores = self.embeddings.take(candidates) @ query_vector
+            best = top_k(candidate_scores, depth)
+            vector_rows, vector_scores = candidates[best], candidate_scores[best]
         
-        # Lấy top results
-        top_indices = [idx for _, idx in similarities[:n_results]]
+        if not self.hybrid:
+            top_indices, top_scores = vector_rows, vector_scores
+        else:
+            lexical_rows, _ = self.lexical_index.search(query, depth, mask=mask)
+            fused = reciprocal_rank_fusion([vector_rows, lexical_rows], k=self.rrf_k)[:n_results]
+            top_indices = np.array([row for row, _ in fused], dtype=np.int64)
+            top_scores = self.embeddings.take(top_indices) @ query_vector
         
         documents = [self.documents[i] for i in top_indices]
-        metadatas = [{k: v for k, v in self.metadatas[i].items() if k != "text"} for i in top_indices]
+        metadatas = [self.records.metadata(i) for i in top_indices]
+        distances = [float(1.0 - score) for score in top_scores]
         
         return {
             "documents": [documents],
-            "metadatas": [metadatas]
+            "metadatas": [metadatas],
+            "distances": [distances]
         }
     
-    def simple_similarity(self, query: str, doc: str):
-        """Tính similarity đơn giản bằng cách đếm từ chung"""
-        query_words = set(query.split())
-        doc_words = set(doc.split())
+    # ===== WRITE-AHEAD LOG =====
+    
+    def _wal_path(self) -> str:
+        return os.path.join(self.storage_path, self.WAL_FILE)
+    
+    def _append_wal(self, rows: List[int]):
+        """Append các dòng thay đổi vào WAL, fsync một lần cho cả batch"""
+        if not rows:
+            return
+        lines = []
+        for i in rows:
+            record = {
+                "i": i,
+                "id": self.ids[i],
+                "text": self.documents[i],
+                "metadata": dict(self.records.metadata(i)),
+                "embedding": base64.b64encode(self.embeddings.row(i).astype(np.float32).tobytes()).decode("ascii")
+            }
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        
+        self._write_wal(lines)
+        self.wal_records += len(rows)
+    
+    def _append_wal_delete(self, ids: List[str]):
+        """Một record xóa cho cả batch ID"""
+        self._write_wal([json.dumps({"delete": ids}, ensure_ascii=False, separators=(",", ":"))])
+        self.wal_records += len(ids)
+    
+    def _wal_header(self, generation: int) -> str:
+        return json.dumps({"generation": generation}, separators=(",", ":")) + "\n"
+    
+    def _reset_wal(self, generation: int):
+        """WAL mới, rỗng, gắn với snapshot generation"""
+        header = self._wal_header(generation)
+        atomic_write(self._wal_path(), lambda f: f.write(header), mode="w")
+    
+    def _write_wal(self, lines: List[str]):
+        wal_path = self._wal_path()
+        new_file = not os.path.exists(wal_path) or os.path.getsize(wal_path) == 0
+        with open(wal_path, "a", encoding="utf-8") as f:
+            if new_file:
+                f.write(self._wal_header(self.generation))
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _replay_wal(self):
+        """
+        Replay WAL sau snapshot; bỏ qua dòng cuối bị ghi dở (crash giữa chừng)
+        WAL của generation khác (crash sau khi ghi manifest mới, trước khi reset WAL) đã nằm trong
+        snapshot: replay lại sẽ xóa/dồn nhầm dòng, nên bỏ qua và reset
+        """
+        wal_path = self._wal_path()
+        if not os.path.exists(wal_path):
+            return
+        
+        matrix_size = len(self.embeddings)
+        pending = []  # embeddings append chưa đưa vào ma trận
+        valid_bytes = 0
+        header = None  # WAL cũ (trước format 5) không có header: coi như cùng generation
+        with open(wal_path, "rb") as f:
+            for raw_line in f:
+                try:
+                    if not raw_line.endswith(b"\n"):
+                        raise ValueError("dòng WAL chưa ghi xong")
+                    record = json.loads(raw_line)
+                    if valid_bytes == 0 and "generation" in record:
+                        header = record
+                        valid_bytes += len(raw_line)
+                        if header["generation"] != self.generation:
+                            break
+                        continue
+                    i = record["i"] if "delete" not in record else None
+                except (ValueError, KeyError) as e:
+                    print(f"WAL bị cắt ngang, bỏ qua phần cuối: {e}")
+                    break
+                
+                if i is None:
+                    # Record xóa: đưa các dòng đang chờ vào ma trận trước, vì số dòng sẽ dồn lên
+                    valid_bytes += len(raw_line)
+                    if pending:
+                        self.embeddings.append(np.stack(pending))
+                        pending = []
+                    deleted = [doc_id for doc_id in record["delete"] if doc_id in self._id_index]
+                    if deleted:
+                        self._delete_rows(deleted)
+                    matrix_size = len(self.embeddings)
+                    self.wal_records += len(record["delete"])
+                    self.wal_deletes = True
+                    continue
+                if i > len(self.documents):
+                    print(f"WAL không liên tục tại dòng {i}, dừng replay")
+                    break
+                valid_bytes += len(raw_line)
+                
+                text = record["text"]
+                vector = np.frombuffer(base64.b64decode(record["embedding"]), dtype=np.float32)
+                metadata = {k: v for k, v in record["metadata"].items() if k != "text"}
+                if i == len(self.documents):
+                    self.lexical_index.add(i, text)
+                    self.records.append(record["id"], text, metadata)
+                    pending.append(vector)
+                else:
+                    # Ghi đè (upsert), hoặc dòng đã nằm trong snapshot (crash sau compaction) - idempotent
+                    self._id_index.pop(self.ids[i], None)
+                    self.lexical_index.update(i, self.documents[i], text)
+                    self.records.set(i, record["id"], text, metadata)
+                    if i < matrix_size:
+                        self.embeddings.set_row(i, vector)
+                    else:
+                        pending[i - matrix_size] = vector
+                self._id_index[record["id"]] = i
+                self.wal_records += 1
         
-        common_words = query_words.intersection(doc_words)
-        return len(common_words) / max(len(query_words), 1)
+        if header is not None and header["generation"] != self.generation:
+            print(f"⚠️ WAL thuộc generation {header['generation']}, snapshot là {self.generation}: bỏ qua")
+            self._reset_wal(self.generation)
+            return
+        
+        if pending:
+            self.embeddings.append(np.stack(pending))
+        
+        # Cắt phần đuôi hỏng để lần append sau không nối vào dòng dở
+        if valid_bytes < os.path.getsize(wal_path):
+            with open(wal_path, "r+b") as f:
+                f.truncate(valid_bytes)
+    
+    def maybe_compact(self):
+        """Compact WAL vào snapshot khi WAL đủ lớn so với snapshot"""
+        if self.wal_records >= max(self.compact_min_records, self.compact_ratio * self.snapshot_count):
+            self.save_data()
+    
+    # ===== SNAPSHOT =====
     
     def save_data(self):
-        """Lưu data xuống file"""
-        data = {
-            "documents": self.documents,
-            "metadatas": self.metadatas,
-            "embeddings": self.embeddings
+        """
+        Compaction: ghi snapshot mới (generation + 1) rồi replace manifest một cách atomic
+        Crash ở bất kỳ bước nào đều để lại manifest cũ + WAL hoặc manifest mới hợp lệ
+        """
+        old_manifest = self._read_manifest()
+        generation = self.generation + 1
+        embeddings_file = f"embeddings-{generation}.npy"
+        records_file = f"records-{generation}.json"
+        embeddings_path = os.path.join(self.storage_path, embeddings_file)
+        
+        matrix = np.ascontiguousarray(self.embeddings.array, dtype=np.float32)
+        atomic_write(embeddings_path, lambda f: np.save(f, matrix))
+        
+        records = self.records.to_records()
+        atomic_write(os.path.join(self.storage_path, records_file),
+                     lambda f: json.dump(records, f, ensure_ascii=False, separators=(",", ":")), mode="w")
+        
+        index_file = f"{self.index.name}-{generation}.npz"
+        if not atomic_write(os.path.join(self.storage_path, index_file), self.index.save):
+            index_file = None
+        
+        lexical_file = f"{self.lexical_index.name}-{generation}.npz"
+        atomic_write(os.path.join(self.storage_path, lexical_file), self.lexical_index.save)
+        
+        manifest = {
+            "format": self.FORMAT_VERSION,
+            "generation": generation,
+            "count": len(self.documents),
+            "dim": self.embeddings.dim,
+            "embeddings": embeddings_file,
+            "records": records_file,
+            "index": index_file,
+            "lexical_index": lexical_file
         }
+        atomic_write(os.path.join(self.storage_path, self.MANIFEST_FILE),
+                     lambda f: json.dump(manifest, f, ensure_ascii=False, indent=2), mode="w")
+        
+        # Manifest mới đã bền vững: giờ mới reset WAL (sang generation mới) và xóa snapshot cũ
+        self._reset_wal(generation)
+        stale_files = [self.LEGACY_EMBEDDINGS_FILE, self.LEGACY_RECORDS_FILE]
+        if old_manifest:
+            stale_files += [old_manifest.get("embeddings"), old_manifest.get("records"),
+                            old_manifest.get("index"), old_manifest.get("lexical_index")]
+        for name in stale_files:
+            path = os.path.join(self.storage_path, name) if name else None
+            if path and os.path.exists(path):
+                os.remove(path)
         
-        with open(os.path.join(self.storage_path, "data.json"), "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self.generation = generation
+        self.snapshot_count = len(self.documents)
+        self.wal_records = 0
+        self.wal_deletes = False
+        
+        # Mở lại dưới dạng memmap để các dòng vừa ghi không chiếm RAM riêng
+        self.embeddings = EmbeddingMatrix.from_file(embeddings_path, count=len(self.documents))
+    
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.storage_path, self.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
     
     def load_data(self):
-        """Load data từ file"""
-        file_path = os.path.join(self.storage_path, "data.json")
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                self.documents = data.get("documents", [])
-                self.metadatas = data.get("metadatas", [])
-                self.embeddings = data.get("embeddings", [])
-                
-                print(f"Đã load {len(self.documents)} documents")
-            except Exception as e:
-                print(f"Lỗi load data: {e}")
+        """
+        Load snapshot + replay WAL (tự động migrate định dạng cũ nếu chưa có manifest)
+        Lỗi khi load được raise: store load dở mà vẫn chạy tiếp thì lần compaction sau sẽ ghi đè snapshot tốt
+        """
+        try:
+            manifest = self._read_manifest()
+            if manifest:
+                self._check_format(manifest)
+                self._load_snapshot(manifest["records"], manifest["embeddings"], manifest["count"])
+                self.generation = manifest["generation"]
+            elif os.path.exists(os.path.join(self.storage_path, self.LEGACY_RECORDS_FILE)):
+                self._load_snapshot(self.LEGACY_RECORDS_FILE, self.LEGACY_EMBEDDINGS_FILE)
+            elif os.path.exists(os.path.join(self.storage_path, self.LEGACY_FILE)):
+                self.migrate_json(os.path.join(self.storage_path, self.LEGACY_FILE))
+            
+            self.snapshot_count = len(self.documents)
+            self._id_index = {doc_id: i for i, doc_id in enumerate(self.ids)}
+            self._load_lexical_index(manifest.get("lexical_index") if manifest else None)
+            self._replay_wal()
+            self.metadata_index.rebuild(self.metadatas)
+            if self.near_duplicates is not None:
+                self.near_duplicates.rebuild(self.documents)
+            
+            # Index của snapshot (nếu có và cùng loại) + gán các dòng từ WAL
+            # WAL có record xóa: số dòng đã dồn, phân cụm của snapshot không còn khớp -> build lại
+            index_file = manifest.get("index") if manifest else None
+            if index_file and (not index_file.startswith(f"{self.index.name}-") or self.wal_deletes):
+                index_file = None
+            self.index.load(os.path.join(self.storage_path, index_file) if index_file else None, self.embeddings)
+            
+            if self.documents:
+                print(f"Đã load {len(self.documents)} documents ({self.wal_records} từ WAL)")
+        except Exception as e:
+            print(f"❌ Lỗi load data từ {self.storage_path}: {e}")
+            raise
+    
+    def _check_format(self, manifest: Dict):
+        """Manifest phải do phiên bản đọc được ghi ra (MIN_FORMAT_VERSION..FORMAT_VERSION)"""
+        version = manifest.get("format")
+        if not isinstance(version, int) or not self.MIN_FORMAT_VERSION <= version <= self.FORMAT_VERSION:
+            raise ValueError(f"manifest định dạng {version!r} không được hỗ trợ "
+                             f"(cần {self.MIN_FORMAT_VERSION}..{self.FORMAT_VERSION})")
+    
+    def _load_lexical_index(self, lexical_file: str = None):
+        """BM25 của snapshot; không có hoặc lệch số documents thì build lại từ documents"""
+        path = os.path.join(self.storage_path, lexical_file) if lexical_file else None
+        if path and os.path.exists(path):
+            self.lexical_index.load(path)
+            if len(self.lexical_index) == len(self.documents):
+                return
+        if self.documents:
+            print(f"Đang build BM25 index cho {len(self.documents)} documents...")
+        self.lexical_index.rebuild(self.documents)
+    
+    def _load_snapshot(self, records_file: str, embeddings_file: str, count: int = None):
+        with open(os.path.join(self.storage_path, records_file), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        
+        self.records = DocumentTable.from_records(records)
+        if count is None:
+            count = len(self.documents)
+        if self.documents:
+            self.embeddings = EmbeddingMatrix.from_file(os.path.join(self.storage_path, embeddings_file), count=count)
+        else:
+            self.embeddings = EmbeddingMatrix()
+    
+    def migrate_json(self, json_path: str):
+        """Chuyển data.json (embeddings dạng text) sang định dạng nhị phân"""
+        print(f"Đang migrate {json_path} sang định dạng nhị phân...")
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        
+        documents = data.get("documents", [])
+        metadatas = data.get("metadatas") or [{} for _ in documents]
+        embeddings = data.get("embeddings", [])
+        if not (len(documents) == len(metadatas) == len(embeddings)):
+            raise ValueError(f"{json_path} không nhất quán: {len(documents)} documents, "
+                             f"{len(metadatas)} metadatas, {len(embeddings)} embeddings")
+        
+        self.records = DocumentTable.from_records({
+            "ids": [f"doc_{i}" for i in range(len(documents))],
+            "documents": list(documents),
+            "metadatas": metadatas
+        })
+        self._id_index = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.embeddings = EmbeddingMatrix()
+        if documents:
+            self.embeddings.append(np.asarray(embeddings, dtype=np.float32))
+        self.lexical_index.rebuild(self.documents)
+        
+        self.save_data()
+        print(f"Đã migrate {len(self.documents)} documents")
     
     def get_collection_count(self):
         """Lấy số lượng documents"""
@@ -135,3 +701,11 @@ class SimpleVectorStore:
 
 # Alias để tương thích
 PineconeVectorStore = SimpleVectorStore
+
+if __name__ == "__main__":
+    # Migrate thủ công: python -m app.services.vector_store <đường dẫn data.json>
+    import sys
+    
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join("./simple_vector_storage", SimpleVectorStore.LEGACY_FILE)
+    store = SimpleVectorStore()
+    store.migrate_json(source)
@@ -1,13 +1,163 @@
-import requests
 from bs4 import BeautifulSoup
 import time
 import re
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from urllib.parse import urljoin, urlparse
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 import hashlib
+import os
+from . import http_client
+from .crawler import Crawler
+from .crawl_cache import CrawlCache
+
+try:
+    # Parser C (libxml2), nhanh hơn nhiều so với html.parser thuần Python
+    import lxml.html as lxml_html
+    from lxml import etree
+except ImportError:
+    lxml_html = None
+
+NOISE_TAGS = ('script', 'style', 'nav', 'footer', 'aside', 'header')
+MAIN_CLASS_PATTERN = re.compile(r'content|main|body')
+
+# Mọi tín hiệu chất lượng nội dung trong một regex, quét text (đã lower) đúng một lần
+SIGNAL_PATTERN = re.compile(
+    r'\(\d{4}\)|\d{4}|tháng \d|tuyên ngôn độc lập|tuyên ngôn|toàn tập|tập'
+    r'|chủ tịch hồ chí minh|tư tưởng hồ chí minh|nguồn:|trích dẫn:'
+    r'|click here|buy now|advertisement|ads'
+)
+OFFICIAL_TERMS = frozenset(['chủ tịch hồ chí minh', 'tư tưởng hồ chí minh', 'toàn tập', 'tuyên ngôn độc lập'])
+SPAM_TERMS = frozenset(['click here', 'buy now', 'advertisement', 'ads'])
+
+_parsers = threading.local()
+
+
+def content_signals(text: str) -> frozenset:
+    """
+    Tín hiệu chất lượng: 'citation', 'official', 'date', 'spam'
+    - citation: (năm), "Toàn tập ... tập", "Tuyên ngôn ... năm", "nguồn:", "trích dẫn:"
+    - official: >= 2 thuật ngữ chính thức khác nhau
+    """
+    signals = set()
+    official = set()
+    after_toan_tap = after_tuyen_ngon = False
+    for match in SIGNAL_PATTERN.finditer(text.lower()):
+        term = match.group()
+        if term in OFFICIAL_TERMS:
+            official.add(term)
+        if term[0] == '(':
+            signals.update(('citation', 'date'))
+        elif term[0].isdigit():
+            signals.add('date')
+            if after_tuyen_ngon:
+                signals.add('citation')
+        elif term.startswith('tháng'):
+            signals.add('date')
+        elif term.startswith('tuyên ngôn'):
+            after_tuyen_ngon = True
+        elif term in ('toàn tập', 'tập'):
+            if after_toan_tap:
+                signals.add('citation')
+            after_toan_tap = after_toan_tap or term == 'toàn tập'
+        elif term in SPAM_TERMS:
+            signals.add('spam')
+        elif term in ('nguồn:', 'trích dẫn:'):
+            signals.add('citation')
+    if len(official) >= 2:
+        signals.add('official')
+    return frozenset(signals)
+
+
+def content_score(text: str) -> int:
+    """Điểm cộng/trừ theo chất lượng nội dung (chưa tính domain)"""
+    signals = content_signals(text)
+    score = 0
+    if 'citation' in signals:
+        score += 10
+    if 'official' in signals:
+        score += 5
+    if 'date' in signals:
+        score += 5
+    if len(text) < 100:
+        score -= 20
+    if 'spam' in signals:
+        score -= 30
+    return score
+
+
+def soup_main_text(soup: BeautifulSoup) -> str:
+    """Text của vùng nội dung chính (bỏ script, style, nav, footer, aside, header)"""
+    for element in soup(NOISE_TAGS):
+        element.decompose()
+    main_content = soup.find('main') or soup.find('article') or soup.find('div', class_=MAIN_CLASS_PATTERN)
+    text = (main_content or soup).get_text(separator=' ', strip=True)
+    return ' '.join(text.split())
+
+
+def _lxml_parser():
+    # Parser lxml không nên dùng chung giữa các thread
+    parser = getattr(_parsers, 'html', None)
+    if parser is None:
+        parser = _parsers.html = lxml_html.HTMLParser(encoding='utf-8', remove_comments=True)
+    return parser
+
+
+def _lxml_extract(html: bytes) -> Tuple[str, str]:
+    try:
+        root = lxml_html.document_fromstring(html, parser=_lxml_parser())
+    except etree.ParserError:  # document rỗng
+        return "", ""
+    title = (root.findtext('.//title') or "").strip()
+    etree.strip_elements(root, *NOISE_TAGS, with_tail=False)
+    main_content = root.find('.//main')
+    if main_content is None:
+        main_content = root.find('.//article')
+    if main_content is None:
+        main_content = next((div for div in root.iter('div') if MAIN_CLASS_PATTERN.search(div.get('class', ''))),
+                            root)
+    return title, ' '.join(' '.join(main_content.itertext()).split())
+
+
+def extract_page(html: Union[bytes, str]) -> Tuple[str, str]:
+    """
+    HTML -> (title, nội dung chính)
+    - Có lxml và trang là UTF-8: parse thẳng bằng lxml
+    - Còn lại: BeautifulSoup (tự đoán encoding)
+    """
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    if lxml_html is not None:
+        try:
+            html.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+        else:
+            return _lxml_extract(html)
+    soup = BeautifulSoup(html, 'lxml' if lxml_html is not None else 'html.parser')
+    title = soup.find('title')
+    title_text = title.text.strip() if title else ""
+    return title_text, soup_main_text(soup)
+
+
+def parse_page(html: bytes) -> Dict:
+    """
+    CPU stage: HTML thô -> title, nội dung, điểm chất lượng nội dung, content_hash
+    Hàm module-level để chạy được trong process pool
+    """
+    title, content = extract_page(html)
+    return {
+        'title': title,
+        'content': content,
+        'content_score': content_score(content),
+        'content_hash': hashlib.md5(content.encode('utf-8')).hexdigest()
+    }
+
 
 class WebDataCollector:
-    def __init__(self):
+    def __init__(self, cache_path: str = None, parse_workers: int = None):
         # Nguồn uy tín đã verify
         self.trusted_sources = {
             'vietnam.gov.vn': {'weight': 95, 'type': 'official'},
@@ -21,131 +171,181 @@ class WebDataCollector:
         }
         
         self.collected_data = []
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Academic Research Bot)'
-        })
+        # Connection pool dùng chung của app (keep-alive, HTTP/2, giới hạn connection mỗi host)
+        # User-Agent mặc định: HTTP_USER_AGENT
+        self.session = http_client.get_client()
+        
+        # Crawl song song theo domain, mỗi domain tối đa CRAWL_DOMAIN_RATE request/giây, tôn trọng robots.txt
+        self.crawler = Crawler(
+            self.session,
+            max_workers=int(os.getenv("CRAWL_MAX_WORKERS", "8")),
+            domain_rate=float(os.getenv("CRAWL_DOMAIN_RATE", "0.5"))
+        )
+        
+        # Cache theo URL: conditional GET (ETag/Last-Modified) + content_hash để crawl lại rẻ
+        self.crawl_cache = CrawlCache(cache_path) if cache_path else None
+        
+        # Parse + chấm điểm trên process pool (PARSE_WORKERS, mặc định = số core; <= 1: parse ngay trong thread fetch)
+        if parse_workers is None:
+            parse_workers = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+        self.parse_workers = parse_workers
+        self._parse_pool = None
+        self._pool_lock = threading.Lock()
     
-    def calculate_credibility_score(self, url: str, content: str, title: str = "") -> int:
-        """Tính điểm tin cậy của nguồn"""
-        score = 0
+    def domain_score(self, url: str) -> int:
+        """Điểm tin cậy theo domain (domain lạ: 10)"""
         domain = urlparse(url).netloc.lower()
-        
-        # Domain trust score
         for trusted_domain, info in self.trusted_sources.items():
             if trusted_domain in domain:
-                score += info['weight']
-                break
-        else:
-            score = 10
-        
-        # Content quality indicators
-        if self.has_citations(content):
-            score += 10
-        
-        if self.has_official_language(content):
-            score += 5
-        
-        if self.has_specific_dates(content):
-            score += 5
-            
-        # Negative indicators
-        if len(content) < 100:
-            score -= 20
-            
-        if self.has_spam_indicators(content):
-            score -= 30
-            
-        return max(0, min(100, score))
+                return info['weight']
+        return 10
+    
+    def calculate_credibility_score(self, url: str, content: str, title: str = "") -> int:
+        """Tính điểm tin cậy của nguồn"""
+        # Domain trust score + content quality indicators (một lần quét text)
+        return max(0, min(100, self.domain_score(url) + content_score(content)))
     
     def has_citations(self, text: str) -> bool:
         """Kiểm tra có citation không"""
-        citation_patterns = [
-            r'\(\d{4}\)',
-            r'Toàn tập.*tập.*',
-            r'Tuyên ngôn.*\d{4}',
-            r'nguồn:',
-            r'trích dẫn:'
-        ]
-        return any(re.search(pattern, text, re.IGNORECASE) for pattern in citation_patterns)
+        return 'citation' in content_signals(text)
     
     def has_official_language(self, text: str) -> bool:
         """Kiểm tra ngôn ngữ chính thức"""
-        official_terms = [
-            'chủ tịch hồ chí minh',
-            'tư tưởng hồ chí minh', 
-            'toàn tập',
-            'tuyên ngôn độc lập'
-        ]
-        text_lower = text.lower()
-        return sum(term in text_lower for term in official_terms) >= 2
+        return 'official' in content_signals(text)
     
     def has_specific_dates(self, text: str) -> bool:
         """Có ngày tháng cụ thể"""
-        date_patterns = [
-            r'\d{1,2}[-/]\d{1,2}[-/]\d{4}',
-            r'\d{4}',
-            r'tháng \d{1,2}',
-            r'năm \d{4}'
-        ]
-        return any(re.search(pattern, text) for pattern in date_patterns)
+        return 'date' in content_signals(text)
     
     def has_spam_indicators(self, text: str) -> bool:
         """Kiểm tra spam/low quality"""
-        spam_indicators = ['click here', 'buy now', 'advertisement', 'ads']
-        text_lower = text.lower()
-        return any(indicator in text_lower for indicator in spam_indicators)
+        return 'spam' in content_signals(text)
+    
+    def fetch_raw(self, url: str) -> Dict:
+        """
+        I/O stage: conditional GET nếu có cache
+        - 304: {'url', 'result': kết quả cũ} (không cần parse)
+        - còn lại: {'url', 'html': bytes, validator, content_hash lần trước}
+        """
+        cached = self.crawl_cache.get(url) if self.crawl_cache else None
+        headers = self.crawl_cache.conditional_headers(cached) if cached else {}
+        response = self.session.get(url, timeout=10, headers=headers)
+        
+        if response.status_code == 304 and cached:
+            self.crawl_cache.touch(url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            self.crawl_cache.record("not_modified")
+            return {'url': url, 'result': {**cached["result"], 'changed': False, 'not_modified': True}}
+        
+        response.raise_for_status()
+        return {
+            'url': url,
+            'html': response.content,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'previous_hash': cached["content_hash"] if cached else None
+        }
+    
+    def build_result(self, raw: Dict, parsed: Dict) -> Dict:
+        """Ghép kết quả parse với điểm domain, ghi cache; 'changed' = content_hash khác lần crawl trước"""
+        url = raw['url']
+        result = {
+            'url': url,
+            'title': parsed['title'],
+            'content': parsed['content'],
+            'credibility_score': max(0, min(100, self.domain_score(url) + parsed['content_score'])),
+            'source_type': self.get_source_type(url),
+            'content_hash': parsed['content_hash'],
+            'timestamp': time.time()
+        }
+        
+        changed = raw['previous_hash'] != parsed['content_hash']
+        if self.crawl_cache:
+            self.crawl_cache.put(url, result, raw['etag'], raw['last_modified'])
+            self.crawl_cache.record("changed" if changed else "unchanged")
+        return {**result, 'changed': changed, 'not_modified': False}
     
     def fetch_content(self, url: str) -> Dict:
-        """Fetch và parse content từ URL"""
+        """
+        Fetch và parse content từ URL (trong thread hiện tại)
+        - Có cache: gửi conditional GET; 304 trả về kết quả cũ không cần parse
+        - 'changed' = False khi nội dung (content_hash) giống lần crawl trước
+        """
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract main content
-            content = self.extract_main_content(soup)
-            title = soup.find('title')
-            title_text = title.text.strip() if title else ""
-            
-            # Calculate credibility
-            credibility = self.calculate_credibility_score(url, content, title_text)
-            
-            # Create content hash for deduplication
-            content_hash = hashlib.md5(content.encode('utf-8')).hexdigest()
-            
-            return {
-                'url': url,
-                'title': title_text,
-                'content': content,
-                'credibility_score': credibility,
-                'source_type': self.get_source_type(url),
-                'content_hash': content_hash,
-                'timestamp': time.time()
-            }
-            
+            raw = self.fetch_raw(url)
+            if 'result' in raw:
+                return raw['result']
+            return self.build_result(raw, parse_page(raw['html']))
         except Exception as e:
             print(f"Error fetching {url}: {e}")
             return None
     
-    def extract_main_content(self, soup: BeautifulSoup) -> str:
-        """Extract main text content"""
-        # Remove script, style, nav, footer, ads
-        for element in soup(['script', 'style', 'nav', 'footer', 'aside', 'header']):
-            element.decompose()
+    def _get_parse_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._parse_pool is None:
+                # spawn: fork khi các thread crawl đang chạy có thể làm process con kẹt lock
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                                       mp_context=multiprocessing.get_context("spawn"))
+            return self._parse_pool
+    
+    def fetch_pages(self, urls: List[str]) -> List[Optional[Dict]]:
+        """
+        Crawl theo pipeline hai stage, kết quả theo đúng thứ tự urls (None nếu lỗi / robots chặn)
+        - I/O: thread của Crawler fetch HTML thô, đẩy vào queue có giới hạn
+        - CPU: process pool parse + chấm điểm; tối đa 2 x parse_workers trang đang parse
+        Queue đầy / pool bận thì thread fetch phải chờ (backpressure), bộ nhớ không phình theo số trang
+        """
+        if self.parse_workers <= 1:
+            return self.crawler.map(self.fetch_content, urls)
         
-        # Try to find main content
-        main_content = soup.find('main') or soup.find('article') or soup.find('div', class_=re.compile(r'content|main|body'))
+        limit = 2 * self.parse_workers
+        raw_pages = queue.Queue(maxsize=limit)
+        finished = object()
         
-        if main_content:
-            text = main_content.get_text(separator=' ', strip=True)
-        else:
-            text = soup.get_text(separator=' ', strip=True)
+        def fetch(url):
+            raw_pages.put(self.fetch_raw(url))
+            return True
+        
+        def produce():
+            try:
+                self.crawler.map(fetch, urls)
+            finally:
+                raw_pages.put(finished)
+        
+        producer = threading.Thread(target=produce, name="crawl-io", daemon=True)
+        producer.start()
         
-        # Clean up text
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        pool = self._get_parse_pool()
+        results = {}
+        in_flight = {}  # future -> raw (đã bỏ html)
+        
+        def collect(block: bool):
+            done, _ = wait(list(in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                raw = in_flight.pop(future)
+                try:
+                    results[raw['url']] = self.build_result(raw, future.result())
+                except Exception as e:
+                    print(f"Error parsing {raw['url']}: {e}")
+        
+        while True:
+            raw = raw_pages.get()
+            if raw is finished:
+                break
+            if 'result' in raw:
+                results[raw['url']] = raw['result']
+                continue
+            while len(in_flight) >= limit:
+                collect(block=True)
+            in_flight[pool.submit(parse_page, raw.pop('html'))] = raw
+            collect(block=False)
+        while in_flight:
+            collect(block=True)
+        producer.join()
+        return [results.get(url) for url in urls]
+    
+    def extract_main_content(self, soup: BeautifulSoup) -> str:
+        """Extract main text content"""
+        return soup_main_text(soup)
     
     def get_source_type(self, url: str) -> str:
         """Determine source type"""
@@ -155,28 +355,26 @@ class WebDataCollector:
                 return info['type']
         return 'unknown'
     
-    def collect_hcm_content(self, topics: List[str]) -> List[Dict]:
-        """Thu thập nội dung về các chủ đề HCM"""
-        all_results = []
-        
+    def collect_hcm_content(self, topics: List[str], urls: List[str] = None) -> List[Dict]:
+        """Thu thập nội dung về các chủ đề HCM (các domain được fetch song song)"""
         # URLs chính thức để test
-        test_urls = [
+        test_urls = urls or [
             'https://vietnam.gov.vn/president-ho-chi-minh-68961',
             'https://historymatters.gmu.edu/d/5139/'  # Declaration of Independence
         ]
         
-        for url in test_urls:
-            print(f"Fetching from: {url}")
-            try:
-                result = self.fetch_content(url)
-                if result and result['credibility_score'] >= 70:
-                    all_results.append(result)
-                time.sleep(2)  # Rate limiting
-            except Exception as e:
-                print(f"Error processing {url}: {e}")
-                continue
-        
-        return all_results
+        print(f"Fetching {len(test_urls)} URLs từ {len({urlparse(u).netloc for u in test_urls})} domains...")
+        results = self.fetch_pages(test_urls)
+        return [result for result in results if result and result['credibility_score'] >= 70]
+    
+    def close(self):
+        """Dừng process pool parse và đóng crawl cache"""
+        with self._pool_lock:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown(wait=False, cancel_futures=True)
+                self._parse_pool = None
+        if self.crawl_cache:
+            self.crawl_cache.close()
 
 if __name__ == "__main__":
     collector = WebDataCollector()
@@ -0,0 +1,112 @@
+"""
+BENCH EXTRACTION - Đo throughput extract + chấm điểm nội dung (pages/giây)
+- python bench_extraction.py <thư mục chứa trang .html đã lưu>
+- Không truyền thư mục: sinh trang giả lập kiểu báo điện tử (menu, sidebar, bài viết dài)
+- So sánh đường cũ (html.parser + re.sub + 4 heuristic quét riêng) với extract_page + content_score
+"""
+
+import argparse
+import os
+import random
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from app.services.web_data_collector import content_score, extract_page, lxml_html
+
+SENTENCES = [
+    "Chủ tịch Hồ Chí Minh đọc Tuyên ngôn độc lập ngày 2/9/1945 tại Quảng trường Ba Đình.",
+    "Đạo đức cách mạng không phải là từ trời rơi xuống, nó do đấu tranh và giáo dục hằng ngày mà có.",
+    "Theo Toàn tập, tập 5, tư tưởng Hồ Chí Minh về đoàn kết là sức mạnh vô địch của nhân dân ta.",
+    "Không có gì quý hơn độc lập, tự do (1966).",
+    "Cần, kiệm, liêm, chính, chí công vô tư là phẩm chất của người cách mạng.",
+]
+
+
+def synthetic_page(rng: random.Random) -> bytes:
+    paragraphs = "".join(f"<p>{' '.join(rng.choice(SENTENCES) for _ in range(6))}</p>" for _ in range(40))
+    menu = "".join(f"<li><a href='/muc-{i}'>Chuyên mục {i}</a></li>" for i in range(60))
+    sidebar = "".join(f"<div class='item'><a href='/bai-{i}'>Bài liên quan {i}</a></div>" for i in range(30))
+    return (f"<html><head><title>Bài viết {rng.randint(1, 10**6)}</title><script>{'var a=1;' * 200}</script>"
+            f"<style>{'.x{color:red}' * 200}</style></head><body><header><nav><ul>{menu}</ul></nav></header>"
+            f"<div class='layout'><aside>{sidebar}</aside><div class='article-content'>{paragraphs}</div></div>"
+            f"<footer>Bản quyền</footer></body></html>").encode("utf-8")
+
+
+def load_pages(folder: str, limit: int):
+    pages = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith((".html", ".htm")):
+                with open(os.path.join(root, name), "rb") as f:
+                    pages.append(f.read())
+                if len(pages) >= limit:
+                    return pages
+    return pages
+
+
+def legacy_extract(html: bytes):
+    """Đường cũ của WebDataCollector.fetch_content"""
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(["script", "style", "nav", "footer", "aside", "header"]):
+        element.decompose()
+    main = soup.find("main") or soup.find("article") or soup.find("div", class_=re.compile(r"content|main|body"))
+    text = (main or soup).get_text(separator=" ", strip=True)
+    text = re.sub(r"\s+", " ", text).strip()
+    title = soup.find("title")
+    score = 0
+    if any(re.search(p, text, re.IGNORECASE) for p in
+           [r"\(\d{4}\)", r"Toàn tập.*tập.*", r"Tuyên ngôn.*\d{4}", r"nguồn:", r"trích dẫn:"]):
+        score += 10
+    if sum(t in text.lower() for t in ["chủ tịch hồ chí minh", "tư tưởng hồ chí minh", "toàn tập",
+                                       "tuyên ngôn độc lập"]) >= 2:
+        score += 5
+    if any(re.search(p, text) for p in [r"\d{1,2}[-/]\d{1,2}[-/]\d{4}", r"\d{4}", r"tháng \d{1,2}", r"năm \d{4}"]):
+        score += 5
+    if len(text) < 100:
+        score -= 20
+    if any(t in text.lower() for t in ["click here", "buy now", "advertisement", "ads"]):
+        score -= 30
+    return (title.text.strip() if title else ""), text, score
+
+
+def fast_extract(html: bytes):
+    title, text = extract_page(html)
+    return title, text, content_score(text)
+
+
+def run(name, extract, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [extract(page) for page in pages]
+    elapsed = time.perf_counter() - start
+    count = len(pages) * repeat
+    megabytes = sum(len(page) for page in pages) * repeat / 1e6
+    print(f"{name:<28} {count / elapsed:8.1f} pages/s  {megabytes / elapsed:6.2f} MB/s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extract + chấm điểm trang HTML")
+    parser.add_argument("folder", nargs="?", help="thư mục chứa trang .html đã lưu")
+    parser.add_argument("--pages", type=int, default=200, help="số trang (giả lập, hoặc tối đa khi đọc thư mục)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.folder, args.pages) if args.folder else []
+    if not pages:
+        rng = random.Random(0)
+        pages = [synthetic_page(rng) for _ in range(args.pages)]
+        print(f"Trang giả lập: {len(pages)} trang")
+    print(f"{len(pages)} trang, trung bình {sum(map(len, pages)) / len(pages) / 1024:.1f} KB, "
+          f"parser: {'lxml' if lxml_html is not None else 'html.parser (chưa cài lxml)'}")
+
+    legacy = run("html.parser + regex", legacy_extract, pages, args.repeat)
+    fast = run("extract_page + content_score", fast_extract, pages, args.repeat)
+    different = sum(a != b for a, b in zip(legacy, fast))
+    print(f"Kết quả khác đường cũ: {different}/{len(pages)} trang")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+BENCH QUERY NORMALIZER - Đo tốc độ tối ưu query tìm ảnh (query/giây)
+- So sánh chuỗi str.replace cũ với QueryNormalizer (regex biên dịch sẵn, một lượt)
+- "không cache": mỗi query là mới; "có cache": query lặp lại (lru_cache)
+"""
+
+import argparse
+import random
+import time
+
+from app.services.query_normalizer import QueryNormalizer
+
+WORDS = ["cho tôi", "xem", "ảnh", "hình ảnh", "Bác Hồ", "Chủ tịch Hồ Chí Minh", "ở Pháp", "tại Pháp", "hồi còn",
+         "thời", "thanh niên", "với thiếu nhi", "Việt Bắc", "Điện Biên", "phong cảnh", "Pác Bó", "năm 1946",
+         "đọc Tuyên ngôn độc lập", "của", "về", "giúp", "nào", "phương pháp", "cách mạng"]
+
+
+def legacy_optimize(query: str) -> str:
+    """ImageSearchService._optimize_query cũ"""
+    query_lower = query.lower()
+    for old, new in [("chủ tịch hồ chí minh", "Ho Chi Minh"), ("hồ chí minh", "Ho Chi Minh"),
+                     ("bác hồ", "Ho Chi Minh"), ("chủ tịch", "president"), ("ở pháp", "in France"),
+                     ("tại pháp", "in France"), ("pháp", "France"), ("hồi còn", ""), ("hồi", ""), ("ngài", ""),
+                     ("còn", ""), ("thời", "period")]:
+        query_lower = query_lower.replace(old, new)
+    for word in ["cho tôi", "tìm", "xem", "ảnh", "hình", "hình ảnh", "của", "về", "đi", "nào", "giúp", "với"]:
+        query_lower = query_lower.replace(word, " ")
+    query_optimized = " ".join(query_lower.split())
+    if "Ho Chi Minh" in query_optimized:
+        query_optimized += " president Vietnam historical photo"
+    return query_optimized
+
+
+def run(name, optimize, queries):
+    start = time.perf_counter()
+    for query in queries:
+        optimize(query)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {len(queries) / elapsed:12.0f} query/s  {elapsed / len(queries) * 1e6:7.2f} µs/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tối ưu query tìm ảnh")
+    parser.add_argument("--queries", type=int, default=50000)
+    parser.add_argument("--distinct", type=int, default=500, help="số query khác nhau cho lượt có cache")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    make = lambda: " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))
+    fresh = [make() for _ in range(args.queries)]
+    pool = [make() for _ in range(args.distinct)]
+    repeated = [rng.choice(pool) for _ in range(args.queries)]
+
+    run("str.replace (cũ)", legacy_optimize, fresh)
+    run("QueryNormalizer (không cache)", QueryNormalizer(cache_size=0).normalize, fresh)
+    run("QueryNormalizer (có cache)", QueryNormalizer().normalize, repeated)
+
+    different = sum(legacy_optimize(q) != QueryNormalizer(cache_size=0).normalize(q) for q in fresh[:1000])
+    print(f"Khác đường cũ: {different}/1000 query (đường cũ thay cả trong từ: điện -> ện, cảnh -> c, ...)")
+
+
+if __name__ == "__main__":
+    main()
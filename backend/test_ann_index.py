@@ -0,0 +1,139 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from app.services.ann_index import ExactIndex, IVFIndex, recall_at_k
+from app.services.matrix import EmbeddingMatrix
+
+
+def clustered_data(n=6000, dim=32, clusters=60, seed=0):
+    """Dữ liệu giả lập có cấu trúc cụm, giống embedding thật hơn nhiễu đều"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, size=n)
+    return (centers[labels] + rng.normal(scale=0.3, size=(n, dim))).astype(np.float32)
+
+
+def make_queries(data, count=50, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = data[rng.choice(len(data), count, replace=False)]
+    return picks + rng.normal(scale=0.1, size=picks.shape).astype(np.float32)
+
+
+def test_exact_index_matches_brute_force():
+    matrix = EmbeddingMatrix()
+    matrix.append(clustered_data(n=500))
+    query = make_queries(matrix.array, count=1)[0]
+
+    indices, scores = ExactIndex().search(matrix, query, 5)
+    expected = np.argsort(-matrix.scores(query))[:5]
+    assert list(indices) == list(expected)
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_ivf_recall_against_exact():
+    matrix = EmbeddingMatrix()
+    matrix.append(clustered_data())
+    queries = make_queries(matrix.array)
+
+    index = IVFIndex(nlist=64, nprobe=8, min_train_size=1000)
+    index.train(matrix)
+
+    recall = recall_at_k(index, matrix, queries, k=10)
+    assert recall >= 0.9, recall
+
+    # nprobe = nlist quét toàn bộ -> khớp exact
+    index.nprobe = 64
+    assert recall_at_k(index, matrix, queries, k=10) == 1.0
+
+
+def test_ivf_incremental_insert():
+    data = clustered_data()
+    matrix = EmbeddingMatrix()
+    matrix.append(data[:5000])
+
+    index = IVFIndex(nlist=64, nprobe=8, min_train_size=1000)
+    index.add(matrix, 0)
+    assert index.trained
+
+    start = len(matrix)
+    matrix.append(data[5000:])
+    index.add(matrix, start)
+
+    # Document vừa thêm tìm được chính nó (chưa cần build lại CSR)
+    found, _ = index.search(matrix, data[5500], 1)
+    assert found[0] == 5500
+
+
+def test_ivf_persistence_roundtrip():
+    matrix = EmbeddingMatrix()
+    matrix.append(clustered_data(n=3000))
+    queries = make_queries(matrix.array, count=10)
+
+    index = IVFIndex(nlist=32, nprobe=4, min_train_size=1000)
+    index.train(matrix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ivf.npz")
+        with open(path, "wb") as f:
+            assert index.save(f)
+        loaded = IVFIndex(nprobe=4)
+        loaded.load(path, matrix)
+
+    for query in queries:
+        assert list(index.search(matrix, query, 5)[0]) == list(loaded.search(matrix, query, 5)[0])
+
+
+def test_ivf_search_during_updates():
+    data = clustered_data(n=3000)
+    matrix = EmbeddingMatrix()
+    matrix.append(data)
+    index = IVFIndex(nlist=32, nprobe=32, min_train_size=1000)
+    index.train(matrix)
+
+    # Writer liên tục gán lại cụm (upsert) -> mỗi search đều phải build lại CSR
+    rng = np.random.default_rng(2)
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        while not stop.is_set():
+            row = int(rng.integers(1000, 3000))
+            matrix.set_row(row, data[int(rng.integers(1000, 3000))])
+            index.update(matrix, row)
+
+    def reader():
+        try:
+            for i in range(200):
+                found, scores = index.search(matrix, data[i], 5)
+                # Dòng < 1000 không bị ghi đè: nprobe = nlist nên luôn tìm thấy chính nó
+                assert len(found) == 5 and found[0] == i and len(set(found.tolist())) == 5, (i, found)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    writer_thread.join()
+    assert errors == []
+
+    # Không mất lần gán lại nào: mỗi dòng nằm đúng danh sách của cụm hiện tại
+    _, order, offsets, _, assign = index._snapshot()
+    assert all((assign[order[offsets[c]:offsets[c + 1]]] == c).all() for c in range(32))
+
+
+if __name__ == "__main__":
+    print("🧪 Testing ANN index...")
+    test_exact_index_matches_brute_force()
+    test_ivf_recall_against_exact()
+    test_ivf_incremental_insert()
+    test_ivf_persistence_roundtrip()
+    test_ivf_search_during_updates()
+    print("✅ ANN index hoạt động tốt!")
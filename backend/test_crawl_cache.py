@@ -0,0 +1,153 @@
+import os
+import random
+import tempfile
+
+import requests
+
+from app.services.crawl_cache import CrawlCache
+from app.services.crawler import Crawler
+from app.services.embeddings import BatchEmbedder
+from app.services.enhanced_rag_service import EnhancedRAGService
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+URL = "https://dangcongsan.vn/tu-tuong-ho-chi-minh"
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+class FakeSite(requests.Session):
+    """Một trang có ETag; use_etag=False giả lập server bỏ qua validator"""
+
+    def __init__(self):
+        super().__init__()
+        self.version = 1
+        self.use_etag = True
+        self.full_responses = 0
+        self.last_headers = None
+        self.sections = 0  # số câu dài thêm vào trang (trang dài -> nhiều chunk)
+
+    def page(self):
+        paragraph = "Cần, kiệm, liêm, chính là nền tảng của đạo đức cách mạng. " * 5
+        rng = random.Random(self.version)
+        words = "dân nước độc lập tự do hạnh phúc đoàn kết thanh niên học tập lao động kháng chiến kiến quốc".split()
+        extra = " ".join(" ".join(rng.choice(words) for _ in range(60)) + "." for _ in range(self.sections))
+        return (f"<html><title>Bài {self.version}</title><body><article><p>Phiên bản {self.version}. "
+                f"{paragraph} {extra}</p></article></body></html>").encode("utf-8")
+
+    def get(self, url, headers=None, **kwargs):
+        self.last_headers = headers or {}
+        etag = f'"v{self.version}"'
+        if self.use_etag and self.last_headers.get("If-None-Match") == etag:
+            return FakeResponse(304, headers={"ETag": etag})
+        self.full_responses += 1
+        return FakeResponse(200, self.page(), {"ETag": etag} if self.use_etag else {})
+
+
+def make_service(storage_path, site, stub):
+    store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(stub))
+    service = EnhancedRAGService(vector_store=store)
+    collector = service.data_collector
+    collector.session = site
+    collector.crawler = Crawler(site, respect_robots=False, domain_rate=100.0)
+    return service
+
+
+def test_crawl_cache_roundtrip():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CrawlCache(os.path.join(tmp, "crawl.sqlite3"))
+        cache.put(URL, {"content": "nội dung", "content_hash": "abc"}, etag='"x"', last_modified="Mon, 01 Jan 2024")
+        entry = cache.get(URL)
+        assert entry["result"]["content"] == "nội dung"
+        assert cache.conditional_headers(entry) == {"If-None-Match": '"x"', "If-Modified-Since": "Mon, 01 Jan 2024"}
+        cache.touch(URL, etag='"y"')
+        assert cache.get(URL)["etag"] == '"y"' and cache.get(URL)["last_modified"] == "Mon, 01 Jan 2024"
+        cache.close()
+
+
+def test_incremental_web_sync():
+    with tempfile.TemporaryDirectory() as storage_path:
+        site = FakeSite()
+        stub = StubEmbedder()
+        service = make_service(storage_path, site, stub)
+        try:
+            stats = service.sync_web_sources([URL])
+            assert stats["updated"] == 1 and stats["chunks"] >= 1
+            embedded = len(stub.batches)
+            assert embedded > 0
+
+            # 304: không parse, không embed
+            stats = service.sync_web_sources([URL])
+            assert stats["unchanged"] == 1
+            assert site.last_headers == {"If-None-Match": '"v1"'}
+            assert site.full_responses == 1 and len(stub.batches) == embedded
+
+            # Server bỏ qua validator nhưng nội dung giống: content_hash chặn việc embed lại
+            site.use_etag = False
+            stats = service.sync_web_sources([URL])
+            assert stats["unchanged"] == 1 and len(stub.batches) == embedded
+
+            # Nội dung đổi: chunk được ghi đè theo ID URL#vị trí, không thêm bản trùng
+            count = service.vector_store.get_collection_count()
+            site.version = 2
+            stats = service.sync_web_sources([URL])
+            assert stats["updated"] == 1 and len(stub.batches) > embedded
+            assert service.vector_store.get_collection_count() == count
+            assert service.vector_store.documents[0].startswith("Phiên bản 2")
+
+            cache_stats = service.data_collector.crawl_cache.get_stats()
+            assert cache_stats["not_modified"] == 1 and cache_stats["unchanged"] == 1
+        finally:
+            service.shutdown()
+
+
+def test_shrunken_page_drops_stale_chunks():
+    with tempfile.TemporaryDirectory() as storage_path:
+        site = FakeSite()
+        site.sections = 8
+        service = make_service(storage_path, site, StubEmbedder())
+        store = service.vector_store
+        try:
+            stats = service.sync_web_sources([URL])
+            assert stats["chunks"] == 3 and stats["deleted"] == 0
+            prefix = next(doc_id for doc_id in store.ids if doc_id.endswith("#0"))[:-2]
+            count = store.get_collection_count()
+
+            # Trang còn một chunk: #1, #2 bị xóa, index đi theo số dòng mới
+            site.version = 2
+            site.sections = 0
+            stats = service.sync_web_sources([URL])
+            assert stats["chunks"] == 1 and stats["deleted"] == 2
+            assert store.get_collection_count() == count - 2
+            assert [doc_id for doc_id in store.ids if doc_id.startswith(prefix)] == [prefix + "#0"]
+            assert len(store.lexical_index) == len(store.metadata_index) == len(store.embeddings) == count - 2
+            assert len(store.search("đạo đức cách mạng", where={"url": URL})["documents"][0]) == 1
+        finally:
+            service.shutdown()
+
+        # Khởi động lại: record xóa trong WAL được replay
+        reopened = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()))
+        assert reopened.ids == store.ids and len(reopened.embeddings) == count - 2
+        assert reopened.documents[reopened.ids.index(prefix + "#0")].startswith("Phiên bản 2")
+
+        # Compaction gộp record xóa vào snapshot
+        reopened.save_data()
+        compacted = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()))
+        assert compacted.ids == store.ids and compacted.wal_records == 0
+
+
+if __name__ == "__main__":
+    print("🧪 Testing crawl cache...")
+    test_crawl_cache_roundtrip()
+    test_incremental_web_sync()
+    test_shrunken_page_drops_stale_chunks()
+    print("✅ Crawl cache hoạt động tốt!")
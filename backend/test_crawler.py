@@ -0,0 +1,107 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from app.services.crawler import Crawler, TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, text=""):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeSession(requests.Session):
+    """Chỉ trả lời robots.txt, không ra mạng"""
+
+    ROBOTS = {
+        "blocked.vn": "User-agent: *\nDisallow: /private/\n",
+        "slow.vn": "User-agent: *\nCrawl-delay: 1\n",
+        "forbidden.vn": None,
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.robots_requests = []
+
+    def get(self, url, **kwargs):
+        domain = urlparse(url).netloc
+        self.robots_requests.append(domain)
+        if domain == "forbidden.vn":
+            return FakeResponse(403)
+        robots = self.ROBOTS.get(domain)
+        return FakeResponse(200, robots) if robots else FakeResponse(404)
+
+
+def test_token_bucket_spacing():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=0.5, capacity=1, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        bucket.acquire()
+    assert waits == [2.0, 2.0]
+
+
+def test_domains_crawled_in_parallel_with_per_domain_rate():
+    domains = [f"site{i}.vn" for i in range(4)]
+    urls = [f"https://{d}/page{j}" for j in range(2) for d in domains]
+    calls = {}
+    lock = threading.Lock()
+
+    def fetch(url):
+        with lock:
+            calls.setdefault(urlparse(url).netloc, []).append(time.monotonic())
+        time.sleep(0.05)
+        return url.upper()
+
+    session = FakeSession()
+    crawler = Crawler(session, max_workers=8, domain_rate=5.0)
+    start = time.monotonic()
+    results = crawler.map(fetch, urls)
+    elapsed = time.monotonic() - start
+
+    assert results == [url.upper() for url in urls]
+    # Tuần tự: 8 x 0.05s + 4 x 0.2s chờ; song song: ~ một domain (0.05 + 0.2 + 0.05)
+    assert elapsed < 0.6, elapsed
+    for times in calls.values():
+        assert times[1] - times[0] >= 0.18
+    assert sorted(session.robots_requests) == sorted(domains)  # robots.txt chỉ tải một lần mỗi domain
+
+
+def test_robots_rules_are_respected():
+    session = FakeSession()
+    crawler = Crawler(session, domain_rate=100.0)
+    urls = ["https://blocked.vn/private/a", "https://blocked.vn/public/b", "https://forbidden.vn/x"]
+    results = crawler.map(lambda url: "ok", urls)
+    assert results == [None, "ok", None]
+    assert crawler.stats["blocked_by_robots"] == 2
+
+    # Crawl-delay: 1 làm chậm domain dù domain_rate cao
+    assert crawler._bucket("https://slow.vn/").rate == 1.0
+
+
+def test_failed_fetch_returns_none():
+    def fetch(url):
+        if "bad" in url:
+            raise requests.ConnectionError("timeout")
+        return url
+
+    crawler = Crawler(FakeSession(), domain_rate=100.0)
+    assert crawler.map(fetch, ["https://a.vn/bad", "https://b.vn/good"]) == [None, "https://b.vn/good"]
+    assert crawler.stats["errors"] == 1
+
+
+if __name__ == "__main__":
+    print("🧪 Testing crawler...")
+    test_token_bucket_spacing()
+    test_domains_crawled_in_parallel_with_per_domain_rate()
+    test_robots_rules_are_respected()
+    test_failed_fetch_returns_none()
+    print("✅ Crawler hoạt động tốt!")
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from app.services.document_table import DocumentTable, MetadataView
+from app.services.embeddings import BatchEmbedder
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+
+def test_columns_intern_values_and_views():
+    table = DocumentTable()
+    for i in range(100):
+        table.append(f"id_{i}", f"text {i}", {"source_type": "official", "credibility_score": 100, "page": f"tr.{i}"})
+    table.append("web", "text web", {"source_type": "web", "url": "https://example.com"})
+
+    # 100 lần "official" / 100 chỉ giữ một giá trị trong pool
+    assert len(table._values) == 100 + 4
+    view = table.metadata(100)
+    assert isinstance(view, MetadataView)
+    assert dict(view) == {"source_type": "web", "url": "https://example.com"}
+    assert table.metadata(0) == {"source_type": "official", "credibility_score": 100, "page": "tr.0"}
+    assert "url" not in table.metadata(0)
+
+    table.set(0, "id_0", "text mới", {"topic": "đạo đức", "credibility_score": 1.0})
+    assert dict(table.metadata(0)) == {"topic": "đạo đức", "credibility_score": 1.0}
+    assert isinstance(table.metadata(0)["credibility_score"], float)
+
+
+def test_delete_shifts_rows():
+    table = DocumentTable()
+    for i in range(5):
+        table.append(f"id_{i}", f"text {i}", {"page": i} if i % 2 else {"topic": "đạo đức"})
+    table.delete([1, 3])
+    assert table.ids == ["id_0", "id_2", "id_4"] and table.texts == ["text 0", "text 2", "text 4"]
+    assert [dict(view) for view in table.metadatas] == [{"topic": "đạo đức"}] * 3
+
+
+def test_records_roundtrip_and_legacy_format():
+    table = DocumentTable()
+    table.append("a", "văn bản a", {"topic": "độc lập", "tags": ["x", "y"]})
+    table.append("b", "văn bản b", {"topic": "độc lập"})
+    table.set(1, "b", "văn bản b", {"topic": "đạo đức"})  # "độc lập" vẫn dùng bởi dòng 0
+
+    loaded = DocumentTable.from_records(json.loads(json.dumps(table.to_records())))
+    assert loaded.ids == ["a", "b"]
+    assert [dict(m) for m in loaded.metadatas] == [{"topic": "độc lập", "tags": ["x", "y"]}, {"topic": "đạo đức"}]
+
+    legacy = DocumentTable.from_records({
+        "documents": ["văn bản"],
+        "metadatas": [{"topic": "độc lập", "text": "văn bản"}]
+    })
+    assert legacy.ids == ["doc_0"]
+    assert dict(legacy.metadata(0)) == {"topic": "độc lập"}
+
+
+def test_store_loads_legacy_records_without_text_copy():
+    stub = StubEmbedder()
+    with tempfile.TemporaryDirectory() as storage_path:
+        np.save(os.path.join(storage_path, "embeddings.npy"),
+                np.array([stub.vector("văn bản cũ")], dtype=np.float32))
+        with open(os.path.join(storage_path, "records.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": ["old"], "documents": ["văn bản cũ"],
+                       "metadatas": [{"topic": "độc lập", "text": "văn bản cũ"}]}, f, ensure_ascii=False)
+
+        store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(stub))
+        assert dict(store.metadatas[0]) == {"topic": "độc lập"}
+
+        store.add_documents(["văn bản mới"], [{"topic": "đạo đức"}])
+        store.save_data()
+        with open(os.path.join(storage_path, "records-1.json"), encoding="utf-8") as f:
+            assert "văn bản cũ" not in json.dumps(json.load(f)["values"], ensure_ascii=False)
+
+        reloaded = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(stub))
+        results = reloaded.search("văn bản", n_results=2, where={"topic": "đạo đức"})
+        assert results["documents"][0] == ["văn bản mới"]
+        assert dict(results["metadatas"][0][0]) == {"topic": "đạo đức"}
+
+
+if __name__ == "__main__":
+    print("🧪 Testing document table...")
+    test_columns_intern_values_and_views()
+    test_delete_shifts_rows()
+    test_records_roundtrip_and_legacy_format()
+    test_store_loads_legacy_records_without_text_copy()
+    print("✅ Document table hoạt động tốt!")
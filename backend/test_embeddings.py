@@ -0,0 +1,180 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from google.api_core import exceptions as google_exceptions
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embeddings import BatchEmbedder, EmbeddingError, create_default_embedder
+from app.services.vector_store import SimpleVectorStore
+
+
+class StubEmbedder:
+    """Embedder local: vector xác định theo text, ghi lại từng batch đã gọi"""
+
+    model_name = "stub-embedding"
+
+    def __init__(self, dim=16, delay=0.0, failures=0, error=None):
+        self.dim = dim
+        self.delay = delay
+        self.failures = failures
+        self.error = error or google_exceptions.ResourceExhausted("429 quota exceeded")
+        self.batches = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def vector(self, text):
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        rng = np.random.default_rng(seed)
+        return rng.normal(size=self.dim).tolist()
+
+    def __call__(self, texts, task_type):
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise self.error
+            self.batches.append(list(texts))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return [self.vector(text) for text in texts]
+
+
+def test_batches_preserve_order():
+    stub = StubEmbedder()
+    embedder = BatchEmbedder(stub, batch_size=10, max_workers=4)
+
+    texts = [f"đoạn văn {i}" for i in range(95)]
+    vectors = embedder.embed(texts)
+
+    assert vectors.shape == (95, 16)
+    assert len(stub.batches) == 10
+    assert max(len(batch) for batch in stub.batches) == 10
+    for i in (0, 47, 94):
+        assert np.allclose(vectors[i], stub.vector(texts[i]))
+
+
+def test_batches_run_concurrently():
+    stub = StubEmbedder(delay=0.05)
+    embedder = BatchEmbedder(stub, batch_size=5, max_workers=4)
+
+    start = time.time()
+    embedder.embed([f"text {i}" for i in range(40)])
+    elapsed = time.time() - start
+
+    assert stub.max_active > 1
+    assert stub.max_active <= 4
+    assert elapsed < 8 * 0.05
+
+
+def test_retry_with_backoff_on_quota():
+    delays = []
+    stub = StubEmbedder(failures=3)
+    embedder = BatchEmbedder(stub, max_retries=5, base_delay=1.0, sleep=delays.append)
+
+    vectors = embedder.embed(["Độc lập là quyền thiêng liêng"])
+
+    assert vectors.shape == (1, 16)
+    assert len(delays) == 3
+    # Backoff tăng gấp đôi mỗi lần (jitter trong khoảng [0.5, 1.0])
+    for attempt, delay in enumerate(delays):
+        assert 0.5 * 2 ** attempt <= delay <= 2 ** attempt
+
+
+def test_gives_up_instead_of_fake_vector():
+    stub = StubEmbedder(failures=10)
+    embedder = BatchEmbedder(stub, max_retries=2, sleep=lambda _: None)
+
+    try:
+        embedder.embed(["text"])
+        assert False, "phải raise EmbeddingError"
+    except EmbeddingError:
+        pass
+
+
+def test_non_retryable_error_fails_fast():
+    delays = []
+    stub = StubEmbedder(failures=1, error=google_exceptions.InvalidArgument("bad request"))
+    embedder = BatchEmbedder(stub, sleep=delays.append)
+
+    try:
+        embedder.embed(["text"])
+        assert False, "phải raise EmbeddingError"
+    except EmbeddingError:
+        pass
+    assert delays == []
+
+
+def test_cache_skips_known_texts():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_path = os.path.join(cache_dir, "cache.sqlite3")
+        stub = StubEmbedder()
+        embedder = BatchEmbedder(stub, cache=EmbeddingCache(path=cache_path, max_memory_items=2))
+
+        first = embedder.embed(["a", "b", "a", "c"])
+        assert stub.batches == [["a", "b", "c"]]
+
+        # Khoảng trắng khác nhau vẫn cùng key; task_type khác thì khác key
+        again = embedder.embed(["a ", "  b", "c"])
+        assert len(stub.batches) == 1
+        assert np.allclose(again, first[[0, 1, 3]])
+        embedder.embed(["a"], task_type="retrieval_query")
+        assert stub.batches[-1] == ["a"]
+        embedder.close()
+
+        # Tầng disk: instance mới (RAM trống) không gọi lại embedder
+        fresh_stub = StubEmbedder()
+        fresh = BatchEmbedder(fresh_stub, cache=EmbeddingCache(path=cache_path))
+        assert np.allclose(fresh.embed(["b"]), first[[1]])
+        assert fresh_stub.batches == []
+        assert fresh.cache.get_stats()["disk_hits"] == 1
+        fresh.close()
+
+
+def test_missing_api_key_creates_no_cache_file():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_path = os.path.join(cache_dir, "embedding_cache.sqlite3")
+        saved = os.environ.pop("GEMINI_API_KEY", None)
+        try:
+            create_default_embedder(cache_path=cache_path)
+            assert False, "thiếu GEMINI_API_KEY phải báo lỗi"
+        except ValueError:
+            pass
+        finally:
+            if saved is not None:
+                os.environ["GEMINI_API_KEY"] = saved
+        assert not os.path.exists(cache_path)
+
+
+def test_vector_store_with_stub_embedder():
+    stub = StubEmbedder()
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(stub, batch_size=4))
+        texts = [f"Tài liệu số {i}" for i in range(10)]
+        store.add_documents(texts, [{"topic": "test"} for _ in texts])
+
+        # add_documents gọi embedder theo batch, không phải từng text
+        assert len(stub.batches) == 3
+
+        results = store.search("Tài liệu số 7", n_results=3)
+        assert results["documents"][0][0] == "Tài liệu số 7"
+        assert results["metadatas"][0][0] == {"topic": "test"}
+
+
+if __name__ == "__main__":
+    print("🧪 Testing batch embedding...")
+    test_batches_preserve_order()
+    test_batches_run_concurrently()
+    test_retry_with_backoff_on_quota()
+    test_gives_up_instead_of_fake_vector()
+    test_non_retryable_error_fails_fast()
+    test_cache_skips_known_texts()
+    test_missing_api_key_creates_no_cache_file()
+    test_vector_store_with_stub_embedder()
+    print("✅ Batch embedding hoạt động tốt!")
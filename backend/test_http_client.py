@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import httpx
+
+from app.services import http_client
+from app.services.crawler import Crawler
+from app.services.image_providers import ImageProvider
+from app.services.image_search_cache import ImageSearchCache
+from app.services.image_search_service import ImageSearchService
+
+
+class ConcurrencyProbe:
+    """Đếm số request đồng thời lớn nhất theo host"""
+
+    def __init__(self):
+        self.active = {}
+        self.peak = {}
+        self._lock = threading.Lock()
+
+    def enter(self, host):
+        with self._lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+
+    def leave(self, host):
+        with self._lock:
+            self.active[host] -= 1
+
+
+def test_sync_client_limits_requests_per_host():
+    probe = ConcurrencyProbe()
+
+    def handler(request):
+        probe.enter(request.url.host)
+        time.sleep(0.05)
+        probe.leave(request.url.host)
+        return httpx.Response(200, text="ok")
+
+    client = http_client.create_client(max_per_host=2, transport=httpx.MockTransport(handler))
+    urls = [f"https://{host}/{i}" for host in ("a.example", "b.example") for i in range(6)]
+    threads = [threading.Thread(target=client.get, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    client.close()
+
+    assert probe.peak == {"a.example": 2, "b.example": 2}
+    assert probe.active == {"a.example": 0, "b.example": 0}
+
+
+def test_async_client_limits_requests_per_host():
+    probe = ConcurrencyProbe()
+
+    async def handler(request):
+        probe.enter(request.url.host)
+        await asyncio.sleep(0.02)
+        probe.leave(request.url.host)
+        return httpx.Response(200, json={"ok": True})
+
+    async def burst():
+        async with http_client.create_async_client(max_per_host=3, transport=httpx.MockTransport(handler)) as client:
+            responses = await asyncio.gather(*[client.get(f"https://api.example/{i}") for i in range(10)])
+        return [response.json() for response in responses]
+
+    assert asyncio.run(burst()) == [{"ok": True}] * 10
+    assert probe.peak["api.example"] == 3
+
+
+def test_shared_async_client_lifecycle():
+    async def app_lifetime():
+        client = http_client.open_async_client()
+        assert http_client.get_async_client() is client
+        assert http_client.open_async_client() is client  # mở lại trong cùng loop: vẫn một client
+        await http_client.aclose()
+        assert client.is_closed and http_client.get_async_client() is None
+
+    asyncio.run(app_lifetime())
+    assert http_client.get_async_client() is None  # ngoài event loop
+
+    async def other_loop():
+        return http_client.get_async_client()
+
+    async def open_then_check_elsewhere():
+        http_client.open_async_client()
+        # Loop khác (vd asyncio.run trong thread) không được dùng client của loop app
+        result = []
+        thread = threading.Thread(target=lambda: result.append(asyncio.run(other_loop())))
+        thread.start()
+        thread.join()
+        await http_client.aclose()
+        return result[0]
+
+    assert asyncio.run(open_then_check_elsewhere()) is None
+
+
+class ClientRecorder(ImageProvider):
+    name = "google"
+
+    def __init__(self):
+        super().__init__()
+        self.clients = []
+
+    async def fetch(self, client, query, num_results):
+        self.clients.append(client)
+        return [{"url": f"https://example.com/{len(self.clients)}.jpg"}]
+
+
+def test_image_service_reuses_shared_client():
+    provider = ClientRecorder()
+    service = ImageSearchService(cache=ImageSearchCache(), providers=[provider])
+
+    async def requests_in_app():
+        shared = http_client.open_async_client()
+        await service.asearch_images("Bác Hồ ở Pháp")
+        await service.asearch_images("Bác Hồ với thiếu nhi")
+        await http_client.aclose()
+        return shared
+
+    shared = asyncio.run(requests_in_app())
+    assert provider.clients == [shared, shared]
+
+    # Gọi đồng bộ ngoài app: client tạm, đóng ngay sau khi dùng
+    service.search_images("Bác Hồ ở Việt Bắc")
+    assert provider.clients[-1] is not shared and provider.clients[-1].is_closed
+
+
+def test_crawler_uses_httpx_client():
+    def handler(request):
+        if request.url.path == "/robots.txt":
+            if request.url.host == "down.example":
+                raise httpx.ConnectError("không kết nối được", request=request)
+            return httpx.Response(200, text="User-agent: *\nDisallow: /private")
+        return httpx.Response(200, text=f"trang {request.url.path}")
+
+    client = http_client.create_client(transport=httpx.MockTransport(handler))
+    crawler = Crawler(client, domain_rate=100.0)
+    assert crawler.user_agent == http_client.USER_AGENT
+
+    urls = ["https://site.example/a", "https://site.example/private/b", "https://down.example/c"]
+    results = crawler.map(lambda url: client.get(url).text, urls)
+    client.close()
+
+    # robots.txt lỗi mạng (httpx.ConnectError) = cho phép
+    assert results == ["trang /a", None, "trang /c"]
+    assert crawler.stats["blocked_by_robots"] == 1
+
+
+if __name__ == "__main__":
+    print("🧪 Testing HTTP client...")
+    test_sync_client_limits_requests_per_host()
+    test_async_client_limits_requests_per_host()
+    test_shared_async_client_lifecycle()
+    test_image_service_reuses_shared_client()
+    test_crawler_uses_httpx_client()
+    print("✅ HTTP client hoạt động tốt!")
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from app.services.image_providers import CircuitBreaker, ImageProvider, ProviderFanout
+
+
+class FakeProvider(ImageProvider):
+    """Trả về sau delay giây; fail=True thì raise"""
+
+    def __init__(self, name, delay, fail=False, breaker=None):
+        super().__init__(breaker)
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.started = 0
+        self.finished = 0
+
+    async def fetch(self, client, query, num_results):
+        self.started += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("upstream lỗi")
+        self.finished += 1
+        return [{"url": f"https://{self.name}.example/{query}.jpg"}]
+
+
+def run(fanout, query="hcm"):
+    start = time.monotonic()
+    result = asyncio.run(fanout.search(None, query, 5))
+    return result, time.monotonic() - start
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    google, pexels = FakeProvider("google", 1.0), FakeProvider("pexels", 0.02)
+    result, elapsed = run(ProviderFanout([google, pexels], hedge_delay=0.05))
+    assert result[0] == "pexels" and elapsed < 0.5
+    assert google.started == 1 and google.finished == 0 and google.stats.cancelled == 1
+
+
+def test_fast_primary_wins_without_hedging():
+    google, pexels = FakeProvider("google", 0.01), FakeProvider("pexels", 0.01)
+    result, _ = run(ProviderFanout([google, pexels], hedge_delay=0.5))
+    assert result[0] == "google" and pexels.started == 0
+
+
+def test_failed_primary_falls_through_immediately():
+    google, pexels = FakeProvider("google", 0.01, fail=True), FakeProvider("pexels", 0.01)
+    result, elapsed = run(ProviderFanout([google, pexels], hedge_delay=5.0))
+    assert result[0] == "pexels" and elapsed < 1.0
+    stats = google.get_stats()
+    assert stats["errors"] == 1 and stats["error_rate"] == 1.0 and stats["latency_p50"] is not None
+
+
+def test_fan_out_all_when_hedge_delay_is_zero():
+    google, pexels = FakeProvider("google", 0.2), FakeProvider("pexels", 0.01)
+    result, _ = run(ProviderFanout([google, pexels], hedge_delay=0))
+    assert result[0] == "pexels" and google.started == 1
+
+
+def test_circuit_breaker_skips_failing_provider():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+    google = FakeProvider("google", 0.0, fail=True, breaker=breaker)
+    pexels = FakeProvider("pexels", 0.0)
+    fanout = ProviderFanout([google, pexels], hedge_delay=5.0)
+    for _ in range(2):
+        run(fanout)
+    assert breaker.state == "open"
+
+    run(fanout)
+    assert google.started == 2  # bị bỏ qua khi open
+
+    now[0] += 31
+    assert breaker.state == "half_open"
+    google.fail = False
+    result, _ = run(fanout)
+    assert result[0] == "google" and breaker.state == "closed"
+
+
+if __name__ == "__main__":
+    print("🧪 Testing image providers...")
+    test_slow_primary_is_hedged_and_cancelled()
+    test_fast_primary_wins_without_hedging()
+    test_failed_primary_falls_through_immediately()
+    test_fan_out_all_when_hedge_delay_is_zero()
+    test_circuit_breaker_skips_failing_provider()
+    print("✅ Image providers hoạt động tốt!")
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from app.services.image_providers import ImageProvider
+from app.services.image_search_cache import ImageSearchCache
+from app.services.image_search_service import ImageSearchService
+
+IMAGES = [{"url": "https://example.com/hcm-paris.jpg", "title": "Hồ Chí Minh ở Pháp"}]
+
+
+class FakeGoogle(ImageProvider):
+    """Google giả lập: đếm số lần gọi upstream, chậm để các request chồng lên nhau"""
+
+    name = "google"
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    async def fetch(self, client, query, num_results):
+        with self._lock:
+            self.calls += 1
+        await asyncio.sleep(0.1)
+        return [] if self.fail else IMAGES[:num_results]
+
+
+class FakeImageSearch(ImageSearchService):
+    def __init__(self, cache, fail=False):
+        self.google = FakeGoogle(fail)
+        super().__init__(cache=cache, providers=[self.google])
+
+    @property
+    def calls(self):
+        return self.google.calls
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    service = FakeImageSearch(ImageSearchCache())
+    queries = ["Hồ Chí Minh ở Pháp", "cho tôi xem ảnh hồ chí minh ở pháp", "Bác Hồ tại Pháp"] * 4
+    results = [None] * len(queries)
+
+    def search(i):
+        results[i] = service.search_images(queries[i], 5)
+
+    threads = [threading.Thread(target=search, args=(i,)) for i in range(len(queries))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Cả 3 cách hỏi cùng ra một query đã tối ưu -> một lời gọi Google
+    assert service.calls == 1
+    assert all(result == IMAGES for result in results)
+    stats = service.get_stats()["cache"]
+    assert stats["upstream_calls"] == 1 and stats["coalesced"] + stats["hits"] == len(queries) - 1
+
+    service.search_images("Hồ Chí Minh ở Pháp", 3)  # num_results khác -> key khác
+    assert service.calls == 2
+
+
+def test_async_requests_are_coalesced():
+    service = FakeImageSearch(ImageSearchCache())
+
+    async def burst():
+        return await asyncio.gather(*[service.asearch_images("Bác Hồ ở Pháp", 5) for _ in range(10)])
+
+    assert all(result == IMAGES for result in asyncio.run(burst()))
+    assert service.calls == 1 and service.get_stats()["cache"]["coalesced"] == 9
+
+
+def test_fallback_is_not_cached():
+    service = FakeImageSearch(ImageSearchCache(), fail=True)
+    first = service.search_images("Hồ Chí Minh ở Pháp")
+    assert first and first[0]["source"] == "Sample Image"
+    service.search_images("Hồ Chí Minh ở Pháp")
+    assert service.calls == 2
+
+
+def test_ttl_and_disk_tier():
+    now = [1000.0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image_cache.sqlite3")
+        cache = ImageSearchCache(path=path, ttl=60, clock=lambda: now[0])
+        cache.set("5:Ho Chi Minh", IMAGES)
+        cache.close()
+
+        # Process mới: RAM trống, đọc lại từ disk
+        cache = ImageSearchCache(path=path, ttl=60, clock=lambda: now[0])
+        assert cache.get("5:Ho Chi Minh") == IMAGES and cache.disk_hits == 1
+
+        now[0] += 61
+        assert cache.get("5:Ho Chi Minh") is None
+        assert cache.get_or_search("5:Ho Chi Minh", lambda: IMAGES) == IMAGES
+        assert cache.get_stats()["upstream_calls"] == 1
+        cache.close()
+
+
+class RecordingCache(ImageSearchCache):
+    """Ghi lại thread đã chạm vào SQLite"""
+
+    def __init__(self, *args, **kwargs):
+        self.disk_threads = []
+        super().__init__(*args, **kwargs)
+
+    def _get_from_disk(self, key):
+        self.disk_threads.append(threading.get_ident())
+        return super()._get_from_disk(key)
+
+    def _set_on_disk(self, key, images):
+        self.disk_threads.append(threading.get_ident())
+        return super()._set_on_disk(key, images)
+
+
+def test_async_disk_tier_runs_off_event_loop():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image_cache.sqlite3")
+        service = FakeImageSearch(RecordingCache(path=path))
+
+        async def search_twice():
+            loop_thread = threading.get_ident()
+            first = await service.asearch_images("Bác Hồ ở Pháp", 5)
+            # Process mới: RAM trống, đọc lại từ disk
+            service.cache.close()
+            service.cache = RecordingCache(path=path)
+            second = await service.asearch_images("Bác Hồ ở Pháp", 5)
+            return loop_thread, first, second
+
+        loop_thread, first, second = asyncio.run(search_twice())
+        assert first == second == IMAGES and service.calls == 1
+        assert service.cache.disk_hits == 1
+        assert service.cache.disk_threads and loop_thread not in service.cache.disk_threads
+        service.cache.close()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing image search cache...")
+    test_concurrent_identical_requests_are_coalesced()
+    test_async_requests_are_coalesced()
+    test_fallback_is_not_cached()
+    test_ttl_and_disk_tier()
+    test_async_disk_tier_runs_off_event_loop()
+    print("✅ Image search cache hoạt động tốt!")
@@ -0,0 +1,103 @@
+import json
+import os
+import random
+import tempfile
+
+from app.ingest import IngestPipeline, html_to_text, iter_files
+from app.services.embeddings import BatchEmbedder, EmbeddingError
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+WORDS = ("dân nước đảng độc lập tự do hạnh phúc đạo đức cách mạng đoàn kết thanh niên học tập lao động "
+         "kháng chiến kiến quốc văn hóa giáo dục nhân dân chính phủ quân đội").split()
+PARAGRAPH = "Đạo đức cách mạng không phải là từ trời rơi xuống. Nó do đấu tranh và giáo dục hằng ngày mà có."
+
+
+def write_corpus(folder):
+    os.makedirs(os.path.join(folder, "html"))
+    with open(os.path.join(folder, "toan_tap_5.txt"), "w", encoding="utf-8") as f:
+        rng = random.Random(0)
+        for i in range(30):
+            # Các đoạn khác nhau thật sự (không bị loại vì gần trùng)
+            f.write(f"Đoạn {i}. " + " ".join(rng.choice(WORDS) for _ in range(25)) + ".\n\n")
+    with open(os.path.join(folder, "html", "bai_viet.html"), "w", encoding="utf-8") as f:
+        f.write("<html><head><title>Bài viết</title><script>var x;</script></head><body>"
+                "<nav>Menu</nav><article><h1>Độc lập</h1><p>Không có gì quý hơn độc lập, tự do.</p>"
+                f"<p>{PARAGRAPH}</p></article></body></html>")
+    with open(os.path.join(folder, "trich_dan.jsonl"), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "q1", "text": "Dân là gốc.", "topic": "đảng-dân"}, ensure_ascii=False) + "\n")
+        f.write("{json hỏng\n")
+        f.write(json.dumps({"text": PARAGRAPH, "metadata": {"topic": "đạo đức"}}, ensure_ascii=False) + "\n")
+    with open(os.path.join(folder, "anh.png"), "wb") as f:
+        f.write(b"\x89PNG")
+
+
+class FlakyEmbedder(StubEmbedder):
+    """Lỗi không retry được sau fail_after lần gọi (giả lập bị ngắt giữa chừng)"""
+
+    def __init__(self, fail_after):
+        super().__init__()
+        self.fail_after = fail_after
+
+    def __call__(self, texts, task_type):
+        if len(self.batches) >= self.fail_after:
+            raise ValueError("mất kết nối")
+        return super().__call__(texts, task_type)
+
+
+def test_html_to_text_keeps_blocks():
+    title, text = html_to_text("<html><title>T</title><body><nav>Menu</nav><p>Một.</p><p>Hai.</p></body></html>")
+    assert title == "T"
+    assert text == "Một.\n\nHai."
+
+
+def test_pipeline_ingests_dedups_and_resumes():
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "docs")
+        write_corpus(folder)
+        assert [os.path.basename(p) for p in iter_files(folder)] == ["toan_tap_5.txt", "trich_dan.jsonl",
+                                                                      "bai_viet.html"]
+        storage = os.path.join(tmp, "store")
+
+        # Lần 1: lỗi sau 2 batch -> raise, file đã xong vẫn nằm trong checkpoint
+        flaky = FlakyEmbedder(fail_after=2)
+        store = SimpleVectorStore(storage_path=storage, embedder=BatchEmbedder(flaky, max_retries=0))
+        try:
+            IngestPipeline(store, workers=2, batch_size=4, max_tokens=30, overlap_tokens=0).run(folder)
+            assert False, "phải raise"
+        except EmbeddingError:
+            pass
+        partial = store.get_collection_count()
+        assert 0 < partial
+        written = set(store.documents)
+
+        # Lần 2: tiếp tục, chunk đã ghi không embed lại
+        stub = StubEmbedder()
+        store = SimpleVectorStore(storage_path=storage, embedder=BatchEmbedder(stub))
+        stats = IngestPipeline(store, workers=3, batch_size=4, max_tokens=30, overlap_tokens=0).run(folder)
+        assert stats["files"] == 3
+        embedded = [text for batch in stub.batches for text in batch]
+        assert embedded and written.isdisjoint(embedded)
+        assert len(embedded) == store.get_collection_count() - partial
+
+        ids = set(store.ids)
+        assert "q1#0" in ids
+        row = store.ids.index("q1#0")
+        assert store.metadatas[row]["topic"] == "đảng-dân" and store.metadatas[row]["line"] == 1
+        html_rows = [m for m in store.metadatas if m["source"] == os.path.join("html", "bai_viet.html")]
+        assert html_rows and html_rows[0]["document"] == "Bài viết"
+        # Đoạn trùng nội dung giữa jsonl và html chỉ lưu một lần
+        assert len(store.documents) == len(set(store.documents))
+
+        # Lần 3: mọi file đã trong checkpoint
+        stub = StubEmbedder()
+        store = SimpleVectorStore(storage_path=storage, embedder=BatchEmbedder(stub))
+        stats = IngestPipeline(store, workers=2).run(folder)
+        assert stats["files_skipped"] == 3 and not stub.batches
+
+
+if __name__ == "__main__":
+    print("🧪 Testing ingest pipeline...")
+    test_html_to_text_keeps_blocks()
+    test_pipeline_ingests_dedups_and_resumes()
+    print("✅ Ingest pipeline hoạt động tốt!")
@@ -0,0 +1,99 @@
+import os
+import tempfile
+
+from app.services.embeddings import BatchEmbedder
+from app.services.lexical_index import BM25Index, fold_diacritics, reciprocal_rank_fusion, tokenize
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+DOCUMENTS = [
+    "Tuyên ngôn độc lập được đọc tại Quảng trường Ba Đình năm 1945",
+    "Tư tưởng Hồ Chí Minh về đạo đức cách mạng: cần, kiệm, liêm, chính",
+    "Hồ Chí Minh ra đi tìm đường cứu nước năm 1911 từ bến Nhà Rồng",
+    "Đại đoàn kết dân tộc là chiến lược của cách mạng Việt Nam",
+]
+
+
+def test_tokenize_and_fold():
+    assert tokenize("Độc Lập") == ["độc", "lập", "độc_lập"]
+    assert fold_diacritics("đạo đức cách mạng") == "dao duc cach mang"
+
+
+def test_bm25_ranking_and_unaccented_query():
+    index = BM25Index()
+    for row, text in enumerate(DOCUMENTS):
+        index.add(row, text)
+
+    rows, scores = index.search("năm 1911 bến Nhà Rồng", 2)
+    assert rows[0] == 2 and scores[0] > scores[1]
+
+    # Gõ không dấu vẫn khớp term có dấu
+    rows, _ = index.search("dao duc cach mang", 1)
+    assert rows[0] == 1
+
+    # Upsert: posting cũ bị xóa
+    index.update(2, DOCUMENTS[2], "Nội dung mới không liên quan")
+    rows, _ = index.search("Nhà Rồng", 4)
+    assert 2 not in rows
+
+
+def test_bm25_persistence_roundtrip():
+    index = BM25Index()
+    for row, text in enumerate(DOCUMENTS):
+        index.add(row, text)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bm25.npz")
+        with open(path, "wb") as f:
+            assert index.save(f)
+        loaded = BM25Index()
+        loaded.load(path)
+    assert len(loaded) == len(index)
+    assert list(loaded.search("Ba Đình 1945", 3)[0]) == list(index.search("Ba Đình 1945", 3)[0])
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [row for row, _ in fused] == [1, 3, 2]
+
+
+def test_store_hybrid_search_and_reload():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()), hybrid=True)
+        store.add_documents(DOCUMENTS[:2], [{"topic": "a"}] * 2)
+        store.save_data()
+        store.add_documents(DOCUMENTS[2:], [{"topic": "b"}] * 2)  # nằm trong WAL
+
+        # Embedding stub là ngẫu nhiên: chỉ BM25 mới đưa được đúng document lên đầu
+        results = store.search("bến Nhà Rồng năm 1911", n_results=2)
+        assert results["documents"][0][0] == DOCUMENTS[2]
+
+        reloaded = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()), hybrid=True)
+        assert len(reloaded.lexical_index) == len(DOCUMENTS)
+        results = reloaded.search("Quảng trường Ba Đình", n_results=1)
+        assert results["documents"][0][0] == DOCUMENTS[0]
+        assert len(results["distances"][0]) == 1
+
+
+def test_unaccented_query_after_upsert():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()), hybrid=True)
+        store.add_documents(DOCUMENTS, [{"topic": "a"}] * len(DOCUMENTS), ids=["a", "b", "c", "d"])
+
+        # "Bến Nhà Rồng" biến mất khỏi mọi document: query không dấu không được trỏ tới term đã xóa
+        store.add_documents(["Người ra đi tìm đường cứu nước từ cảng Sài Gòn"], [{"topic": "a"}], ids=["c"])
+        assert "ben" not in store.lexical_index._folded
+        results = store.search("ben nha rong", n_results=2)
+        assert len(results["documents"][0]) == 2
+        assert store.lexical_index.search("ben nha rong", 5)[0].size == 0
+        assert list(store.lexical_index.search("cang sai gon", 1)[0]) == [2]
+
+
+if __name__ == "__main__":
+    print("🧪 Testing lexical index...")
+    test_tokenize_and_fold()
+    test_bm25_ranking_and_unaccented_query()
+    test_bm25_persistence_roundtrip()
+    test_reciprocal_rank_fusion()
+    test_store_hybrid_search_and_reload()
+    test_unaccented_query_after_upsert()
+    print("✅ Lexical index hoạt động tốt!")
@@ -0,0 +1,110 @@
+import tempfile
+
+from app.services.embeddings import BatchEmbedder
+from app.services.metadata_index import MetadataIndex, matches
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+METADATAS = [
+    {"topic": "độc lập", "source_type": "primary_source", "credibility_score": 100, "document": "Tuyên ngôn độc lập"},
+    {"topic": "đạo đức", "source_type": "official", "credibility_score": 100, "document": "Sửa đổi lối làm việc"},
+    {"topic": "đạo đức", "source_type": "primary_source", "credibility_score": 95, "document": "Di chúc"},
+    {"topic": "đạo đức", "source_type": "web", "credibility_score": 70, "document": "Bài báo", "year": 2020},
+]
+
+
+def build_index():
+    index = MetadataIndex()
+    index.rebuild(METADATAS)
+    return index
+
+
+def brute_force(where):
+    return [i for i, metadata in enumerate(METADATAS) if matches(metadata, where)]
+
+
+def test_filter_matches_brute_force():
+    index = build_index()
+    cases = [
+        {"topic": "đạo đức"},
+        {"source_type": "primary_source", "credibility_score": {"$gte": 90}, "topic": "đạo đức"},
+        {"credibility_score": {"$gt": 70, "$lt": 100}},
+        {"credibility_score": {"$lte": 95}},
+        {"source_type": {"$in": ["official", "web"]}},
+        {"source_type": {"$nin": ["web"]}, "topic": {"$ne": "độc lập"}},
+        {"year": {"$gte": 2000}},  # trường không được index
+    ]
+    for where in cases:
+        assert list(index.filter(where, METADATAS)) == brute_force(where), where
+
+
+def test_update_moves_row_between_postings():
+    index = build_index()
+    index.update(3, METADATAS[3], {**METADATAS[3], "source_type": "official"})
+    assert list(index.filter({"source_type": "web"}, METADATAS)) == []
+    assert list(index.filter({"source_type": "official"}, METADATAS)) == [1, 3]
+
+
+def test_unknown_operator():
+    try:
+        build_index().filter({"credibility_score": {"$regex": "9"}}, METADATAS)
+        assert False, "phải raise ValueError"
+    except ValueError:
+        pass
+
+
+def test_in_requires_a_collection():
+    for operand in ("web", 100, None):
+        try:
+            build_index().filter({"source_type": {"$in": operand}}, METADATAS)
+            assert False, f"$in {operand!r} phải raise ValueError"
+        except ValueError:
+            pass
+    assert list(build_index().filter({"source_type": {"$nin": ("web", "official")}}, METADATAS)) == [0, 2]
+
+
+def test_bool_and_int_are_distinct_values():
+    metadatas = [{"topic": True}, {"topic": 1}, {"topic": 1.0}, {"topic": False}, {"topic": 0}]
+    index = MetadataIndex()
+    index.rebuild(metadatas)
+    cases = [({"topic": True}, [0]), ({"topic": 1}, [1, 2]), ({"topic": {"$in": [False]}}, [3]),
+             ({"topic": {"$nin": [0]}}, [0, 1, 2, 3]), ({"topic": {"$gte": 0}}, [1, 2, 4])]
+    for where, expected in cases:
+        assert list(index.filter(where, metadatas)) == expected, where
+        # Trường không được index cho cùng kết quả
+        assert [i for i, metadata in enumerate(metadatas)
+                if matches({"flag": metadata["topic"]}, {"flag": where["topic"]})] == expected, where
+
+    index.update(0, metadatas[0], {"topic": 1})
+    assert list(index.filter({"topic": True}, metadatas)) == []
+    assert list(index.filter({"topic": 1}, metadatas)) == [0, 1, 2]
+
+
+def test_store_search_with_where():
+    texts = [f"Đoạn trích số {i} về tư tưởng Hồ Chí Minh" for i in range(len(METADATAS))]
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()))
+        store.add_documents(texts, METADATAS)
+
+        where = {"source_type": "primary_source", "credibility_score": {"$gte": 90}, "topic": "đạo đức"}
+        results = store.search("đạo đức cách mạng", n_results=3, where=where)
+        assert results["documents"][0] == [texts[2]]
+
+        results = store.search("đạo đức", n_results=5, where={"topic": "giáo dục"})
+        assert results["documents"][0] == []
+
+        # Metadata index được build lại khi load
+        reloaded = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()))
+        results = reloaded.search("tư tưởng", n_results=5, where={"credibility_score": {"$lt": 100}})
+        assert sorted(results["documents"][0]) == [texts[2], texts[3]]
+
+
+if __name__ == "__main__":
+    print("🧪 Testing metadata index...")
+    test_filter_matches_brute_force()
+    test_update_moves_row_between_postings()
+    test_unknown_operator()
+    test_in_requires_a_collection()
+    test_bool_and_int_are_distinct_values()
+    test_store_search_with_where()
+    print("✅ Metadata index hoạt động tốt!")
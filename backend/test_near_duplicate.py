@@ -0,0 +1,142 @@
+import json
+import os
+import random
+import tempfile
+
+from app.services.embeddings import BatchEmbedder
+from app.services.enhanced_rag_service import EnhancedRAGService
+from app.services.near_duplicate import NearDuplicateIndex
+from app.services.text_chunker import chunk_text
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+# Cùng một đoạn trích, chỉ khác dấu câu và một chữ
+SHORT = "Không có gì quý hơn độc lập, tự do. Độc lập là quyền thiêng liêng bất khả xâm phạm của mọi dân tộc trên thế giới."
+LONG = "Không có gì quý hơn độc lập tự do! Độc lập là quyền thiêng liêng, bất khả xâm phạm của mọi dân tộc trên toàn thế giới."
+EXCERPT = "Độc lập là quyền thiêng liêng của mọi dân tộc"
+OTHER = "Đạo đức cách mạng không phải là từ trời rơi xuống. Nó do đấu tranh và giáo dục hằng ngày mà có."
+
+WORDS = ("dân nước đảng độc lập tự do hạnh phúc đạo đức cách mạng đoàn kết thanh niên học tập lao động "
+         "kháng chiến kiến quốc văn hóa giáo dục nhân dân chính phủ quân đội").split()
+
+
+def random_corpus(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(40)) for _ in range(n)]
+
+
+def test_near_verbatim_copies_are_duplicates_but_excerpts_are_not():
+    index = NearDuplicateIndex()
+    texts = [SHORT, OTHER]
+    for row, text in enumerate(texts):
+        index.add(row, text)
+    row, score = index.find(LONG, texts.__getitem__)
+    assert row == 0 and score >= 0.8
+    # Đoạn ngắn nằm trong đoạn dài là nội dung riêng (vd chunk cuối chủ yếu là overlap), không phải bản trùng
+    assert index.find(EXCERPT, texts.__getitem__) is None
+    assert index.find("Dân là gốc, có gốc vững thì nước mới êm.", texts.__getitem__) is None
+    assert index.find(LONG, texts.__getitem__, skip=lambda row: row == 0) is None
+
+
+def test_every_chunk_of_a_document_is_stored():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()), dedup=True)
+        total = 0
+        for seed in range(40):
+            rng = random.Random(seed)
+            text = " ".join(" ".join(rng.choice(WORDS) for _ in range(5)).capitalize() + "." for _ in range(41))
+            chunks = list(chunk_text(text))
+            total += len(chunks)
+            store.add_documents([chunk.text for chunk in chunks],
+                                [{"source": f"bai_{seed}.txt", **chunk.metadata()} for chunk in chunks])
+            assert store.get_collection_count() == total, seed
+
+
+def test_lookup_only_verifies_few_candidates():
+    corpus = random_corpus(3000)
+    index = NearDuplicateIndex()
+    index.rebuild(corpus)
+    probe = corpus[1234].replace(WORDS[0], "nhân dân", 1)
+    assert index.find(probe, corpus.__getitem__)[0] == 1234
+    assert len(index.candidates(index.shingles(probe))) < 300
+
+
+def test_store_keeps_highest_credibility_copy():
+    with tempfile.TemporaryDirectory() as storage_path:
+        stub = StubEmbedder()
+        store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(stub), dedup=True)
+        store.add_documents([SHORT, OTHER], [{"credibility_score": 70}, {"credibility_score": 95}], ids=["a", "b"])
+
+        # Bản dài đáng tin hơn thay thế bản ngắn ngay trên dòng cũ
+        store.add_documents([LONG], [{"credibility_score": 100}], ids=["c"])
+        assert store.ids == ["c", "b"] and store.documents[0] == LONG
+        assert not store.contains("a")
+
+        # Bản kém tin cậy hơn bị bỏ, không tốn embedding
+        embedded = len(stub.batches)
+        assert store.is_near_duplicate(SHORT, {"credibility_score": 80})
+        store.add_documents([SHORT], [{"credibility_score": 80}], ids=["d"])
+        assert store.get_collection_count() == 2 and len(stub.batches) == embedded
+
+        # Gần trùng trong cùng một batch: chỉ giữ một bản
+        extra = "Đoàn kết, đoàn kết, đại đoàn kết. Thành công, thành công, đại thành công."
+        store.add_documents([extra, extra + " mãi"], [{"credibility_score": 90}, {"credibility_score": 60}],
+                            ids=["e", "f"])
+        assert store.contains("e") and not store.contains("f")
+
+        results = store.search("độc lập", n_results=1)
+        assert results["documents"][0][0] == LONG
+
+        # Index gần trùng được build lại khi load
+        reloaded = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()), dedup=True)
+        assert reloaded.ids == ["c", "b", "e"]
+        assert reloaded.is_near_duplicate(SHORT, {"credibility_score": 100})  # bằng điểm: giữ bản dài hơn
+        assert not reloaded.is_near_duplicate("Dân là gốc, có gốc vững thì nước mới êm.", {})
+
+
+def storage_state(storage):
+    """mtime + kích thước mọi file trong store (phát hiện ghi disk)"""
+    return {name: (os.stat(os.path.join(storage, name)).st_mtime_ns, os.path.getsize(os.path.join(storage, name)))
+            for name in sorted(os.listdir(storage))}
+
+
+def test_corpus_bootstrap_after_legacy_migration_is_idempotent():
+    with tempfile.TemporaryDirectory() as storage:
+        stub = StubEmbedder()
+        docs, metadatas, _ = EnhancedRAGService.get_comprehensive_hcm_corpus(None)
+        # data.json cũ: cùng các đoạn corpus, ID doc_N
+        with open(os.path.join(storage, "data.json"), "w", encoding="utf-8") as f:
+            json.dump({"documents": docs, "metadatas": metadatas,
+                       "embeddings": [stub.vector(doc) for doc in docs]}, f, ensure_ascii=False)
+
+        store = SimpleVectorStore(storage_path=storage, embedder=BatchEmbedder(stub))
+        service = EnhancedRAGService(vector_store=store)
+        service.update_knowledge_base()
+        # Corpus thay thế các bản doc_N, không bị loại vì gần trùng
+        assert store.get_collection_count() == len(docs)
+        assert all(doc_id.startswith("hcm_") for doc_id in store.ids)
+        last_update = service.last_update
+
+        service.update_knowledge_base()
+        assert service.last_update == last_update
+
+        # Khởi động lại: không embed, không ghi gì xuống disk
+        before = storage_state(storage)
+        stub = StubEmbedder()
+        store = SimpleVectorStore(storage_path=storage, embedder=BatchEmbedder(stub))
+        service = EnhancedRAGService(vector_store=store)
+        revision = store.revision
+        service.update_knowledge_base()
+        assert not stub.batches and store.revision == revision
+        assert service.last_update == last_update
+        assert storage_state(storage) == before
+
+
+if __name__ == "__main__":
+    print("🧪 Testing near-duplicate detection...")
+    test_near_verbatim_copies_are_duplicates_but_excerpts_are_not()
+    test_every_chunk_of_a_document_is_stored()
+    test_lookup_only_verifies_few_candidates()
+    test_store_keeps_highest_credibility_copy()
+    test_corpus_bootstrap_after_legacy_migration_is_idempotent()
+    print("✅ Near-duplicate detection hoạt động tốt!")
@@ -0,0 +1,99 @@
+import asyncio
+import tempfile
+import threading
+from types import SimpleNamespace
+
+from app.services.embeddings import BatchEmbedder
+from app.services.enhanced_rag_service import EnhancedRAGService
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+
+class StubModel:
+    """Model local: stream các đoạn cho sẵn; gate (nếu có) giữ thread trước đoạn thứ hai"""
+
+    def __init__(self, parts, gate=None):
+        self.parts = parts
+        self.gate = gate
+        self.waiting = threading.Event()
+        self.closed = threading.Event()
+
+    def generate_content(self, prompt, stream=False):
+        def chunks():
+            try:
+                for i, text in enumerate(self.parts):
+                    if i == 1 and self.gate is not None:
+                        self.waiting.set()
+                        self.gate.wait(5)
+                    yield SimpleNamespace(text=text)
+            finally:
+                self.closed.set()
+        return chunks()
+
+
+def open_service(storage_path, model):
+    store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()))
+    docs, metadatas, ids = EnhancedRAGService.get_comprehensive_hcm_corpus(None)
+    store.add_documents(docs, metadatas, ids=ids)
+    service = EnhancedRAGService(vector_store=store)
+    service.model = model
+    return service
+
+
+def test_stream_events_in_order():
+    async def collect(service):
+        return [event async for event in service.astream_response_with_sources("Độc lập là gì?")]
+
+    with tempfile.TemporaryDirectory() as storage_path:
+        service = open_service(storage_path, StubModel(["Độc lập ", "là quyền ", "thiêng liêng."]))
+        try:
+            events = asyncio.run(collect(service))
+        finally:
+            service.shutdown()
+
+    names = [name for name, _ in events]
+    assert names == ["sources", "token", "token", "token", "done"], names
+    assert events[0][1]["sources"]
+    done = events[-1][1]
+    assert done["answer"] == "Độc lập là quyền thiêng liêng."
+    assert done["sources"] == events[0][1]["sources"]
+
+
+def test_disconnect_while_generating_closes_stream():
+    gate = threading.Event()
+    model = StubModel(["Độc lập ", "là quyền ", "thiêng liêng."], gate=gate)
+
+    async def disconnect(service):
+        stream = service.astream_response_with_sources("Độc lập là gì?")
+        assert (await stream.__anext__())[0] == "sources"
+        assert (await stream.__anext__())[0] == "token"
+
+        # Thread đang kẹt trong next(events) thì client ngắt kết nối
+        pending = asyncio.ensure_future(stream.__anext__())
+        while not model.waiting.is_set():
+            await asyncio.sleep(0.01)
+        pending.cancel()
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        try:
+            await pending
+            assert False, "task bị hủy phải raise CancelledError"
+        except asyncio.CancelledError:
+            pass
+
+    with tempfile.TemporaryDirectory() as storage_path:
+        service = open_service(storage_path, model)
+        try:
+            asyncio.run(disconnect(service))
+        finally:
+            gate.set()
+            service.shutdown()
+
+    # Generator được đóng sau khi bước next() dang dở chạy xong: stream Gemini cũng dừng
+    assert model.closed.is_set()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing RAG streaming...")
+    test_stream_events_in_order()
+    test_disconnect_while_generating_closes_stream()
+    print("✅ RAG streaming hoạt động tốt!")
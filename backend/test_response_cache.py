@@ -0,0 +1,111 @@
+import numpy as np
+
+from app.services.cache import TTLCache
+from app.services.response_cache import ResponseCache, normalize_question
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_lru_and_expiry():
+    clock = FakeClock()
+    cache = TTLCache(max_size=2, ttl=10, clock=clock)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # "b" ít dùng nhất -> bị loại
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.get_stats()["hits"] == 2
+
+
+def test_normalize_question():
+    assert normalize_question("Đạo đức cách mạng là gì?") == normalize_question("  đạo đức   cách mạng là gì ")
+
+
+def test_exact_hit_and_version_invalidation():
+    cache = ResponseCache(max_size=10, ttl=60)
+    result = {"answer": "Độc lập là quyền thiêng liêng", "sources": [], "confidence": 100}
+
+    assert cache.get("Độc lập dân tộc?", "v1") == (None, None)
+    cache.set("Độc lập dân tộc?", "v1", result)
+    cached, _ = cache.get("độc lập dân tộc", "v1")
+    assert cached == result
+
+    # Knowledge base đổi phiên bản -> toàn bộ cache cũ bị bỏ
+    cached, _ = cache.get("độc lập dân tộc", "v2")
+    assert cached is None
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_stale_set_does_not_roll_back_version():
+    cache = ResponseCache(max_size=10, ttl=60, similarity_threshold=0.9)
+    old = {"answer": "cũ", "sources": [], "confidence": 50}
+    new = {"answer": "mới", "sources": [], "confidence": 100}
+
+    cache.get("độc lập dân tộc", "v1")
+    cache.get("đạo đức cách mạng", "v2")
+    cache.set("đạo đức cách mạng", "v2", new, query_embedding=np.array([1.0, 0.0]))
+
+    # Request bắt đầu ở v1 trả kết quả muộn: bỏ qua, không xóa cache v2
+    cache.set("độc lập dân tộc", "v1", old, query_embedding=np.array([0.0, 1.0]))
+    assert cache.get("đạo đức cách mạng", "v2")[0] == new
+    assert cache.get("độc lập dân tộc", "v2", embed_query=lambda q: np.array([0.0, 1.0]))[0] is None
+    assert cache.get_stats()["invalidations"] == 0
+
+    # Đổi phiên bản: tầng semantic cũng bị xóa
+    cache.get("độc lập dân tộc", "v3")
+    assert cache._vectors == {} and cache._matrix is None
+
+
+def test_semantic_hit_above_threshold():
+    vectors = {
+        "tư tưởng về đạo đức cách mạng": np.array([1.0, 0.0, 0.0]),
+        "đạo đức cách mạng theo Hồ Chí Minh": np.array([0.99, 0.1, 0.0]),
+        "độc lập dân tộc": np.array([0.0, 1.0, 0.0]),
+    }
+    calls = []
+
+    def embed(question):
+        calls.append(question)
+        return vectors[question]
+
+    cache = ResponseCache(max_size=10, ttl=60, similarity_threshold=0.95)
+    result = {"answer": "Đạo đức cách mạng...", "sources": [], "confidence": 100}
+
+    _, embedding = cache.get("tư tưởng về đạo đức cách mạng", "v1", embed_query=embed)
+    cache.set("tư tưởng về đạo đức cách mạng", "v1", result, query_embedding=embedding)
+
+    # Exact hit không cần embedding
+    cached, _ = cache.get("Tư tưởng về đạo đức cách mạng?", "v1", embed_query=embed)
+    assert cached == result
+    assert len(calls) == 1
+
+    cached, _ = cache.get("đạo đức cách mạng theo Hồ Chí Minh", "v1", embed_query=embed)
+    assert cached == result
+    cached, _ = cache.get("độc lập dân tộc", "v1", embed_query=embed)
+    assert cached is None
+
+    stats = cache.get_stats()
+    assert stats["exact_hits"] == 1
+    assert stats["semantic_hits"] == 1
+    assert stats["misses"] == 2
+
+
+if __name__ == "__main__":
+    print("🧪 Testing response cache...")
+    test_ttl_cache_lru_and_expiry()
+    test_normalize_question()
+    test_exact_hit_and_version_invalidation()
+    test_stale_set_does_not_roll_back_version()
+    test_semantic_hit_above_threshold()
+    print("✅ Response cache hoạt động tốt!")
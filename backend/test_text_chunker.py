@@ -0,0 +1,80 @@
+import io
+import tempfile
+
+from app.services.embeddings import BatchEmbedder
+from app.services.enhanced_rag_service import EnhancedRAGService
+from app.services.text_chunker import chunk_text, iter_sentences
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+TEXT = """Năm 1911, Người ra đi tìm đường cứu nước từ bến Nhà Rồng, TP. Hồ Chí Minh. Xem tr. 234, Nxb. Chính trị quốc gia.
+Tài liệu do GS. Trần Văn Giàu biên soạn!
+
+"Không có gì quý hơn độc lập, tự do." Câu này do H. C. Minh viết năm 1966 v.v. và được nhắc lại nhiều lần.
+"""
+
+
+def test_sentences_respect_abbreviations():
+    sentences = [s for _, _, s in iter_sentences(TEXT)]
+    assert sentences == [
+        "Năm 1911, Người ra đi tìm đường cứu nước từ bến Nhà Rồng, TP. Hồ Chí Minh.",
+        "Xem tr. 234, Nxb. Chính trị quốc gia.",
+        "Tài liệu do GS. Trần Văn Giàu biên soạn!",
+        "\"Không có gì quý hơn độc lập, tự do.\"",
+        "Câu này do H. C. Minh viết năm 1966 v.v. và được nhắc lại nhiều lần.",
+    ]
+
+
+def test_chunks_budget_overlap_and_offsets():
+    chunks = list(chunk_text(TEXT, max_tokens=30, overlap_tokens=12))
+    assert all(chunk.tokens <= 30 for chunk in chunks)
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+
+    for chunk in chunks:
+        assert " ".join(TEXT[chunk.start:chunk.end].split()) == " ".join(chunk.text.split())
+
+    # Câu cuối của chunk trước (ngắn hơn overlap) được lặp lại ở đầu chunk sau
+    assert chunks[1].text.startswith("Xem tr. 234")
+    # Đoạn văn mới được giữ bằng dòng trống
+    assert any("biên soạn!\n\n\"Không có" in chunk.text for chunk in chunks)
+
+
+def test_stream_from_file_matches_string():
+    from_string = [(c.text, c.start, c.end) for c in chunk_text(TEXT * 50, max_tokens=40)]
+    from_stream = [(c.text, c.start, c.end) for c in chunk_text(io.StringIO(TEXT * 50), max_tokens=40)]
+    assert from_string == from_stream
+
+
+def test_long_sentence_is_split_by_words():
+    text = " ".join(["từ"] * 95) + "."
+    chunks = list(chunk_text(text, max_tokens=20, overlap_tokens=0))
+    assert [chunk.tokens for chunk in chunks] == [20, 20, 20, 20, 15]
+
+
+def test_ingest_text_upserts_chunks_with_offsets():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()))
+        service = EnhancedRAGService(vector_store=store)
+        try:
+            count = service.ingest_text(io.StringIO(TEXT), {"source": "Toàn tập, tập 1"}, max_tokens=30,
+                                        overlap_tokens=0, batch_size=2)
+            assert count == store.get_collection_count() >= 2
+            metadata = store.metadatas[0]
+            assert metadata["source"] == "Toàn tập, tập 1" and metadata["char_start"] == 0
+
+            # Ingest lại: không thêm bản trùng
+            service.ingest_text(TEXT, {"source": "Toàn tập, tập 1"}, max_tokens=30, overlap_tokens=0)
+            assert store.get_collection_count() == count
+            assert all(len(chunk) <= 60 for chunk in service.split_text(TEXT, max_length=60))
+        finally:
+            service.shutdown()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing text chunker...")
+    test_sentences_respect_abbreviations()
+    test_chunks_budget_overlap_and_offsets()
+    test_stream_from_file_matches_string()
+    test_long_sentence_is_split_by_words()
+    test_ingest_text_upserts_chunks_with_offsets()
+    print("✅ Text chunker hoạt động tốt!")
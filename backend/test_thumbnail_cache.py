@@ -0,0 +1,188 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+
+import httpx
+
+from app.services import http_client
+from app.services.image_providers import ImageProvider
+from app.services.image_search_cache import ImageSearchCache
+from app.services.image_search_service import ImageSearchService
+from app.services.thumbnail_cache import ThumbnailCache
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"hcm" * 100
+
+
+def make_host(requests=None):
+    """Host ảnh giả lập: /ok*.png trả ảnh, /slow.png chậm, /dead.png 404, /page.png là trang HTML"""
+
+    async def handler(request):
+        if requests is not None:
+            requests.append(request.url.path)
+        path = request.url.path
+        if path == "/slow.png":
+            await asyncio.sleep(0.3)
+        if path == "/dead.png":
+            return httpx.Response(404)
+        if path == "/page.png":
+            return httpx.Response(200, headers={"Content-Type": "text/html"}, text="<html>login</html>")
+        return httpx.Response(200, headers={"Content-Type": "image/png"}, content=PNG + path.encode())
+
+    return http_client.create_async_client(transport=httpx.MockTransport(handler))
+
+
+def image(name):
+    return {"url": f"https://img.example/full/{name}", "title": name, "thumbnail": f"https://img.example/{name}"}
+
+
+def test_rewrite_serves_local_thumbnails_and_drops_dead_links():
+    with tempfile.TemporaryDirectory() as tmp:
+        requests = []
+
+        async def scenario():
+            thumbnails = ThumbnailCache(tmp, public_url="http://localhost:8000/", client=make_host(requests))
+            images = [image("ok1.png"), image("dead.png"), image("page.png"), image("slow.png"), image("ok2.png")]
+            first = await thumbnails.rewrite(images, wait=0.1)
+            await asyncio.sleep(0.4)  # ảnh chậm tải xong ở nền
+            second = await thumbnails.rewrite(images, wait=0.1)
+            await thumbnails.client.aclose()
+            return thumbnails, first, second
+
+        thumbnails, first, second = asyncio.run(scenario())
+
+        # Link chết / không phải ảnh bị bỏ; ảnh chưa kịp tải giữ URL gốc
+        assert [item["title"] for item in first] == ["ok1.png", "slow.png", "ok2.png"]
+        assert first[0]["thumbnail"].startswith("http://localhost:8000/thumbnails/")
+        assert first[1]["thumbnail"] == "https://img.example/slow.png"
+        assert first[0]["url"] == "https://img.example/full/ok1.png"
+
+        # Lần sau: ảnh chậm đã có trong cache, link chết được nhớ -> không tải lại
+        assert [item["title"] for item in second] == ["ok1.png", "slow.png", "ok2.png"]
+        assert all("/thumbnails/" in item["thumbnail"] for item in second)
+        assert sorted(requests) == ["/dead.png", "/ok1.png", "/ok2.png", "/page.png", "/slow.png"]
+
+        digest = second[1]["thumbnail"].rsplit("/", 1)[1]
+        path, content_type = thumbnails.lookup(digest)
+        with open(path, "rb") as f:
+            assert f.read() == PNG + b"/slow.png"
+        assert content_type == "image/png"
+        assert thumbnails.lookup("../index.sqlite3") is None
+        assert thumbnails.get_stats()["failed"] == 2
+        thumbnails.close()
+
+
+def test_content_addressed_and_size_bounded():
+    with tempfile.TemporaryDirectory() as tmp:
+        now = [0.0]
+        thumbnails = ThumbnailCache(tmp, max_bytes=2500, clock=lambda: now[0])
+        a = thumbnails.store("https://a.example/1.jpg", b"a" * 1000, "image/jpeg")
+        assert thumbnails.store("https://mirror.example/1.jpg", b"a" * 1000, "image/jpeg") == a
+        assert thumbnails.total_bytes == 1000  # cùng nội dung -> một file
+
+        now[0] = 1
+        b = thumbnails.store("https://b.example/2.jpg", b"b" * 1000, "image/jpeg")
+        now[0] = 2
+        thumbnails.lookup(a)  # a vừa được dùng, b thành ảnh cũ nhất
+        now[0] = 3
+        c = thumbnails.store("https://c.example/3.jpg", b"c" * 1000, "image/jpeg")
+
+        assert thumbnails.total_bytes == 2000
+        assert thumbnails.lookup(b) is None and not os.path.exists(thumbnails.blob_path(b))
+        assert thumbnails.digest_for("https://b.example/2.jpg") is None
+        assert thumbnails.lookup(a) and thumbnails.lookup(c)
+        thumbnails.close()
+
+        # Mở lại: dung lượng đọc từ index trên disk
+        reopened = ThumbnailCache(tmp, max_bytes=2500)
+        assert reopened.total_bytes == 2000 and reopened.digest_for("https://mirror.example/1.jpg") == a
+        reopened.close()
+
+
+def test_network_errors_are_retried_sooner_than_dead_links():
+    with tempfile.TemporaryDirectory() as tmp:
+        now = [0.0]
+        requests = []
+        outage = [True]
+
+        async def handler(request):
+            requests.append(request.url.path)
+            if request.url.path == "/dead.png":
+                return httpx.Response(404)
+            if outage[0]:
+                if request.url.path == "/busy.png":
+                    return httpx.Response(503)
+                raise httpx.ConnectError("mất mạng", request=request)
+            return httpx.Response(200, headers={"Content-Type": "image/png"}, content=PNG + request.url.path.encode())
+
+        async def scenario():
+            client = http_client.create_async_client(transport=httpx.MockTransport(handler))
+            thumbnails = ThumbnailCache(tmp, failure_ttl=3600, error_ttl=60, client=client, clock=lambda: now[0])
+            images = [image("ok.png"), image("busy.png"), image("dead.png")]
+            first = await thumbnails.rewrite(images, wait=1)
+            outage[0] = False
+            now[0] = 30  # vẫn trong error_ttl: chưa thử lại
+            second = await thumbnails.rewrite(images, wait=1)
+            now[0] = 61  # hết error_ttl: thử lại lỗi mạng / 503, link 404 vẫn bị nhớ
+            third = await thumbnails.rewrite(images, wait=1)
+            await client.aclose()
+            thumbnails.close()
+            return first, second, third
+
+        first, second, third = asyncio.run(scenario())
+        assert first == [] and second == []
+        assert [item["title"] for item in third] == ["ok.png", "busy.png"]
+        assert sorted(requests) == ["/busy.png", "/busy.png", "/dead.png", "/ok.png", "/ok.png"]
+
+
+def test_lookup_batches_access_time_writes():
+    with tempfile.TemporaryDirectory() as tmp:
+        now = [1.0]
+        thumbnails = ThumbnailCache(tmp, clock=lambda: now[0])
+        digest = thumbnails.store("https://a.example/1.jpg", b"a" * 100, "image/jpeg")
+
+        def accessed():
+            with sqlite3.connect(os.path.join(tmp, "index.sqlite3")) as db:
+                return db.execute("SELECT accessed FROM blobs WHERE digest = ?", (digest,)).fetchone()[0]
+
+        # GET không commit ngay; thời điểm truy cập được ghi theo batch / khi đóng
+        now[0] = 5.0
+        assert thumbnails.lookup(digest)
+        assert accessed() == 1.0
+        thumbnails.close()
+        assert accessed() == 5.0
+
+
+class ThumbnailProvider(ImageProvider):
+    name = "google"
+
+    async def fetch(self, client, query, num_results):
+        return [image("ok1.png"), image("dead.png")]
+
+
+def test_image_service_rewrites_but_caches_original_urls():
+    with tempfile.TemporaryDirectory() as tmp:
+        async def scenario():
+            thumbnails = ThumbnailCache(tmp, public_url="http://api.local", client=make_host())
+            service = ImageSearchService(cache=ImageSearchCache(), providers=[ThumbnailProvider()],
+                                         thumbnails=thumbnails)
+            images = await service.asearch_images("Bác Hồ ở Pháp", 5)
+            await thumbnails.client.aclose()
+            return service, images
+
+        service, images = asyncio.run(scenario())
+        assert len(images) == 1 and images[0]["thumbnail"].startswith("http://api.local/thumbnails/")
+        cached = service.cache.get(service.cache.make_key(service._optimize_query("Bác Hồ ở Pháp"), 5))
+        assert [item["thumbnail"] for item in cached] == ["https://img.example/ok1.png", "https://img.example/dead.png"]
+        assert service.get_stats()["thumbnails"]["images"] == 1
+        service.close()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing thumbnail cache...")
+    test_rewrite_serves_local_thumbnails_and_drops_dead_links()
+    test_content_addressed_and_size_bounded()
+    test_network_errors_are_retried_sooner_than_dead_links()
+    test_lookup_batches_access_time_writes()
+    test_image_service_rewrites_but_caches_original_urls()
+    print("✅ Thumbnail cache hoạt động tốt!")
@@ -0,0 +1,178 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from app.services.ann_index import IVFIndex
+from app.services.embeddings import BatchEmbedder
+from app.services.vector_store import SimpleVectorStore
+from test_embeddings import StubEmbedder
+
+
+def open_store(storage_path, **kwargs):
+    return SimpleVectorStore(storage_path=storage_path, embedder=BatchEmbedder(StubEmbedder()), **kwargs)
+
+
+def fill(store, count=30):
+    texts = [f"Tài liệu số {i} về tư tưởng Hồ Chí Minh" for i in range(count)]
+    store.add_documents(texts, [{"topic": "test"} for _ in texts], ids=[f"d{i}" for i in range(count)])
+
+
+def test_snapshot_writes_every_file_atomically():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = open_store(storage_path, index=IVFIndex(nlist=4, min_train_size=20))
+        fill(store)
+        store.save_data()
+
+        files = sorted(os.listdir(storage_path))
+        assert not [name for name in files if name.endswith(".tmp")], files
+        assert {"bm25-1.npz", "ivf-1.npz", "embeddings-1.npy", "records-1.json", "manifest.json"} <= set(files)
+
+        # Exact index không có gì để lưu: không để lại file rỗng
+        exact = open_store(storage_path)
+        exact.save_data()
+        assert "exact-2.npz" not in os.listdir(storage_path) and exact.get_collection_count() == 30
+
+
+def test_unknown_format_is_rejected():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = open_store(storage_path)
+        fill(store)
+        store.save_data()
+        manifest_path = os.path.join(storage_path, SimpleVectorStore.MANIFEST_FILE)
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest["format"] = SimpleVectorStore.FORMAT_VERSION + 1
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        try:
+            open_store(storage_path)
+            assert False, "manifest định dạng mới hơn phải báo lỗi"
+        except ValueError:
+            pass
+
+
+def test_failed_load_raises_instead_of_compacting_half_loaded_store():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = open_store(storage_path)
+        fill(store)
+        store.save_data()
+        with open(os.path.join(storage_path, f"records-{store.generation}.json"), "w", encoding="utf-8") as f:
+            f.write("{hỏng")
+        before = sorted(os.listdir(storage_path))
+
+        try:
+            open_store(storage_path, compact_min_records=10)
+            assert False, "snapshot hỏng phải báo lỗi"
+        except ValueError:
+            pass
+        # Không có snapshot mới nào ghi đè lên dữ liệu
+        assert sorted(os.listdir(storage_path)) == before
+
+
+def test_wal_replays_upserts_and_deletes():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = open_store(storage_path)
+        fill(store, count=5)
+        store.save_data()
+        store.add_documents(["Bản sửa của tài liệu số 2", "Tài liệu mới số 5"], [{"topic": "sửa"}, {}], ids=["d2", "d5"])
+        store.delete(["d0"])
+
+        reloaded = open_store(storage_path)
+        assert reloaded.ids == ["d1", "d2", "d3", "d4", "d5"], reloaded.ids
+        assert reloaded.documents[1] == "Bản sửa của tài liệu số 2"
+        assert dict(reloaded.metadatas[1]) == {"topic": "sửa"}
+        assert np.allclose(reloaded.embeddings.array, store.embeddings.array)
+
+
+def test_torn_wal_tail_is_truncated():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = open_store(storage_path)
+        fill(store, count=5)
+        store.save_data()
+        store.add_documents(["Tài liệu mới số 5"], [{}], ids=["d5"])
+        wal_path = os.path.join(storage_path, SimpleVectorStore.WAL_FILE)
+        valid_size = os.path.getsize(wal_path)
+        with open(wal_path, "a", encoding="utf-8") as f:
+            f.write('{"i":6,"id":"d6","text":"ghi dở')
+
+        reloaded = open_store(storage_path)
+        assert reloaded.ids == ["d0", "d1", "d2", "d3", "d4", "d5"], reloaded.ids
+        assert os.path.getsize(wal_path) == valid_size
+        # Append sau đó không bị nối vào dòng hỏng
+        reloaded.add_documents(["Tài liệu mới số 6"], [{}], ids=["d6"])
+        assert open_store(storage_path).ids[-1] == "d6"
+
+
+def test_wal_of_previous_generation_is_not_replayed():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = open_store(storage_path)
+        store.add_documents([f"Tài liệu số {i}" for i in range(5)], [{} for _ in range(5)],
+                            ids=[f"a{i}" for i in range(5)])
+        store.save_data()
+        store.add_documents(["Bản sửa của tài liệu số 4"], [{}], ids=["a4"])
+        store.delete(["a0"])
+        wal_path = os.path.join(storage_path, SimpleVectorStore.WAL_FILE)
+        with open(wal_path, "rb") as f:
+            old_wal = f.read()
+
+        # Crash giữa lúc ghi manifest mới và reset WAL: WAL cũ vẫn còn trên disk
+        store.save_data()
+        with open(wal_path, "wb") as f:
+            f.write(old_wal)
+
+        reloaded = open_store(storage_path)
+        assert reloaded.ids == ["a1", "a2", "a3", "a4"], reloaded.ids
+        assert reloaded.documents[-1] == "Bản sửa của tài liệu số 4"
+        # WAL cũ đã được reset: ghi tiếp rồi load lại vẫn đúng
+        reloaded.add_documents(["Tài liệu số 5"], [{}], ids=["a5"])
+        assert open_store(storage_path).ids == ["a1", "a2", "a3", "a4", "a5"]
+
+
+def test_legacy_json_is_migrated_intact():
+    with tempfile.TemporaryDirectory() as storage_path:
+        stub = StubEmbedder()
+        texts = [f"Tài liệu cũ số {i}" for i in range(5)]
+        metadatas = [{"topic": "cũ", "credibility_score": 90 + i, "text": texts[i]} for i in range(5)]
+        vectors = [stub.vector(text) for text in texts]
+        with open(os.path.join(storage_path, SimpleVectorStore.LEGACY_FILE), "w", encoding="utf-8") as f:
+            json.dump({"documents": texts, "metadatas": metadatas, "embeddings": vectors}, f, ensure_ascii=False)
+
+        expected = np.asarray(vectors, dtype=np.float32)
+        expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+        for store in (open_store(storage_path), open_store(storage_path)):
+            assert store.ids == [f"doc_{i}" for i in range(5)]
+            assert store.documents == texts
+            # Bản sao "text" trong metadata cũ bị bỏ, các key khác giữ nguyên
+            assert [dict(metadata) for metadata in store.metadatas] == \
+                [{"topic": "cũ", "credibility_score": 90 + i} for i in range(5)]
+            assert np.allclose(store.embeddings.array, expected)
+        files = set(os.listdir(storage_path))
+        assert {SimpleVectorStore.MANIFEST_FILE, "embeddings-1.npy", "records-1.json"} <= files
+
+
+def test_reload_opens_embeddings_as_memmap():
+    with tempfile.TemporaryDirectory() as storage_path:
+        store = open_store(storage_path)
+        fill(store)
+        store.save_data()
+        assert isinstance(store.embeddings.array, np.memmap)
+
+        reloaded = open_store(storage_path)
+        assert isinstance(reloaded.embeddings.array, np.memmap)
+        assert np.allclose(reloaded.embeddings.array, store.embeddings.array)
+
+
+if __name__ == "__main__":
+    print("🧪 Testing vector store snapshot...")
+    test_snapshot_writes_every_file_atomically()
+    test_unknown_format_is_rejected()
+    test_failed_load_raises_instead_of_compacting_half_loaded_store()
+    test_wal_replays_upserts_and_deletes()
+    test_torn_wal_tail_is_truncated()
+    test_wal_of_previous_generation_is_not_replayed()
+    test_legacy_json_is_migrated_intact()
+    test_reload_opens_embeddings_as_memmap()
+    print("✅ Vector store snapshot hoạt động tốt!")
@@ -0,0 +1,122 @@
+import os
+import random
+import re
+import tempfile
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+from app.services.crawler import Crawler
+from app.services.web_data_collector import WebDataCollector, content_signals, extract_page, soup_main_text
+
+PAGE = """<html><head><title> Tư tưởng Hồ Chí Minh </title><style>p {}</style></head><body>
+<header>Trang chủ</header><nav>Menu</nav>
+<div class="post-content"><p>Chủ tịch Hồ Chí Minh đọc   Tuyên ngôn độc lập</p><!-- quảng cáo -->
+<p>ngày 2/9/1945.<script>track()</script> Nguồn: Toàn tập, tập 4.</p></div>
+<footer>Liên hệ</footer></body></html>"""
+
+FRAGMENTS = ["(1945)", "1945", "12/5/1890", "tháng 9", "năm 1969", "Toàn tập", "tập 4", "Tuyên ngôn",
+             "tuyên ngôn độc lập", "chủ tịch hồ chí minh", "Tư tưởng Hồ Chí Minh", "nguồn:", "Trích dẫn:",
+             "click here", "buy now", "roads", "Advertisement", "học tập", "dân tộc", "độc lập", "19", "tự do"]
+
+
+def legacy_signals(text):
+    """Các heuristic cũ (mỗi hàm tự compile và quét lại text)"""
+    citation = any(re.search(p, text, re.IGNORECASE) for p in
+                   [r'\(\d{4}\)', r'Toàn tập.*tập.*', r'Tuyên ngôn.*\d{4}', r'nguồn:', r'trích dẫn:'])
+    lower = text.lower()
+    official = sum(t in lower for t in ['chủ tịch hồ chí minh', 'tư tưởng hồ chí minh', 'toàn tập',
+                                        'tuyên ngôn độc lập']) >= 2
+    date = any(re.search(p, text) for p in [r'\d{1,2}[-/]\d{1,2}[-/]\d{4}', r'\d{4}', r'tháng \d{1,2}', r'năm \d{4}'])
+    spam = any(t in lower for t in ['click here', 'buy now', 'advertisement', 'ads'])
+    return {name for name, hit in [("citation", citation), ("official", official), ("date", date), ("spam", spam)]
+            if hit}
+
+
+def test_single_pass_signals_match_legacy_heuristics():
+    rng = random.Random(7)
+    for _ in range(2000):
+        text = " ".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 6)))
+        assert set(content_signals(text)) == legacy_signals(text), text
+
+
+def test_extract_page_main_content():
+    title, content = extract_page(PAGE.encode("utf-8"))
+    assert title == "Tư tưởng Hồ Chí Minh"
+    assert content == "Chủ tịch Hồ Chí Minh đọc Tuyên ngôn độc lập ngày 2/9/1945. Nguồn: Toàn tập, tập 4."
+
+    # Cùng kết quả với đường BeautifulSoup (trang không phải UTF-8 đi đường này)
+    assert soup_main_text(BeautifulSoup(PAGE, "html.parser")) == content
+    legacy = PAGE.encode("cp1258", errors="ignore")
+    assert extract_page(legacy)[1].startswith("Ch")
+    assert extract_page(b"") == ("", "")
+
+
+def test_credibility_score():
+    collector = WebDataCollector()
+    _, content = extract_page(PAGE)
+    # 95 (domain) + 10 (citation) + 5 (official) + 5 (date) - 20 (ngắn) = 95
+    assert collector.calculate_credibility_score("https://dangcongsan.vn/bai-viet", content) == 95
+    assert collector.calculate_credibility_score("https://spam.example/", "buy now " * 20) == 0
+
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b""):
+        self.status_code = status_code
+        self.content = body
+        self.headers = {"ETag": '"v1"'} if status_code in (200, 304) else {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+class FakeSite(requests.Session):
+    """Mỗi domain một trang; /missing trả 404; có ETag thì trả 304"""
+
+    def get(self, url, headers=None, **kwargs):
+        if url.endswith("/missing"):
+            return FakeResponse(404)
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        domain = urlparse(url).netloc
+        return FakeResponse(200, PAGE.replace("ngày 2/9/1945", f"tại {domain} ngày 2/9/1945").encode("utf-8"))
+
+
+def make_collector(cache_path, parse_workers):
+    collector = WebDataCollector(cache_path=cache_path, parse_workers=parse_workers)
+    collector.session = FakeSite()
+    collector.crawler = Crawler(collector.session, respect_robots=False, domain_rate=100.0)
+    return collector
+
+
+def test_process_pool_pipeline_matches_in_thread_parsing():
+    urls = [f"https://site{i}.vn/bai-{j}" for j in range(3) for i in range(4)] + ["https://site0.vn/missing"]
+    with tempfile.TemporaryDirectory() as tmp:
+        in_thread = make_collector(os.path.join(tmp, "a.sqlite3"), parse_workers=0)
+        pooled = make_collector(os.path.join(tmp, "b.sqlite3"), parse_workers=2)
+        try:
+            expected = in_thread.fetch_pages(urls)
+            results = pooled.fetch_pages(urls)
+            strip = lambda r: r and {k: v for k, v in r.items() if k != "timestamp"}
+            assert [strip(r) for r in results] == [strip(r) for r in expected]
+            assert results[-1] is None and "site3.vn" in results[3]["content"]
+            assert pooled.crawler.stats["errors"] == 1
+
+            # Lần 2: 304, không cần gửi trang sang process pool
+            again = pooled.fetch_pages(urls[:4])
+            assert all(r["not_modified"] and not r["changed"] for r in again)
+        finally:
+            in_thread.close()
+            pooled.close()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing web extraction...")
+    test_single_pass_signals_match_legacy_heuristics()
+    test_extract_page_main_content()
+    test_credibility_score()
+    test_process_pool_pipeline_matches_in_thread_parsing()
+    print("✅ Web extraction hoạt động tốt!")
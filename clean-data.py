@@ -1,47 +1,60 @@
 #!/usr/bin/env python3
 import json
 import os
+import sys
 
-def clean_data_json():
-    data_path = "/Users/techmax/Documents/hcm-chatbot/backend/simple_vector_storage/data.json"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.near_duplicate import NearDuplicateIndex, prefer_new
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "backend", "simple_vector_storage", "data.json")
+
+
+def clean_data_json(data_path=DEFAULT_DATA_PATH):
     backup_path = data_path + ".backup"
 
     print("🧹 Đang dọn dẹp file data.json...")
-    
+
     with open(data_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    print(f"📊 Trước: {len(data['documents'])} documents")
-    
+    documents = data['documents']
+    metadatas = data.get('metadatas') or [{} for _ in documents]
+    embeddings = data.get('embeddings', [])
+    print(f"📊 Trước: {len(documents)} documents")
+
     # Backup
     os.rename(data_path, backup_path)
-    
-    # Remove duplicates
-    seen = set()
-    unique_documents = []
-    unique_embeddings = []
-    
-    for i, doc in enumerate(data['documents']):
-        if doc not in seen:
-            seen.add(doc)
-            unique_documents.append(doc)
-            if i < len(data.get('embeddings', [])):
-                unique_embeddings.append(data['embeddings'][i])
-    
+
+    # Bỏ bản trùng và gần trùng, giữ bản credibility_score cao nhất (documents/metadatas/embeddings cùng dòng)
+    index = NearDuplicateIndex()
+    kept = []
+    for i, doc in enumerate(documents):
+        found = index.find(doc, lambda row: documents[kept[row]])
+        if found:
+            row = found[0]
+            if prefer_new(doc, metadatas[i], documents[kept[row]], metadatas[kept[row]]):
+                kept[row] = i
+                index.add(row, doc)
+            continue
+        index.add(len(kept), doc)
+        kept.append(i)
+
     clean_data = {
-        "documents": unique_documents,
-        "embeddings": unique_embeddings
+        "documents": [documents[i] for i in kept],
+        "metadatas": [metadatas[i] for i in kept],
+        "embeddings": [embeddings[i] for i in kept if i < len(embeddings)]
     }
-    
+
     with open(data_path, 'w', encoding='utf-8') as f:
         json.dump(clean_data, f, ensure_ascii=False, indent=2)
-    
+
     old_size = os.path.getsize(backup_path)
     new_size = os.path.getsize(data_path)
-    
-    print(f"📊 Sau: {len(unique_documents)} documents")
+
+    print(f"📊 Sau: {len(kept)} documents")
     print(f"💾 Tiết kiệm: {old_size-new_size:,} bytes ({(old_size-new_size)/old_size*100:.1f}%)")
     print(f"✅ Hoàn thành!")
 
 if __name__ == "__main__":
-    clean_data_json()
+    clean_data_json(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA_PATH)